@@ -0,0 +1,104 @@
+"""
+并发结账压测：多个线程同时调用POST /sale/，统计端到端延迟和吞吐量，并检查有没有超卖。
+
+先启动后端（uvicorn server.main:app），再运行：
+    python benchmarks/checkout_benchmark.py --workers 16 --orders 2000 --basket 5
+
+脚本会导入一批测试用图书（ISBN以979开头），每本库存--stock本，订单从中随机选书；
+默认库存略少于总需求，后面的一部分订单会因库存不足失败。结束后核对：
+成功订单卖出的数量 = 初始库存 - 剩余库存，且没有库存为负的图书。
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def login(base_url: str) -> dict:
+    requests.post(f"{base_url}/users/adminsignup")
+    response = requests.post(f"{base_url}/login", json={"username": "admin", "password": "admin"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def seed_books(base_url: str, headers: dict, count: int, stock: int) -> list:
+    isbns = [f"979{9000000000 + i:010d}" for i in range(count)]
+    body = "".join(json.dumps({"isbn": isbn, "title": f"压测图书{i}", "retail_price": 10 + i % 50,
+                               "stock": stock}) + "\n" for i, isbn in enumerate(isbns))
+    response = requests.post(f"{base_url}/books/import", params={"format": "ndjson", "on_conflict": "update"},
+                             data=body.encode("utf-8"), headers=headers)
+    response.raise_for_status()
+    return isbns
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发结账压测")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--workers", type=int, default=16, help="并发线程数")
+    parser.add_argument("--orders", type=int, default=2000, help="订单总数")
+    parser.add_argument("--basket", type=int, default=5, help="每个订单的书目数")
+    parser.add_argument("--books", type=int, default=200, help="测试图书数")
+    parser.add_argument("--stock", type=int, default=80, help="每本测试图书的初始库存")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    headers = login(base_url)
+    isbns = seed_books(base_url, headers, args.books, args.stock)
+
+    local = threading.local()
+    sold = {isbn: 0 for isbn in isbns}
+    sold_lock = threading.Lock()
+
+    def checkout(seed: int):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.headers.update(headers)
+        rng = random.Random(seed)
+        basket = [{"book_isbn": isbn, "quantity": rng.randint(1, 3)}
+                  for isbn in rng.sample(isbns, args.basket)]
+        start = time.perf_counter()
+        response = local.session.post(f"{base_url}/sale/", json=basket)
+        elapsed = time.perf_counter() - start
+        if response.status_code == 200:
+            with sold_lock:
+                for line in basket:
+                    sold[line["book_isbn"]] += line["quantity"]
+        return response.status_code, elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.workers) as pool:
+        results = list(pool.map(checkout, range(args.orders)))
+    wall = time.perf_counter() - start
+
+    latencies = [elapsed * 1000 for _, elapsed in results]
+    statuses = {}
+    for status_code, _ in results:
+        statuses[status_code] = statuses.get(status_code, 0) + 1
+    print(f"订单数 {args.orders}，并发 {args.workers}，每单 {args.basket} 种书，耗时 {wall:.2f}s，"
+          f"吞吐量 {args.orders / wall:.1f} 单/秒")
+    print(f"状态码 {statuses}")
+    print(f"延迟(ms) 平均 {statistics.mean(latencies):.1f}  p50 {percentile(latencies, 0.5):.1f}  "
+          f"p95 {percentile(latencies, 0.95):.1f}  p99 {percentile(latencies, 0.99):.1f}  "
+          f"最大 {max(latencies):.1f}")
+
+    # 核对库存
+    mismatched = []
+    for isbn in isbns:
+        stock = requests.get(f"{base_url}/books/{isbn}", headers=headers).json()["stock"]
+        if stock < 0 or stock != args.stock - sold[isbn]:
+            mismatched.append((isbn, stock, args.stock - sold[isbn]))
+    print("库存核对通过" if not mismatched else f"库存不一致（ISBN, 实际, 应为）: {mismatched[:10]}")
+
+
+if __name__ == "__main__":
+    main()
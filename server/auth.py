@@ -1,30 +1,445 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta,timezone
-from functools import wraps
+from abc import ABC, abstractmethod
+from functools import partial, wraps
+from typing import Optional
+from urllib.parse import urlparse
+import asyncio
+import base64
 import hashlib
+import hmac
+import json
+import logging
+import secrets
+import socket
+import threading
 import jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, event, select, delete, update
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from server.db_models import User,LoginedUser
-from server.database import get_db
+from server.cache import LRUCache
+from server import config
 SECRET_KEY = "The-Project-Is-Made-By-Kevin"
 ALGORITHM = "HS256"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# 已验证token -> LoginedUser快照，命中时无需解码JWT和查询会话存储
+# 注意：缓存仅在本进程内有效，注销/修改用户后需调用invalidate_*使其失效
+token_cache = LRUCache(maxsize=config.TOKEN_CACHE_SIZE, ttl=config.TOKEN_CACHE_TTL)
+
+logger = logging.getLogger(__name__)
+
+# 密码哈希（CPU密集）及登录相关的数据库操作在这个有界线程池中执行，
+# 登录高峰时最多占用AUTH_EXECUTOR_WORKERS个线程，不会阻塞事件循环
+_auth_executor = ThreadPoolExecutor(max_workers=config.AUTH_EXECUTOR_WORKERS,
+                                    thread_name_prefix="auth")
+
+async def run_in_auth_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_auth_executor, partial(func, *args))
+
+PASSWORD_HASH_ALGORITHM = "pbkdf2_sha256"
+
+# 会话中的expiration_time以不带时区的UTC时间保存
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _copy_session(session: LoginedUser, **changes) -> LoginedUser:
+    """返回与数据库会话无关的LoginedUser快照"""
+    fields = {
+        "username": session.username,
+        "employee_id": session.employee_id,
+        "isSuperAdmin": session.isSuperAdmin,
+        "token": session.token,
+        "expiration_time": session.expiration_time,
+    }
+    fields.update(changes)
+    return LoginedUser(**fields)
+
+
+class SessionStore(ABC):
+    """
+    会话存储接口：保存token -> 登录用户信息，与业务数据库相互独立。
+    每个用户同时只保留一个会话，重新登录会替换旧会话。
+    未实现全部抽象方法的存储类在实例化时即报错。
+    """
+    # 保存新会话，并删除该用户的旧会话
+    @abstractmethod
+    def save(self, session: LoginedUser) -> None:
+        ...
+
+    # 按token取得未过期的会话，不存在或已过期返回None
+    @abstractmethod
+    def get(self, token: str) -> Optional[LoginedUser]:
+        ...
+
+    @abstractmethod
+    def delete_token(self, token: str) -> None:
+        ...
+
+    @abstractmethod
+    def delete_user(self, username: str) -> None:
+        ...
+
+    # 用户信息修改后同步会话中的username/employee_id/isSuperAdmin
+    @abstractmethod
+    def update_user(self, current_username: str, **fields) -> None:
+        ...
+
+    # 分批删除过期会话，返回删除数量
+    def purge_expired(self, batch_size: int) -> int:
+        return 0
+
+
+class MemorySessionStore(SessionStore):
+    """进程内会话存储，适用于单进程部署和测试，重启后需重新登录"""
+
+    def __init__(self):
+        self._by_token = {}
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def save(self, session):
+        with self._lock:
+            old_token = self._by_user.pop(session.username, None)
+            self._by_token.pop(old_token, None)
+            self._by_token[session.token] = _copy_session(session)
+            self._by_user[session.username] = session.token
+
+    def get(self, token):
+        with self._lock:
+            session = self._by_token.get(token)
+        if session is None or session.expiration_time <= _utcnow():
+            return None
+        return _copy_session(session)
+
+    def delete_token(self, token):
+        with self._lock:
+            session = self._by_token.pop(token, None)
+            if session is not None and self._by_user.get(session.username) == token:
+                del self._by_user[session.username]
+
+    def delete_user(self, username):
+        with self._lock:
+            token = self._by_user.pop(username, None)
+            self._by_token.pop(token, None)
+
+    def update_user(self, current_username, **fields):
+        with self._lock:
+            token = self._by_user.pop(current_username, None)
+            if token is None:
+                return
+            session = _copy_session(self._by_token[token], **fields)
+            self._by_token[token] = session
+            self._by_user[session.username] = token
+
+    def purge_expired(self, batch_size):
+        now = _utcnow()
+        with self._lock:
+            expired = [token for token, session in self._by_token.items()
+                       if session.expiration_time <= now]
+            for token in expired:
+                session = self._by_token.pop(token)
+                if self._by_user.get(session.username) == token:
+                    del self._by_user[session.username]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite会话存储，默认使用独立的数据库文件，不占用业务数据库的写锁。
+    表结构沿用LoginedUser，token列带索引。
+    """
+
+    def __init__(self, url: str):
+        self.engine = create_engine(url, connect_args={"check_same_thread": False})
+        event.listen(self.engine, "connect", self._on_connect)
+        self.table = LoginedUser.__table__
+        self.table.create(self.engine, checkfirst=True)
+        for index in self.table.indexes:
+            index.create(self.engine, checkfirst=True)
+
+    @staticmethod
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    def save(self, session):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(
+                (self.table.c.username == session.username)
+                | (self.table.c.employee_id == session.employee_id)))
+            conn.execute(self.table.insert().values(
+                username=session.username,
+                employee_id=session.employee_id,
+                isSuperAdmin=session.isSuperAdmin,
+                token=session.token,
+                expiration_time=session.expiration_time))
+
+    def get(self, token):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.table).where(
+                self.table.c.token == token)).mappings().first()
+        if row is None or row["expiration_time"] <= _utcnow():
+            return None
+        return LoginedUser(**row)
+
+    def delete_token(self, token):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.token == token))
+
+    def delete_user(self, username):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.username == username))
+
+    def update_user(self, current_username, **fields):
+        with self.engine.begin() as conn:
+            conn.execute(update(self.table).where(
+                self.table.c.username == current_username).values(**fields))
+
+    def purge_expired(self, batch_size):
+        # 每批单独提交，以免长时间占用写锁
+        now = _utcnow()
+        purged = 0
+        while True:
+            with self.engine.begin() as conn:
+                usernames = conn.execute(
+                    select(self.table.c.username)
+                    .where(self.table.c.expiration_time <= now)
+                    .limit(batch_size)).scalars().all()
+                if not usernames:
+                    return purged
+                conn.execute(delete(self.table).where(self.table.c.username.in_(usernames)))
+            purged += len(usernames)
+
+
+class RedisError(Exception):
+    pass
+
+
+class _RespConnection:
+    """极简的RESP协议客户端，只实现会话存储用到的命令"""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        try:
+            self._file = self._sock.makefile("rb")
+            if self.password:
+                self._send_and_read("AUTH", self.password)
+            if self.db:
+                self._send_and_read("SELECT", self.db)
+        except BaseException:
+            # 认证或选择数据库失败时关闭连接，下次调用重新建立，不复用未初始化完成的连接
+            self._close()
+            raise
+
+    def _close(self):
+        for resource in (self._file, self._sock):
+            if resource is not None:
+                try:
+                    resource.close()
+                except OSError:
+                    pass
+        self._sock = None
+        self._file = None
+
+    def _send_and_read(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Redis连接已关闭")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode()
+        if prefix == b"-":
+            raise RedisError(body.decode())
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"无法解析的Redis响应: {line!r}")
+
+    def execute(self, *args):
+        with self._lock:
+            # 连接断开时重连一次后重试
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send_and_read(*args)
+                except (ConnectionError, OSError):
+                    self._close()
+                    if attempt:
+                        raise
+
+
+class RedisSessionStore(SessionStore):
+    """
+    基于Redis协议的会话存储，会话过期由Redis的PX过期时间负责。
+    键：{prefix}session:{token} -> 会话JSON，{prefix}user:{username} -> token
+    """
+
+    def __init__(self, url: str, prefix: str = "bookstore:"):
+        self.conn = _RespConnection(url)
+        self.prefix = prefix
+
+    def _session_key(self, token):
+        return f"{self.prefix}session:{token}"
+
+    def _user_key(self, username):
+        return f"{self.prefix}user:{username}"
+
+    @staticmethod
+    def _dumps(session):
+        return json.dumps({
+            "username": session.username,
+            "employee_id": session.employee_id,
+            "isSuperAdmin": session.isSuperAdmin,
+            "token": session.token,
+            "expiration_time": session.expiration_time.isoformat(),
+        })
+
+    @staticmethod
+    def _loads(data):
+        fields = json.loads(data)
+        fields["expiration_time"] = datetime.fromisoformat(fields["expiration_time"])
+        return LoginedUser(**fields)
+
+    @staticmethod
+    def _ttl_ms(session):
+        return max(1, int((session.expiration_time - _utcnow()).total_seconds() * 1000))
+
+    def _token_of(self, username):
+        token = self.conn.execute("GET", self._user_key(username))
+        return token.decode() if token is not None else None
+
+    def save(self, session):
+        old_token = self._token_of(session.username)
+        if old_token is not None:
+            self.conn.execute("DEL", self._session_key(old_token))
+        ttl = self._ttl_ms(session)
+        self.conn.execute("SET", self._session_key(session.token), self._dumps(session), "PX", ttl)
+        self.conn.execute("SET", self._user_key(session.username), session.token, "PX", ttl)
+
+    def get(self, token):
+        data = self.conn.execute("GET", self._session_key(token))
+        if data is None:
+            return None
+        session = self._loads(data)
+        if session.expiration_time <= _utcnow():
+            return None
+        return session
+
+    def delete_token(self, token):
+        session = self.get(token)
+        self.conn.execute("DEL", self._session_key(token))
+        if session is not None and self._token_of(session.username) == token:
+            self.conn.execute("DEL", self._user_key(session.username))
+
+    def delete_user(self, username):
+        token = self._token_of(username)
+        if token is not None:
+            self.conn.execute("DEL", self._session_key(token), self._user_key(username))
+
+    def update_user(self, current_username, **fields):
+        token = self._token_of(current_username)
+        session = self.get(token) if token is not None else None
+        if session is None:
+            return
+        session = _copy_session(session, **fields)
+        ttl = self._ttl_ms(session)
+        if session.username != current_username:
+            self.conn.execute("DEL", self._user_key(current_username))
+        self.conn.execute("SET", self._session_key(token), self._dumps(session), "PX", ttl)
+        self.conn.execute("SET", self._user_key(session.username), token, "PX", ttl)
+
+
+def create_session_store(backend: str) -> SessionStore:
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore(config.SESSION_SQLITE_URL)
+    if backend == "redis":
+        return RedisSessionStore(config.SESSION_REDIS_URL)
+    raise ValueError(f"未知的会话存储类型: {backend}")
+
+session_store = create_session_store(config.SESSION_BACKEND)
+
 class Auth:
-    # 返回密码的md5哈希值（TODO：用于创建账户时加密）
+    # 使某个token的缓存立即失效（注销时使用）
+    @staticmethod
+    def invalidate_token(token: str) -> None:
+        token_cache.pop(token)
+
+    # 使某个用户的所有token缓存立即失效（重新登录、修改或删除用户时使用）
+    @staticmethod
+    def invalidate_user(username: str) -> int:
+        return token_cache.pop_where(lambda token, user: user.username == username)
+
+    # 返回密码的PBKDF2-SHA256哈希，格式：pbkdf2_sha256$迭代次数$盐$哈希
     @staticmethod
     def get_password_hash(password: str) -> str:
-        return hashlib.md5(password.encode()).hexdigest()
+        iterations = config.PASSWORD_HASH_ITERATIONS
+        salt = secrets.token_hex(16)
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), iterations)
+        return "$".join([PASSWORD_HASH_ALGORITHM, str(iterations), salt,
+                         base64.b64encode(digest).decode()])
     
-    # 验证密码是否匹配
+    # 验证密码是否匹配，兼容旧的md5哈希
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
-        return hashlib.md5(plain_password.encode()).hexdigest() == hashed_password
+        if hashed_password.startswith(PASSWORD_HASH_ALGORITHM + "$"):
+            try:
+                _, iterations, salt, expected = hashed_password.split("$")
+                digest = hashlib.pbkdf2_hmac("sha256", plain_password.encode(),
+                                             salt.encode(), int(iterations))
+            except ValueError:
+                return False
+            return hmac.compare_digest(base64.b64encode(digest).decode(), expected)
+        return hmac.compare_digest(hashlib.md5(plain_password.encode()).hexdigest(), hashed_password)
+
+    # 旧的md5哈希或迭代次数与当前配置不同的哈希需要重新计算
+    @staticmethod
+    def needs_rehash(hashed_password: str) -> bool:
+        parts = hashed_password.split("$")
+        return not (len(parts) == 4 and parts[0] == PASSWORD_HASH_ALGORITHM
+                    and parts[1] == str(config.PASSWORD_HASH_ITERATIONS))
+
     # TODO: 识别toke适配逻辑
     @staticmethod
-    def create_access_token(db:Session, user:User) -> str:
+    def create_access_token(user:User) -> str:
         expire = datetime.now(timezone.utc) + timedelta(hours=8)
         token_data={
             "username":user.username,
@@ -32,23 +447,47 @@ class Auth:
             "expiration_time":expire.timestamp()
         }
         token=jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
-        db.query(LoginedUser).filter(LoginedUser.username==user.username).delete()
-        db.add(LoginedUser(username=user.username,
-                           employee_id=user.employee_id,
-                           isSuperAdmin=user.isSuperAdmin,
-                           token=token,
-                           expiration_time=expire))
-        db.commit()
+        session_store.save(LoginedUser(username=user.username,
+                                       employee_id=user.employee_id,
+                                       isSuperAdmin=user.isSuperAdmin,
+                                       token=token,
+                                       expiration_time=expire.replace(tzinfo=None)))
+        # 旧会话已被替换，其缓存同样失效
+        Auth.invalidate_user(user.username)
         return token
-    # 根据token，获得当前用户名称、身份、权限(LoginedUser表)
+
+    # 注销：删除token对应的会话
+    @staticmethod
+    def end_session(token: str) -> None:
+        session_store.delete_token(token)
+        Auth.invalidate_token(token)
+
+    # 删除用户后结束其会话
     @staticmethod
-    def get_current_user(token: str = Depends(oauth2_scheme), 
-                         db: Session = Depends(get_db))->LoginedUser:
+    def end_user_sessions(username: str) -> None:
+        session_store.delete_user(username)
+        Auth.invalidate_user(username)
+
+    # 用户信息修改后同步其会话（username本身也可能被修改）
+    @staticmethod
+    def refresh_user_sessions(username: str, user: User) -> None:
+        session_store.update_user(username,
+                                  username=user.username,
+                                  employee_id=user.employee_id,
+                                  isSuperAdmin=user.isSuperAdmin)
+        Auth.invalidate_user(username)
+
+    # 根据token，获得当前用户名称、身份、权限(会话存储)
+    @staticmethod
+    def get_current_user(token: str = Depends(oauth2_scheme))->LoginedUser:
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="无法验证凭据或登录过期",
             headers={"WWW-Authenticate": "Bearer"},
         )
+        cached_user = token_cache.get(token)
+        if cached_user is not None:
+            return cached_user
         # with open(r"D:\Projects\DataBase\debug.txt","a") as f:
         #     # f.write(f"username:{username}\n")
         #     f.write(f"token:{token}\n")
@@ -67,21 +506,30 @@ class Auth:
         except jwt.PyJWTError as e:
             raise credentials_exception
         
-        # 每次进行操作前删除过期的token
-        db.query(LoginedUser).filter(datetime.now(timezone.utc)>LoginedUser.expiration_time).delete()
-        logined_user = db.query(LoginedUser).filter(
-            LoginedUser.token==token).first()
+        # 过期会话由后台任务session_reaper定期清理，会话存储只返回未过期的会话
+        logined_user = session_store.get(token)
         if logined_user is None:
             # with open(r"D:\Projects\DataBase\debug.txt","a") as f:
             #     f.write(f"There is None\n")
             #     f.flush()
             raise credentials_exception
+        # 缓存时间不超过会话本身的剩余有效期
+        remaining = (logined_user.expiration_time - _utcnow()).total_seconds()
+        token_cache.set(token, logined_user, ttl=max(0.0, min(config.TOKEN_CACHE_TTL, remaining)))
         return logined_user
 
-   
+    # 异步版本，各接口统一使用：令牌缓存命中时直接在事件循环中返回，不经过线程池，
+    # async接口（开启异步数据库时的热点查询）整个请求都不占用线程池；未命中时在线程池中校验
+    @staticmethod
+    async def get_current_user_async(token: str = Depends(oauth2_scheme)) -> LoginedUser:
+        cached_user = token_cache.get(token)
+        if cached_user is not None:
+            return cached_user
+        return await run_in_threadpool(Auth.get_current_user, token)
+
     @staticmethod
-    def admin_required(
-        logined_user: LoginedUser = Depends(get_current_user),
+    async def admin_required(
+        logined_user: LoginedUser = Depends(get_current_user_async),
     ):
         try:
             if not logined_user.isSuperAdmin:
@@ -95,4 +543,18 @@ class Auth:
             #     f.write(f"{str(e)}\n")
             #     f.flush()
             raise e
-        
\ No newline at end of file
+
+
+def _purge_expired_sessions() -> int:
+    return session_store.purge_expired(config.SESSION_REAPER_BATCH_SIZE)
+
+# 后台会话清理任务，由server/main.py在启动时创建
+async def session_reaper(interval: float = config.SESSION_REAPER_INTERVAL) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            purged = await run_in_threadpool(_purge_expired_sessions)
+            if purged:
+                logger.info("已清理%d个过期会话", purged)
+        except Exception:
+            logger.exception("清理过期会话失败")
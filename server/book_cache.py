@@ -0,0 +1,62 @@
+"""
+ISBN -> 图书的进程内缓存，供GET /books/{isbn}（扫码查询）使用。
+
+启动时预热，之后由change_tracking在每次图书变更提交后更新已缓存的条目
+（图书、进货、销售等所有路由对books表的写入都会经过change_tracking）。
+未命中时按主键读库后放入缓存，不存在的ISBN同样缓存为None；条目数超过
+BOOK_CACHE_SIZE时按LRU淘汰。
+change_tracking只能看到本进程的提交。默认按单进程部署，条目不过期；多个worker进程部署时
+需要设置BOOK_CACHE_TTL，限制其他进程写入后读到旧值的时间。
+"""
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from server import change_tracking, config
+from server.cache import LRUCache
+from server.database import SessionLocal
+from server.db_models import Book
+from server.schemas.book_schemas import BookResponse
+
+MISS = object()
+
+book_cache = LRUCache(config.BOOK_CACHE_SIZE, ttl=config.BOOK_CACHE_TTL or None)
+
+
+def _response(snapshot: Optional[dict]) -> Optional[BookResponse]:
+    return BookResponse(**snapshot) if snapshot is not None else None
+
+
+def get(isbn: str):
+    """缓存中的图书；已确认不存在时为None，未缓存时为MISS"""
+    return book_cache.get(isbn, MISS)
+
+
+def load(db: Session, isbn: str) -> Optional[BookResponse]:
+    """从数据库读取图书并放入缓存"""
+    table = Book.__table__
+    version = change_tracking.table_version(table.name)
+    row = db.execute(select(table).where(table.c.isbn == isbn)).first()
+    book = _response(change_tracking.book_snapshot(row) if row is not None else None)
+    # 读库期间有图书变更提交时不写缓存，避免旧值覆盖提交回调写入的新值
+    if change_tracking.table_version(table.name) == version:
+        book_cache.set(isbn, book)
+    return book
+
+
+def warm() -> int:
+    """启动时预先加载图书，返回加载数量"""
+    table = Book.__table__
+    with SessionLocal() as db:
+        rows = db.execute(select(table).limit(config.BOOK_CACHE_SIZE))
+        count = 0
+        for row in rows:
+            book_cache.set(row.isbn, _response(change_tracking.book_snapshot(row)))
+            count += 1
+    return count
+
+
+@change_tracking.on_books_committed
+def _on_books_committed(changes: change_tracking.BookChanges) -> None:
+    # 只更新已缓存的条目，批量导入等大量写入不会把常用的图书挤出缓存
+    for isbn, snapshot in changes.items():
+        book_cache.replace(isbn, _response(snapshot))
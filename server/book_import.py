@@ -0,0 +1,301 @@
+"""
+图书批量导入。
+
+请求体按CSV（首行为列名）或NDJSON（每行一个JSON对象）流式读取，不把整个文件读入内存；
+每凑满BOOK_IMPORT_BATCH_SIZE行，用BookBase校验后在一个事务中用executemany批量写入。
+校验失败或ISBN冲突的行记入错误列表，不影响其他行；各批次分别提交，
+中途出错时已提交的批次不会回滚。
+"""
+import codecs
+import csv
+import json
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from server import change_tracking, config
+from server.database import SessionLocal
+from server.db_models import Book
+from server.schemas.book_schemas import BookBase
+
+FIELDS = tuple(BookBase.model_fields)
+_REQUIRED_COLUMNS = ("isbn", "title")
+_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+# SQLite单条语句的参数个数有限制，IN查询分批进行
+_IN_BATCH_SIZE = 500
+# CSV解析时每次从请求体读入的行数
+_FEED_LINES = 1000
+# 检查ISBN与写入之间被其他请求抢先插入时，重新检查并写入的次数
+_MAX_RETRIES = 3
+
+Row = Union[dict, str]  # 解析出的一行数据，解析失败时为错误信息
+
+
+def detect_format(content_type: Optional[str]) -> str:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type not in _CONTENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无法识别导入格式，请指定format=csv或format=ndjson"
+        )
+    return _CONTENT_TYPES[media_type]
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """字节流 -> 逐行文本（保留行尾换行符），兼容带BOM的UTF-8"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    try:
+        async for chunk in chunks:
+            buffer += decoder.decode(chunk)
+            lines = buffer.split("\n")
+            buffer = lines.pop()
+            for line in lines:
+                yield line + "\n"
+        buffer += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="导入文件必须为UTF-8编码"
+        )
+    if buffer:
+        yield buffer
+
+
+class _NeedMore(Exception):
+    """_LineFeed中已读到的行用完，需要继续读取请求体"""
+
+
+class _LineFeed:
+    """
+    csv.reader的输入。请求体是异步读取的，而csv.reader只能同步迭代：
+    已读到的行用完时抛出_NeedMore，调用方读取更多行后从当前记录的第一行重新解析。
+    """
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.position = 0
+        self.finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if self.position < len(self.lines):
+            self.position += 1
+            return self.lines[self.position - 1]
+        if self.finished:
+            raise StopIteration
+        raise _NeedMore
+
+    def done(self) -> None:
+        """当前记录已解析完，丢弃它的行"""
+        del self.lines[:self.position]
+        self.position = 0
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Union[List[str], str]]:
+    """
+    用同一个csv.reader逐条解析记录，字段内的换行、未加引号字段中的引号（如12" Vinyl）由csv模块处理。
+    格式错误的记录（例如未闭合的引号使字段超过长度限制）解析为错误信息，之后的记录继续解析。
+    """
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    lines = lines.__aiter__()
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except _NeedMore:
+            # 每次多读入一些行，跨越多行的记录不会逐行重复解析
+            feed.position = 0
+            try:
+                for _ in range(_FEED_LINES):
+                    feed.lines.append(await lines.__anext__())
+            except StopAsyncIteration:
+                feed.finished = True
+            continue
+        except csv.Error as e:
+            feed.done()
+            yield f"CSV格式错误: {e}"
+            continue
+        feed.done()
+        if any(field.strip() for field in record):
+            yield record
+
+
+async def _read_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Row]:
+    records = _csv_records(_lines(chunks))
+    header = None
+    async for record in records:
+        if header is None:
+            if isinstance(record, str):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=record)
+            header = [name.strip().lower() for name in record]
+            missing = [name for name in _REQUIRED_COLUMNS if name not in header]
+            if missing:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"CSV缺少必需的列: {', '.join(missing)}"
+                )
+            continue
+        if isinstance(record, str):
+            yield record
+            continue
+        if len(record) > len(header):
+            yield "列数多于表头"
+            continue
+        # 空字段视为未填写，由BookBase使用默认值
+        yield {name: value.strip() for name, value in zip(header, record)
+               if name in FIELDS and value.strip() != ""}
+
+
+async def _read_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Row]:
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield "JSON格式错误"
+            continue
+        if not isinstance(data, dict):
+            yield "每行必须是一个JSON对象"
+            continue
+        yield {name: value for name, value in data.items() if name in FIELDS}
+
+
+def existing_isbns(db, isbns: List[str]) -> set:
+    """isbns中已存在于books表的ISBN"""
+    existing = set()
+    for start in range(0, len(isbns), _IN_BATCH_SIZE):
+        batch = isbns[start:start + _IN_BATCH_SIZE]
+        existing.update(db.scalars(select(Book.isbn).where(Book.isbn.in_(batch))))
+    return existing
+
+
+def describe_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+    )
+
+
+class BookImporter:
+    """逐批校验并写入图书，累计导入结果"""
+
+    def __init__(self, on_conflict: str):
+        self.on_conflict = on_conflict
+        self.total_rows = 0
+        self.imported = 0
+        self.updated = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors: List[dict] = []
+
+    def add_error(self, row: int, isbn: Optional[str], message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < config.BOOK_IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "isbn": isbn, "error": message})
+
+    def _validate(self, rows: List[Tuple[int, dict]]) -> Dict[str, Tuple[int, dict]]:
+        books: Dict[str, Tuple[int, dict]] = {}
+        for row, data in rows:
+            try:
+                book = BookBase(**data).model_dump()
+            except ValidationError as e:
+                self.add_error(row, data.get("isbn"), describe_error(e))
+                continue
+            if book["isbn"] in books:
+                if self.on_conflict == "error":
+                    self.add_error(row, book["isbn"], "ISBN在导入数据中重复")
+                    continue
+                if self.on_conflict == "skip":
+                    self.skipped += 1
+                    continue
+            # update模式下同一ISBN以最后一行为准
+            books[book["isbn"]] = (row, book)
+        return books
+
+    def write_batch(self, rows: List[Tuple[int, dict]]) -> None:
+        books = self._validate(rows)
+        for attempt in range(_MAX_RETRIES):
+            if not books:
+                return
+            with SessionLocal() as db:
+                existing = existing_isbns(db, list(books))
+                if self.on_conflict == "update":
+                    stmt = insert(Book.__table__)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[Book.isbn],
+                        set_={name: stmt.excluded[name] for name in FIELDS if name != "isbn"}
+                    )
+                    values = [book for _, book in books.values()]
+                else:
+                    stmt = insert(Book.__table__)
+                    values = [book for isbn, (_, book) in books.items() if isbn not in existing]
+                try:
+                    if values:
+                        db.execute(stmt, values)
+                        change_tracking.record_books_changed(db, {book["isbn"]: book for book in values})
+                    db.commit()
+                except IntegrityError:
+                    # 检查之后其他请求插入了同一ISBN，回滚后重新检查
+                    db.rollback()
+                    if attempt == _MAX_RETRIES - 1:
+                        raise
+                    continue
+
+            if self.on_conflict == "update":
+                self.updated += len(existing)
+                self.imported += len(values) - len(existing)
+            else:
+                self.imported += len(values)
+                for isbn in existing:
+                    if self.on_conflict == "skip":
+                        self.skipped += 1
+                    else:
+                        self.add_error(books[isbn][0], isbn, "ISBN已存在")
+            return
+
+    def result(self) -> dict:
+        return {
+            "total_rows": self.total_rows,
+            "imported": self.imported,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "error_count": self.error_count,
+            # 同一批中校验错误先于ISBN冲突记录，按行号排列
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+        }
+
+
+async def import_books(chunks: AsyncIterator[bytes], fmt: str, on_conflict: str) -> dict:
+    """
+    流式导入图书。解析在事件循环中边读边做，校验和写库放到线程池中按批执行。
+    行号row为数据行的序号（从1开始，CSV不含表头）。
+    """
+    importer = BookImporter(on_conflict)
+    rows = _read_csv(chunks) if fmt == "csv" else _read_ndjson(chunks)
+    batch: List[Tuple[int, dict]] = []
+    async for data in rows:
+        importer.total_rows += 1
+        if isinstance(data, str):
+            importer.add_error(importer.total_rows, None, data)
+            continue
+        batch.append((importer.total_rows, data))
+        if len(batch) >= config.BOOK_IMPORT_BATCH_SIZE:
+            await run_in_threadpool(importer.write_batch, batch)
+            batch = []
+    if batch:
+        await run_in_threadpool(importer.write_batch, batch)
+    return importer.result()
@@ -0,0 +1,247 @@
+"""
+图书数据变更跟踪。
+
+全文索引、缓存等派生数据需要在图书增删改时同步更新。ORM方式的修改
+（session.add/delete、修改属性后flush）会被自动捕获；用update()/insert()等
+批量语句直接修改books表时ORM无法感知，需要调用mark_books_changed。
+
+两类监听函数：
+- on_books_flushed：在同一事务内执行，参数为(connection, changes)，用于维护数据库内的派生表；
+- on_books_committed：事务提交后执行，参数为changes，用于维护进程内的缓存。
+
+changes为 {isbn: 图书当前各列的值(dict)，已删除则为None}。
+注册时可以用columns指定关心的列，只收到这些列有变化的图书（新增、删除的图书总会收到），
+例如全文索引不需要处理只修改了库存、价格的图书。ORM修改按属性历史判断哪些列变化；
+批量语句由调用方通过columns参数说明修改了哪些列，不指定时视为所有列都可能变化。
+
+另外维护进程内的版本号，供缓存、ETag判断数据是否变化：
+- 表版本号：ORM写入或通过session执行的insert/update/delete语句提交后加一；
+- 行版本号：ORM写入的行（图书以changes为准）记为提交序号，只保留最近
+  ROW_VERSION_TRACK_SIZE行。对其他表执行批量语句，或行记录被淘汰时，抬高整张表的
+  版本下限，该表所有行的版本号都随之变化。
+用text()执行的原生SQL不会被统计。
+"""
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import event, inspect, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from server import config
+from server.db_models import Book
+
+logger = logging.getLogger(__name__)
+
+BookChanges = Dict[str, Optional[dict]]
+# {isbn: 变化的列名}，None表示整行（新增、删除或不确定修改了哪些列）
+ChangedColumns = Dict[str, Optional[FrozenSet[str]]]
+
+_PENDING_KEY = "changed_books"
+_PENDING_COLUMNS_KEY = "changed_book_columns"
+_TABLES_KEY = "changed_tables"
+_ROWS_KEY = "changed_rows"
+_BULK_KEY = "bulk_changed_tables"
+_flush_listeners: List[Tuple[Callable[[Connection, BookChanges], None], Optional[FrozenSet[str]]]] = []
+_commit_listeners: List[Tuple[Callable[[BookChanges], None], Optional[FrozenSet[str]]]] = []
+
+_table_versions: Dict[str, int] = defaultdict(int)
+_commit_seq = 0
+_row_versions: "OrderedDict[Tuple[str, Any], int]" = OrderedDict()
+_table_floors: Dict[str, int] = defaultdict(int)
+_versions_lock = threading.Lock()
+
+# SQLite单条语句的参数个数有限制，IN查询分批进行
+_IN_BATCH_SIZE = 500
+
+
+def _register(listeners: list, fn: Optional[Callable], columns: Optional[Iterable[str]]):
+    if fn is None:
+        return lambda fn: _register(listeners, fn, columns)
+    listeners.append((fn, frozenset(columns) if columns is not None else None))
+    return fn
+
+
+def on_books_flushed(fn: Optional[Callable[[Connection, BookChanges], None]] = None, *,
+                     columns: Optional[Iterable[str]] = None):
+    """注册事务内的监听函数；可以用@on_books_flushed或@on_books_flushed(columns=...)"""
+    return _register(_flush_listeners, fn, columns)
+
+
+def on_books_committed(fn: Optional[Callable[[BookChanges], None]] = None, *,
+                       columns: Optional[Iterable[str]] = None):
+    """注册提交后的监听函数，用法同on_books_flushed"""
+    return _register(_commit_listeners, fn, columns)
+
+
+def _select(changes: BookChanges, changed: ChangedColumns,
+            columns: Optional[FrozenSet[str]]) -> BookChanges:
+    """只保留columns中有列变化的图书"""
+    if columns is None:
+        return changes
+    return {isbn: book for isbn, book in changes.items()
+            if changed.get(isbn) is None or changed[isbn] & columns}
+
+
+def table_version(name: str) -> int:
+    """表的当前版本号，该表每有一次写入事务提交就加一"""
+    return _table_versions[name]
+
+
+def commit_sequence() -> int:
+    """有写入的事务的提交序号，两次读取之间没有变化说明期间没有任何写入提交"""
+    return _commit_seq
+
+
+def row_version(table: str, pk: Any) -> int:
+    """一行数据的版本号，该行（或整张表的批量修改）提交后变化"""
+    with _versions_lock:
+        return max(_row_versions.get((table, pk), 0), _table_floors[table])
+
+
+def _mark(session: Session, key: str, values: Iterable) -> None:
+    values = set(values)
+    if values:
+        session.info.setdefault(key, set()).update(values)
+
+
+def _mark_tables(session: Session, names: Set[str]) -> None:
+    _mark(session, _TABLES_KEY, names)
+
+
+def book_snapshot(book) -> dict:
+    """图书ORM对象或查询结果行 -> 各列值组成的dict"""
+    return {column.name: getattr(book, column.name) for column in Book.__table__.columns}
+
+
+def _columns_of(changes: BookChanges, columns: Optional[Iterable[str]]) -> ChangedColumns:
+    columns = frozenset(columns) if columns is not None else None
+    return {isbn: columns if book is not None else None for isbn, book in changes.items()}
+
+
+def _record(session: Session, changes: BookChanges, changed: ChangedColumns) -> None:
+    if not changes:
+        return
+    connection = session.connection()
+    for fn, columns in _flush_listeners:
+        selected = _select(changes, changed, columns)
+        if selected:
+            fn(connection, selected)
+    session.info.setdefault(_PENDING_KEY, {}).update(changes)
+    # 同一事务中多次修改同一本书时，合并各次变化的列
+    pending = session.info.setdefault(_PENDING_COLUMNS_KEY, {})
+    for isbn, columns in changed.items():
+        if isbn not in pending:
+            pending[isbn] = columns
+        elif pending[isbn] is not None:
+            pending[isbn] = None if columns is None else pending[isbn] | columns
+    _mark(session, _ROWS_KEY, ((Book.__tablename__, isbn) for isbn in changes))
+
+
+def record_books_changed(session: Session, changes: BookChanges,
+                         columns: Optional[Iterable[str]] = None) -> None:
+    """
+    用批量语句写入books表、且已知写入后各列的值时调用，省去mark_books_changed的回查。
+    columns为语句修改的列，不指定时视为所有列都可能变化。
+    """
+    _record(session, changes, _columns_of(changes, columns))
+
+
+def mark_books_changed(session: Session, isbns: Iterable[str],
+                       columns: Optional[Iterable[str]] = None) -> None:
+    """用批量语句修改books表后调用，重新读取这些图书的当前值并通知监听函数；columns同上"""
+    isbns = list(dict.fromkeys(isbns))
+    changes: BookChanges = dict.fromkeys(isbns)
+    table = Book.__table__
+    for start in range(0, len(isbns), _IN_BATCH_SIZE):
+        batch = isbns[start:start + _IN_BATCH_SIZE]
+        for row in session.execute(select(table).where(table.c.isbn.in_(batch))):
+            changes[row.isbn] = book_snapshot(row)
+    _record(session, changes, _columns_of(changes, columns))
+
+
+def _row_key(obj) -> Tuple[str, Any]:
+    # after_flush时新对象还没有identity，直接读取主键列的值
+    pk = inspect(obj).mapper.primary_key_from_instance(obj)
+    return obj.__tablename__, pk[0] if len(pk) == 1 else tuple(pk)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        name = orm_execute_state.statement.table.name
+        _mark_tables(orm_execute_state.session, {name})
+        # 批量修改books表时按约定调用mark_books_changed，行版本号以changes为准
+        if name != Book.__tablename__:
+            _mark(orm_execute_state.session, _BULK_KEY, {name})
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    written = list(session.new) + list(session.deleted)
+    written.extend(obj for obj in session.dirty if session.is_modified(obj, include_collections=False))
+    _mark_tables(session, {obj.__tablename__ for obj in written})
+    _mark(session, _ROWS_KEY, (_row_key(obj) for obj in written))
+
+    changes: BookChanges = {}
+    changed: ChangedColumns = {}
+    for obj in session.new:
+        if isinstance(obj, Book):
+            changes[obj.isbn] = book_snapshot(obj)
+            changed[obj.isbn] = None
+    for obj in session.dirty:
+        if isinstance(obj, Book) and session.is_modified(obj, include_collections=False):
+            changes[obj.isbn] = book_snapshot(obj)
+            # after_flush时属性历史尚未清除
+            attrs = inspect(obj).attrs
+            changed[obj.isbn] = frozenset(column.name for column in Book.__table__.columns
+                                          if attrs[column.name].history.has_changes())
+    for obj in session.deleted:
+        if isinstance(obj, Book):
+            changes[obj.isbn] = None
+            changed[obj.isbn] = None
+    _record(session, changes, changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    global _commit_seq
+    tables = session.info.pop(_TABLES_KEY, None)
+    rows = session.info.pop(_ROWS_KEY, ())
+    bulk_tables = session.info.pop(_BULK_KEY, ())
+    if tables:
+        with _versions_lock:
+            _commit_seq += 1
+            for name in tables:
+                _table_versions[name] += 1
+            for name in bulk_tables:
+                _table_floors[name] = _commit_seq
+            for key in rows:
+                _row_versions[key] = _commit_seq
+                _row_versions.move_to_end(key)
+            while len(_row_versions) > config.ROW_VERSION_TRACK_SIZE:
+                (name, _), version = _row_versions.popitem(last=False)
+                _table_floors[name] = max(_table_floors[name], version)
+
+    changes = session.info.pop(_PENDING_KEY, None)
+    changed = session.info.pop(_PENDING_COLUMNS_KEY, {})
+    if not changes:
+        return
+    for fn, columns in _commit_listeners:
+        selected = _select(changes, changed, columns)
+        if not selected:
+            continue
+        try:
+            fn(selected)
+        except Exception:
+            # 数据已经提交，派生缓存更新失败不应影响请求结果
+            logger.exception("图书变更通知处理失败: %s", fn)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_TABLES_KEY, None)
+    session.info.pop(_ROWS_KEY, None)
+    session.info.pop(_BULK_KEY, None)
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_PENDING_COLUMNS_KEY, None)
@@ -0,0 +1,262 @@
+"""
+销售结账：扣减库存、写入销售订单和账单。
+
+place_order在调用方的事务中完成一个订单，不提交。两种提交方式：
+- 直接结账（默认）：每个请求一个事务；
+- 结账队列（BOOKSTORE_CHECKOUT_QUEUE=1）：后台线程把同时到达的请求合并成批，
+  一批订单在同一个事务中依次写入，只提交一次。SQLite的写锁和提交时的刷盘由整批分摊，
+  高峰期每秒能完成的订单数随批大小增长。每个请求仍然有自己的交易流水号和结果，
+  某个订单库存不足只拒绝该订单，它已扣减的库存当场加回，不影响同批的其他订单。
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import case, insert, select
+from sqlalchemy.orm import Session
+from server import change_tracking, config, db_models
+from server.database import SessionLocal
+from server.schemas.sale_order_schemas import SaleItemCreate
+
+logger = logging.getLogger(__name__)
+
+
+def _checkout_error(db: Session, items: List[SaleItemCreate], quantities: Dict[str, int],
+                    updated) -> HTTPException:
+    """扣减库存失败时，按订单中的顺序找出第一本出错的书"""
+    table = db_models.Book.__table__
+    failed = [isbn for isbn in quantities if isbn not in updated]
+    books = {row.isbn: row for row in db.execute(
+        select(table.c.isbn, table.c.title, table.c.stock, table.c.retail_price).where(table.c.isbn.in_(failed)))}
+    for isbn in dict.fromkeys(item.book_isbn for item in items):
+        if isbn in updated:
+            continue
+        book = books.get(isbn)
+        if book is None:
+            return HTTPException(status_code=404, detail=f"ISBN为{isbn}的书籍不存在")
+        if book.stock is None or book.stock < quantities[isbn]:
+            return HTTPException(
+                status_code=400,
+                detail=f"书籍《{book.title}》库存不足，当前库存: {book.stock}"
+            )
+        return HTTPException(
+            status_code=400,
+            detail=f"书籍《{book.title}》未设置零售价"
+        )
+
+
+def place_order(db: Session, items: List[SaleItemCreate], payment_method: Optional[str],
+                operator_id: str, transaction_no: str) -> dict:
+    """
+    在当前事务中扣减库存并写入销售订单、账单，返回结账结果（不提交）。
+    库存不足等情况抛出HTTPException，抛出前已扣减的库存会加回，事务可以继续使用。
+    """
+    # 同一ISBN出现多行时合计数量
+    quantities: Dict[str, int] = {}
+    for item in items:
+        quantities[item.book_isbn] = quantities.get(item.book_isbn, 0) + item.quantity
+    if not quantities:
+        raise HTTPException(status_code=400, detail="订单中没有书籍")
+
+    # 一条UPDATE按条件扣减全部库存：库存不足或未设置零售价的书不会被修改。
+    # 检查和扣减在同一条语句中完成，并发的销售不会超卖
+    table = db_models.Book.__table__
+    quantity = case(quantities, value=table.c.isbn)
+    stmt = (table.update()
+            .where(table.c.isbn.in_(list(quantities)),
+                   table.c.stock >= quantity,
+                   table.c.retail_price.isnot(None))
+            .values(stock=table.c.stock - quantity)
+            .returning(*table.c))
+    books = {row.isbn: row for row in db.execute(stmt)}
+    if len(books) < len(quantities):
+        error = _checkout_error(db, items, quantities, books)
+        if books:
+            # 加回已扣减的库存
+            restore = case({isbn: quantities[isbn] for isbn in books}, value=table.c.isbn)
+            db.execute(table.update().where(table.c.isbn.in_(list(books)))
+                       .values(stock=table.c.stock + restore))
+        raise error
+    change_tracking.record_books_changed(
+        db, {isbn: change_tracking.book_snapshot(row) for isbn, row in books.items()}, columns=("stock",))
+
+    # 计算总金额
+    total_amount = 0
+    sale_items = []
+    for item in items:
+        book = books[item.book_isbn]
+        # 计算单项金额
+        item_amount = book.retail_price * item.quantity
+        total_amount += item_amount
+
+        # 销售项
+        sale_items.append({
+            "book_isbn": item.book_isbn,
+            "quantity": item.quantity,
+            "sold_price": book.retail_price,## 没有命名为零售价，可能会有折扣（暂未实现）
+            "total_amount": item_amount,
+        })
+
+    # 创建销售订单
+    sale_order = db_models.SaleOrder(
+        transaction_no=transaction_no,
+        total_amount=total_amount,
+        payment_method=payment_method,
+        operator_id=operator_id,
+    )
+    db.add(sale_order)
+    db.flush()
+    # 销售项用一条INSERT批量写入（executemany）。通过关系添加时ORM需要取回每行的主键，会逐行插入
+    for sale_item in sale_items:
+        sale_item["order_id"] = sale_order.id
+    db.execute(insert(db_models.SaleItem), sale_items)
+    # 创建账单（添加当前时间）
+    db.add(db_models.Bill(
+        bill_type="零售",
+        amount=sale_order.total_amount,
+        related_order=sale_order.id,
+        operator_id=operator_id,
+        transaction_time=datetime.now()
+    ))
+    return {
+        "message": "销售成功",
+        "order_id": sale_order.id,
+        "transaction_no": sale_order.transaction_no,
+        "total_amount": sale_order.total_amount
+    }
+
+
+def checkout_now(items: List[SaleItemCreate], payment_method: Optional[str],
+                 operator_id: str, transaction_no: str) -> dict:
+    """直接结账：单独一个事务"""
+    with SessionLocal() as db:
+        try:
+            result = place_order(db, items, payment_method, operator_id, transaction_no)
+            db.commit()
+        except HTTPException:
+            db.rollback()
+            raise
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=500,
+                detail=f"销售失败: {str(e)}"
+            )
+    return result
+
+
+class _Request:
+    __slots__ = ("args", "future")
+
+    def __init__(self, args: tuple):
+        self.args = args
+        self.future: Future = Future()
+
+
+class CheckoutQueue:
+    """把并发的结账请求合并成批，由一个后台线程依次写入"""
+
+    def __init__(self, batch_size: int, batch_wait: float):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.orders = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="checkout-queue", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """处理完已提交的请求后停止后台线程"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    async def submit(self, items: List[SaleItemCreate], payment_method: Optional[str],
+                     operator_id: str, transaction_no: str) -> dict:
+        self.start()
+        request = _Request((items, payment_method, operator_id, transaction_no))
+        self._queue.put(request)
+        return await asyncio.wrap_future(request.future)
+
+    def _next_batch(self) -> Optional[List[_Request]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            try:
+                # 上一批提交期间到达的请求直接取走，之后最多再等batch_wait
+                request = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.exception("结账批次处理失败")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(HTTPException(status_code=500, detail=f"销售失败: {str(e)}"))
+
+    def _write_batch(self, batch: List[_Request]) -> None:
+        results = []
+        with SessionLocal() as db:
+            try:
+                for request in batch:
+                    try:
+                        results.append(place_order(db, *request.args))
+                    except HTTPException as e:
+                        results.append(e)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                if len(batch) == 1:
+                    logger.exception("结账失败")
+                    batch[0].future.set_exception(HTTPException(status_code=500, detail=f"销售失败: {str(e)}"))
+                    return
+                # 某个订单写入出错（例如流水号冲突）时整批回滚，逐个订单重新结账，互不影响
+                for request in batch:
+                    self._write_batch([request])
+                return
+        self.batches += 1
+        self.orders += len(batch)
+        for request, result in zip(batch, results):
+            if isinstance(result, HTTPException):
+                request.future.set_exception(result)
+            else:
+                request.future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "orders": self.orders,
+            "average_batch_size": self.orders / self.batches if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+        }
+
+
+checkout_queue = CheckoutQueue(config.CHECKOUT_BATCH_SIZE, config.CHECKOUT_BATCH_WAIT_MS / 1000)
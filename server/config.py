@@ -0,0 +1,121 @@
+## 后端运行参数，均可通过环境变量覆盖，未设置时使用默认值
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"环境变量{name}必须为整数，当前值: {value}")
+
+
+# 登录令牌缓存：最多缓存的令牌数、单条缓存的最长存活秒数
+TOKEN_CACHE_SIZE = _env_int("BOOKSTORE_TOKEN_CACHE_SIZE", 1024)
+TOKEN_CACHE_TTL = _env_int("BOOKSTORE_TOKEN_CACHE_TTL", 60)
+
+# 列表总数缓存：最多缓存的查询条件组合数、estimated模式下旧总数的最长使用秒数
+# （exact模式下的总数最多使用SEARCH_CACHE_TTL秒，见server/pagination.py）
+COUNT_CACHE_SIZE = _env_int("BOOKSTORE_COUNT_CACHE_SIZE", 2048)
+COUNT_CACHE_TTL = _env_int("BOOKSTORE_COUNT_CACHE_TTL", 300)
+
+# ISBN查询缓存：最多缓存的图书数（启动时预热同样数量），每本约占1KB内存
+BOOK_CACHE_SIZE = _env_int("BOOKSTORE_BOOK_CACHE_SIZE", 50000)
+# 缓存条目的最长存活秒数，0（默认）表示不过期。缓存只随本进程提交的图书变更更新，
+# 适用于单进程部署（run.bat即以单进程启动uvicorn），预热的条目一直有效，扫码不读库。
+# 多个worker进程部署时需要设置（例如5），其他进程修改的价格、库存最多在这么长时间后可见，
+# 代价是条目过期后重新读库，启动预热只在最初的这段时间内有效
+BOOK_CACHE_TTL = _env_int("BOOKSTORE_BOOK_CACHE_TTL", 0)
+
+# 图书查询结果缓存：最多缓存的查询条件组合（含排序、页码）数
+SEARCH_CACHE_SIZE = _env_int("BOOKSTORE_SEARCH_CACHE_SIZE", 512)
+# 缓存结果的最长存活秒数。缓存按本进程记录的图书表版本号失效，多个worker进程部署时，
+# 其他进程的修改最多在这么长时间后可见；0表示不过期，仅适用于单进程部署
+SEARCH_CACHE_TTL = _env_int("BOOKSTORE_SEARCH_CACHE_TTL", 5)
+
+# ETag的最长有效秒数。ETag由本进程记录的版本号计算，多个worker进程部署时，
+# 其他进程的修改最多在这么长时间后不再返回304；0表示一直有效，仅适用于单进程部署
+ETAG_TTL = _env_int("BOOKSTORE_ETAG_TTL", 5)
+
+# 行版本号（ETag等使用）：最多记录的最近修改行数
+ROW_VERSION_TRACK_SIZE = _env_int("BOOKSTORE_ROW_VERSION_TRACK_SIZE", 200000)
+
+# 图书批量导入/修改：每个事务写入的行数（导入）、响应中最多列出的错误行数
+BOOK_IMPORT_BATCH_SIZE = _env_int("BOOKSTORE_BOOK_IMPORT_BATCH_SIZE", 5000)
+BOOK_IMPORT_MAX_ERRORS = _env_int("BOOKSTORE_BOOK_IMPORT_MAX_ERRORS", 1000)
+
+# 过期会话清理：执行间隔(秒)、每批删除的会话数
+SESSION_REAPER_INTERVAL = _env_int("BOOKSTORE_SESSION_REAPER_INTERVAL", 300)
+SESSION_REAPER_BATCH_SIZE = _env_int("BOOKSTORE_SESSION_REAPER_BATCH_SIZE", 500)
+
+# 会话存储：memory / sqlite / redis
+SESSION_BACKEND = os.getenv("BOOKSTORE_SESSION_BACKEND", "sqlite")
+SESSION_SQLITE_URL = os.getenv("BOOKSTORE_SESSION_SQLITE_URL", "sqlite:///sessions.db")
+SESSION_REDIS_URL = os.getenv("BOOKSTORE_SESSION_REDIS_URL", "redis://localhost:6379/0")
+
+# 密码哈希：PBKDF2迭代次数（越大越安全也越耗CPU），认证线程池大小
+PASSWORD_HASH_ITERATIONS = _env_int("BOOKSTORE_PASSWORD_HASH_ITERATIONS", 260000)
+AUTH_EXECUTOR_WORKERS = _env_int("BOOKSTORE_AUTH_EXECUTOR_WORKERS", 4)
+
+# 业务数据库
+DATABASE_URL = os.getenv("BOOKSTORE_DATABASE_URL", "sqlite:///bookstore.db")
+
+# 异步数据库：开启后热点查询接口通过aiosqlite执行，不再受线程池大小限制
+ASYNC_DB_ENABLED = os.getenv("BOOKSTORE_ASYNC_DB", "0") == "1"
+ASYNC_DATABASE_URL = os.getenv("BOOKSTORE_ASYNC_DATABASE_URL",
+                               DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+
+# 连接池
+DB_POOL_SIZE = _env_int("BOOKSTORE_DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = _env_int("BOOKSTORE_DB_MAX_OVERFLOW", 20)
+DB_POOL_TIMEOUT = _env_int("BOOKSTORE_DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = _env_int("BOOKSTORE_DB_POOL_RECYCLE", -1)
+
+# SQLite连接参数预设，每个连接建立时执行对应的PRAGMA
+# performance：WAL日志，读写互不阻塞，提交时不做完整fsync（断电最多丢失最近的提交，不会损坏数据库）
+# durable：回滚日志+每次提交完整fsync
+# none：不设置任何PRAGMA，使用SQLite默认值
+SQLITE_PROFILES = {
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -65536,  # 负数表示KiB，即64MB
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    "none": {},
+}
+SQLITE_PROFILE = os.getenv("BOOKSTORE_SQLITE_PROFILE", "performance")
+if SQLITE_PROFILE not in SQLITE_PROFILES:
+    raise ValueError(f"未知的SQLite配置预设: {SQLITE_PROFILE}")
+# 单项PRAGMA可以用BOOKSTORE_SQLITE_<名称>覆盖，例如BOOKSTORE_SQLITE_CACHE_SIZE=-131072
+SQLITE_PRAGMAS = dict(SQLITE_PROFILES[SQLITE_PROFILE])
+for _name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size", "temp_store"):
+    _value = os.getenv(f"BOOKSTORE_SQLITE_{_name.upper()}")
+    if _value:
+        SQLITE_PRAGMAS[_name] = _value
+
+# 结账队列：开启后并发的销售请求由后台线程合并成批，每批在一个事务中写入、只提交一次
+# 每批最多的订单数；第一个请求到达后，等待更多请求的最长毫秒数
+CHECKOUT_QUEUE_ENABLED = os.getenv("BOOKSTORE_CHECKOUT_QUEUE", "0") == "1"
+CHECKOUT_BATCH_SIZE = _env_int("BOOKSTORE_CHECKOUT_BATCH_SIZE", 64)
+CHECKOUT_BATCH_WAIT_MS = _env_int("BOOKSTORE_CHECKOUT_BATCH_WAIT_MS", 2)
+
+# 幂等键：保存结果的秒数（期间用同一个键重试会直接返回保存的结果），过期键的清理间隔(秒)和每批删除数
+IDEMPOTENCY_KEY_TTL = _env_int("BOOKSTORE_IDEMPOTENCY_KEY_TTL", 86400)
+# 处理中的键的租期(秒)：进程退出或保存结果失败时，过了租期就可以用同一个键重新执行，
+# 应长于接口的最长处理时间
+IDEMPOTENCY_PENDING_TTL = _env_int("BOOKSTORE_IDEMPOTENCY_PENDING_TTL", 60)
+IDEMPOTENCY_REAPER_INTERVAL = _env_int("BOOKSTORE_IDEMPOTENCY_REAPER_INTERVAL", 600)
+IDEMPOTENCY_REAPER_BATCH_SIZE = _env_int("BOOKSTORE_IDEMPOTENCY_REAPER_BATCH_SIZE", 1000)
+
+# 交易流水号：每个进程一次从数据库领取的序号数，用完再领（进程退出时未用完的序号作废）
+TRANSACTION_NO_BLOCK_SIZE = _env_int("BOOKSTORE_TRANSACTION_NO_BLOCK_SIZE", 1000)
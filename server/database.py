@@ -1,14 +1,68 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from fastapi.concurrency import run_in_threadpool
+from server import config
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///bookstore.db"
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+
+def _pool_options(url: str) -> dict:
+    # 内存数据库使用单连接池，不支持连接池大小参数
+    if ":memory:" in url or url.rstrip("/").endswith(":"):
+        return {}
+    return {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+    }
+
+# 每个新连接建立时应用SQLite性能参数
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in config.SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+    **_pool_options(SQLALCHEMY_DATABASE_URL)
 )
+event.listen(engine, "connect", _apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 可选的异步数据库引擎（需要安装aiosqlite），通过BOOKSTORE_ASYNC_DB=1开启
+async_engine = None
+AsyncSessionLocal = None
+if config.ASYNC_DB_ENABLED:
+    async_engine = create_async_engine(config.ASYNC_DATABASE_URL,
+                                       **_pool_options(config.ASYNC_DATABASE_URL))
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# 当前生效的数据库配置与连接池状态，供诊断接口使用
+def get_engine_diagnostics() -> dict:
+    with engine.connect() as conn:
+        actual = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                  for name in ("journal_mode", "synchronous", "busy_timeout",
+                               "cache_size", "mmap_size", "temp_store")}
+    pool = engine.pool
+    return {
+        "database_url": SQLALCHEMY_DATABASE_URL,
+        "sqlite_profile": config.SQLITE_PROFILE,
+        "configured_pragmas": config.SQLITE_PRAGMAS,
+        "active_pragmas": actual,
+        "pool": {
+            "class": type(pool).__name__,
+            "status": pool.status(),
+            **_pool_options(SQLALCHEMY_DATABASE_URL),
+        },
+        "async_enabled": config.ASYNC_DB_ENABLED,
+        "async_database_url": config.ASYNC_DATABASE_URL if config.ASYNC_DB_ENABLED else None,
+    }
+
 Base = declarative_base()
 
 def get_db():
@@ -18,3 +72,30 @@ def get_db():
     finally:
         db.close()
 
+
+class ReadSession:
+    """
+    只读查询的统一入口，查询函数接收同步Session：
+    开启异步数据库时通过AsyncSession.run_sync执行（IO不占用线程池），
+    否则在线程池中用同步Session执行（与普通def接口相同）。
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        if isinstance(self.session, AsyncSession):
+            return await self.session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+
+async def get_read_db():
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield ReadSession(db)
+    else:
+        db = SessionLocal()
+        try:
+            yield ReadSession(db)
+        finally:
+            db.close()
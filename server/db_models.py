@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey,Numeric,CheckConstraint,Enum,Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey,Numeric,CheckConstraint,Enum,Boolean,Index,Text
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 from sqlalchemy.orm import relationship
@@ -13,7 +13,7 @@ class User(Base):
     gender = Column(Enum('male', 'female'), nullable=False)
     age = Column(Integer)
     isSuperAdmin = Column(Boolean, nullable=False)  # 角色类型
-    password_hash = Column(String(128), nullable=False)  # MD5加密后的密码
+    password_hash = Column(String(128), nullable=False)  # PBKDF2密码哈希（兼容旧的MD5哈希）
 
 
 class LoginedUser(Base):
@@ -21,7 +21,7 @@ class LoginedUser(Base):
     username = Column(String(50), primary_key=True, nullable=False)
     employee_id = Column(String(20),unique=True,nullable=False)
     isSuperAdmin = Column(Boolean, nullable=False)
-    token = Column(String(256), nullable=False)
+    token = Column(String(256), nullable=False, index=True)
     expiration_time = Column(DateTime, nullable=False)
 
 class Book(Base):
@@ -53,12 +53,12 @@ class PurchaseOrder(Base):
     __tablename__ = 'purchase_orders'
     
     id = Column(Integer, primary_key=True,autoincrement=True)
-    book_isbn = Column(String(13), ForeignKey('books.isbn', onupdate="CASCADE"), nullable=False)
+    book_isbn = Column(String(13), ForeignKey('books.isbn', onupdate="CASCADE"), nullable=False, index=True)
     purchase_price = Column(Numeric(10,2), CheckConstraint("purchase_price > 0"))  # 进货价格
     quantity = Column(Integer, CheckConstraint("quantity > 0"), nullable=False) # 数量
     total_amount = Column(Numeric(10,2), CheckConstraint("total_amount > 0")) # 总价
-    order_date = Column(DateTime, default=datetime.now)
-    payment_status = Column(Enum("未付款","已付款","已退货","已到货"), default='未付款')
+    order_date = Column(DateTime, default=datetime.now, index=True)
+    payment_status = Column(Enum("未付款","已付款","已退货","已到货"), default='未付款', index=True)
     operator_id = Column(String(20), ForeignKey('users.employee_id'),nullable=False)
     operator_id2 = Column(String(20),ForeignKey('users.employee_id'),nullable=True) #付款操作员/退货操作员
     operator_id3= Column(String(20),ForeignKey('users.employee_id'),nullable=True) #到货操作员
@@ -71,6 +71,8 @@ class PurchaseOrder(Base):
             "(operator_id3 IS NULL AND payment_status != '已到货') OR "
             "(operator_id3 IS NOT NULL AND payment_status == '已到货')"
         ),
+        # 按付款状态筛选并按日期排序/筛选
+        Index("ix_purchase_orders_status_date", "payment_status", "order_date"),
     )
 
 # 销售订单表（记录实际销售信息）
@@ -82,8 +84,9 @@ class SaleOrder(Base):
     total_amount = Column(Numeric(10,2), CheckConstraint("total_amount > 0"))
     payment_method = Column(Enum("现金","银行卡","移动支付"),nullable=True)
     sold_items = relationship("SaleItem", back_populates="order")
-    operator_id = Column(String(20), ForeignKey('users.employee_id'),nullable=True)# 操作员
-    created_at = Column(DateTime, default=datetime.now)  # 添加创建时间字段
+    operator_id = Column(String(20), ForeignKey('users.employee_id'),nullable=True, index=True)# 操作员
+    created_at = Column(DateTime, default=datetime.now, index=True)  # 添加创建时间字段
+    operator = relationship("User", viewonly=True)  # 只用于查询操作员姓名
     
     
 # 销售明细表（记录价格快照）
@@ -91,12 +94,13 @@ class SaleItem(Base):
     __tablename__ = 'sale_items'
     
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey('sale_orders.id', ondelete="CASCADE"))
-    book_isbn = Column(String(13), ForeignKey('books.isbn', onupdate="CASCADE"))
+    order_id = Column(Integer, ForeignKey('sale_orders.id', ondelete="CASCADE"), index=True)
+    book_isbn = Column(String(13), ForeignKey('books.isbn', onupdate="CASCADE"), index=True)
     quantity = Column(Integer, CheckConstraint("quantity > 0"))
     sold_price = Column(Numeric(10,2), CheckConstraint("sold_price > 0"))  # 销售时价格
     total_amount = Column(Numeric(10,2), CheckConstraint("total_amount > 0"))  # 这一个项目的总价
     order = relationship("SaleOrder", back_populates="sold_items")
+    book = relationship("Book", viewonly=True)  # 只用于查询书名
 
 class Bill(Base):
     __tablename__ = 'bills'
@@ -104,8 +108,8 @@ class Bill(Base):
     id = Column(Integer, primary_key=True,autoincrement=True)
     bill_type = Column(Enum("进货","零售"), nullable=False)  # 资金流向
     amount = Column(Numeric(10,2), CheckConstraint("amount > 0"))
-    transaction_time = Column(DateTime, default=datetime.now())
-    related_order = Column(Integer)  # 通用订单ID
+    transaction_time = Column(DateTime, default=datetime.now(), index=True)
+    related_order = Column(Integer, index=True)  # 通用订单ID
     operator_id = Column(String(20), ForeignKey('users.employee_id'),nullable=True)
     # 付款操作员，对应其他表的operator_id2
     __table_args__ = (
@@ -114,4 +118,33 @@ class Bill(Base):
             "(bill_type IS NOT NULL AND related_order IS NOT NULL)",
             name='order_relation_check'
         ),
+        # 按账单类型筛选并按交易时间排序
+        Index("ix_bills_type_time", "bill_type", "transaction_time"),
     )
+
+# 已执行的数据库迁移版本（见server/migrations.py）
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migrations'
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, default=datetime.now, nullable=False)
+
+# 写接口的幂等键（见server/idempotency.py），每个操作员的键各自独立
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+
+    operator_id = Column(String(20), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)  # 接口与请求参数的摘要，同一个键不能用于不同的请求
+    status_code = Column(Integer, nullable=True)  # 为空表示请求仍在处理
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+# 号段分配的计数器（见server/sequence.py），next_value为下一个未分配的值
+class Sequence(Base):
+    __tablename__ = 'sequences'
+
+    name = Column(String(50), primary_key=True)
+    next_value = Column(Integer, nullable=False)
@@ -0,0 +1,113 @@
+"""
+图书分面统计（出版社、作者、价格区间、库存区间）。
+
+book_facet_counts表保存全部图书按各分面取值的数量，由books表上的SQLite触发器增量维护，
+任何写入方式（ORM、批量语句、其他进程）都会同步更新。没有筛选条件时直接读取该表；
+有筛选条件时只对命中的图书分组计数。
+"""
+from typing import Dict, List, Optional
+from sqlalchemy import Column, Integer, MetaData, Table, Text, func, literal_column, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+FACET_TABLE = "book_facet_counts"
+
+facet_counts = Table(
+    FACET_TABLE, MetaData(),
+    Column("facet", Text, primary_key=True),
+    Column("value", Text, primary_key=True),
+    Column("count", Integer, nullable=False),
+)
+
+# 区间：(上界(不含), 名称)，上界为None表示不封顶
+PRICE_BANDS = ((20, "0-20"), (50, "20-50"), (100, "50-100"), (200, "100-200"), (None, "200+"))
+STOCK_BANDS = ((1, "0"), (11, "1-10"), (51, "11-50"), (101, "51-100"), (None, "100+"))
+NO_PRICE = "无定价"
+
+
+def _band_sql(column: str, bands, null_label: Optional[str]) -> str:
+    parts = []
+    if null_label is not None:
+        parts.append(f"WHEN {column} IS NULL THEN '{null_label}'")
+    for upper, label in bands:
+        parts.append(f"ELSE '{label}'" if upper is None else f"WHEN {column} < {upper} THEN '{label}'")
+    return "CASE " + " ".join(parts) + " END"
+
+
+# 分面名称 -> (依赖的列, 取值的SQL表达式)，表达式中的{row}替换为表名或NEW/OLD
+_FACETS = {
+    "publisher": ("publisher", "COALESCE({row}.publisher, '')"),
+    "author": ("author", "COALESCE({row}.author, '')"),
+    "price_band": ("retail_price", _band_sql("{row}.retail_price", PRICE_BANDS, NO_PRICE)),
+    "stock_band": ("stock", _band_sql("COALESCE({row}.stock, 0)", STOCK_BANDS, None)),
+}
+_BAND_ORDER = {
+    "price_band": [NO_PRICE] + [label for _, label in PRICE_BANDS],
+    "stock_band": [label for _, label in STOCK_BANDS],
+}
+
+
+def _expr(facet: str, row: str) -> str:
+    return _FACETS[facet][1].format(row=row)
+
+
+def create_index(conn: Connection) -> None:
+    """创建统计表和维护它的触发器"""
+    facet_counts.create(conn, checkfirst=True)
+    conn.exec_driver_sql(
+        f"CREATE INDEX IF NOT EXISTS ix_{FACET_TABLE}_facet_count ON {FACET_TABLE} (facet, count)")
+    for facet, (column, _) in _FACETS.items():
+        increment = (f"INSERT INTO {FACET_TABLE} (facet, value, count) VALUES ('{facet}', {_expr(facet, 'NEW')}, 1) "
+                     "ON CONFLICT (facet, value) DO UPDATE SET count = count + 1;")
+        decrement = (f"UPDATE {FACET_TABLE} SET count = count - 1 "
+                     f"WHERE facet = '{facet}' AND value = {_expr(facet, 'OLD')};")
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {FACET_TABLE}_{facet}_insert AFTER INSERT ON books "
+            f"BEGIN {increment} END")
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {FACET_TABLE}_{facet}_delete AFTER DELETE ON books "
+            f"BEGIN {decrement} END")
+        # 只有取值真正变化时才更新，例如库存变化但没有跨区间时不做任何事
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {FACET_TABLE}_{facet}_update AFTER UPDATE OF {column} ON books "
+            f"WHEN {_expr(facet, 'OLD')} IS NOT {_expr(facet, 'NEW')} "
+            f"BEGIN {decrement} {increment} END")
+
+
+def rebuild_index(conn: Connection) -> None:
+    """按books表全量重新统计"""
+    conn.execute(facet_counts.delete())
+    for facet in _FACETS:
+        conn.exec_driver_sql(
+            f"INSERT INTO {FACET_TABLE} (facet, value, count) "
+            f"SELECT '{facet}', {_expr(facet, 'books')}, count(*) FROM books GROUP BY 2")
+
+
+def _result(facet: str, counts: Dict[str, int], limit: int) -> List[dict]:
+    if facet in _BAND_ORDER:
+        values = [value for value in _BAND_ORDER[facet] if counts.get(value)]
+    else:
+        values = sorted(counts, key=lambda value: (-counts[value], value))[:limit]
+    # 出版社/作者为空的图书以None表示
+    return [{"value": value or None, "count": counts[value]} for value in values]
+
+
+def compute(db: Session, filtered_query=None, limit: int = 20) -> Dict[str, List[dict]]:
+    """
+    各分面的取值和图书数。filtered_query为带筛选条件的图书查询，为None时统计全部图书。
+    出版社和作者只返回数量最多的limit个取值。
+    """
+    result = {}
+    matched = None if filtered_query is None else filtered_query.order_by(None).subquery("matched")
+    for facet in _FACETS:
+        if filtered_query is None:
+            stmt = (select(facet_counts.c.value, facet_counts.c.count)
+                    .where(facet_counts.c.facet == facet, facet_counts.c.count > 0))
+            if facet not in _BAND_ORDER:
+                stmt = stmt.order_by(facet_counts.c.count.desc(), facet_counts.c.value).limit(limit)
+            rows = db.execute(stmt)
+        else:
+            value = literal_column(_expr(facet, "matched"))
+            rows = db.execute(select(value, func.count()).select_from(matched).group_by(value))
+        result[facet] = _result(facet, dict(rows.all()), limit)
+    return result
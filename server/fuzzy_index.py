@@ -0,0 +1,136 @@
+"""
+图书模糊检索（n-gram索引），容忍书名、作者中的错别字。
+
+books_ngram以ISBN的整数值作为rowid，把书名、作者、ISBN切成n-gram后以空格隔开存入FTS5表：
+字母数字按词取三元组（trigram），不足三个字符的词整体作为一个gram；中日文取单字和相邻两字，
+因为中文词短，三元组中只要有一个错字就几乎没有能匹配的gram。
+
+检索时先取候选：包含查询全部gram的图书（FTS5求交集，找到足够数量即停止），
+以及命中gram最多的图书（每个gram最多读取有限行，总读取量有上限，不用bm25排序）；
+再逐本计算相似度重新排序，丢弃相似度低于阈值的图书。耗时与图书总数基本无关。
+只修改库存、价格等其他列时不需要更新索引。
+"""
+import re
+from typing import List, Optional
+from sqlalchemy import Column, Integer, MetaData, Table, Text, bindparam, select, text
+from sqlalchemy.engine import Connection
+from server import change_tracking
+from server.db_models import Book
+from server.search_index import CJK_CHARS
+
+NGRAM_TABLE = "books_ngram"
+
+books_ngram = Table(
+    NGRAM_TABLE, MetaData(),
+    Column("rowid", Integer, primary_key=True),
+    Column("title", Text),
+    Column("author", Text),
+    Column("isbn", Text),
+)
+
+# 写入索引的列，只有这些列变化时才同步
+INDEXED_COLUMNS = ("isbn", "title", "author")
+
+# 每种方式取出的候选数，以及按命中gram数取候选时总共最多读取的索引行数
+CANDIDATE_LIMIT = 200
+POSTINGS_BUDGET = 12000
+# 查询的gram至少有这个比例出现在书名/作者/ISBN中才算匹配
+MIN_SIMILARITY = 0.3
+
+_CJK_RE = re.compile(f"[{CJK_CHARS}]")
+_TOKEN_RE = re.compile(f"[{CJK_CHARS}]+|[^\\W_{CJK_CHARS}]+")
+
+
+def grams(value: Optional[str]) -> set:
+    """文本 -> n-gram集合（小写）"""
+    result = set()
+    for token in _TOKEN_RE.findall((value or "").lower()):
+        if _CJK_RE.match(token):
+            # 单字和相邻两字：三个字的人名中间错一个字时，仍有首尾两个单字可以匹配
+            result.update(token)
+            result.update(token[i:i + 2] for i in range(len(token) - 1))
+        elif len(token) <= 3:
+            result.add(token)
+        else:
+            # 三元组加上词首、词尾两个字母，相邻字母颠倒（pyhton）时仍有gram可以匹配
+            result.update(token[i:i + 3] for i in range(len(token) - 2))
+            result.update((token[:2], token[-2:]))
+    return result
+
+
+def create_index(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {NGRAM_TABLE} "
+        "USING fts5(title, author, isbn, tokenize='unicode61')"
+    )
+
+
+def _row(book: dict) -> dict:
+    return {
+        "rowid": int(book["isbn"]),
+        "title": " ".join(grams(book["title"])),
+        "author": " ".join(grams(book["author"])),
+        "isbn": " ".join(grams(book["isbn"])),
+    }
+
+
+def rebuild_index(conn: Connection, batch_size: int = 5000) -> None:
+    """按books表全量重建n-gram索引"""
+    conn.execute(books_ngram.delete())
+    table = Book.__table__
+    result = conn.execution_options(yield_per=batch_size).execute(
+        select(table.c.isbn, table.c.title, table.c.author))
+    for rows in result.partitions():
+        conn.execute(books_ngram.insert(), [_row(row._mapping) for row in rows])
+
+
+@change_tracking.on_books_flushed(columns=INDEXED_COLUMNS)
+def sync_index(conn: Connection, changes: change_tracking.BookChanges) -> None:
+    """在同一事务内同步books_ngram"""
+    conn.execute(books_ngram.delete().where(books_ngram.c.rowid == bindparam("id")),
+                 [{"id": int(isbn)} for isbn in changes])
+    rows = [_row(book) for book in changes.values() if book is not None]
+    if rows:
+        conn.execute(books_ngram.insert(), rows)
+
+
+def similarity(query_grams: set, title: set, others: set) -> tuple:
+    """
+    (查询的gram在书名/作者/ISBN中出现的比例, 与书名的Jaccard相似度)，
+    后者用于区分同样包含查询词的长短书名。
+    """
+    return (len(query_grams & (title | others)) / len(query_grams),
+            len(query_grams & title) / len(query_grams | title))
+
+
+def search(conn: Connection, keywords: str) -> List[str]:
+    """模糊检索，返回按相似度从高到低排列的ISBN（最多CANDIDATE_LIMIT个）"""
+    query_grams = sorted(grams(keywords))
+    if not query_grams:
+        return []
+    terms = [f'"{term}"' for term in query_grams]
+    # 包含全部gram的图书（没有错字），找到足够数量即停止
+    exact = text(
+        f"SELECT rowid FROM {NGRAM_TABLE} WHERE {NGRAM_TABLE} MATCH :match LIMIT :limit")
+    rowids = set(conn.execute(exact, {"match": " ".join(terms), "limit": CANDIDATE_LIMIT}).scalars())
+    # 常见的gram只读取一部分，候选可能不全，但读取量有上界
+    per_term = max(POSTINGS_BUDGET // len(terms), CANDIDATE_LIMIT)
+    postings = " UNION ALL ".join(
+        f"SELECT * FROM (SELECT rowid FROM {NGRAM_TABLE} WHERE {NGRAM_TABLE} MATCH :t{i} LIMIT :per_term)"
+        for i in range(len(terms)))
+    most_hits = text(f"SELECT rowid FROM ({postings}) GROUP BY rowid ORDER BY count(*) DESC LIMIT :limit")
+    params = {f"t{i}": term for i, term in enumerate(terms)}
+    rowids.update(conn.execute(most_hits, {**params, "per_term": per_term, "limit": CANDIDATE_LIMIT}).scalars())
+    if not rowids:
+        return []
+
+    # 直接用索引中保存的gram计算相似度
+    query_grams = set(query_grams)
+    scored = []
+    for row in conn.execute(select(books_ngram).where(books_ngram.c.rowid.in_(rowids))):
+        score = similarity(query_grams, set(row.title.split()),
+                           set(row.author.split()) | set(row.isbn.split()))
+        if score[0] >= MIN_SIMILARITY:
+            scored.append((score, row.rowid))
+    scored.sort(key=lambda item: (-item[0][0], -item[0][1], item[1]))
+    return [f"{rowid:013d}" for _, rowid in scored[:CANDIDATE_LIMIT]]
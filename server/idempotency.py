@@ -0,0 +1,177 @@
+"""
+写接口的幂等键（Idempotency-Key请求头）。
+
+客户端超时后重试销售、进货等请求时带上与第一次相同的Idempotency-Key，服务端不会重复执行，
+而是返回第一次请求保存下来的结果（响应头Idempotent-Replayed: true）。
+键按操作员区分，保存在idempotency_keys表中，过期的记录由后台任务分批删除。
+
+执行流程：
+1. 插入一条“处理中”的记录占用该键，租期IDEMPOTENCY_PENDING_TTL秒（主键冲突即说明该键已被使用，
+   已过期的记录直接覆盖）；
+2. 执行请求，成功后把响应写入该记录，有效期延长为IDEMPOTENCY_KEY_TTL秒；
+3. 请求失败（库存不足、订单状态不符等）时删除记录，失败的请求没有修改任何数据，可以用同一个键重试。
+同一个键的请求仍在处理时返回409；同一个键用于参数不同的请求时返回422。
+若进程在请求成功后、保存响应前退出（或保存失败），租期内的重试返回409，租期过后的重试会重新执行。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional, Type
+from fastapi import HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from server import config
+from server.database import SessionLocal
+from server.db_models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+_table = IdempotencyKey.__table__
+
+
+def request_hash(endpoint: str, payload: Any) -> str:
+    """接口与请求参数的摘要"""
+    data = json.dumps([endpoint, jsonable_encoder(payload)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _check_key(key: str) -> None:
+    if not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"幂等键长度必须在1到{MAX_KEY_LENGTH}个字符之间")
+
+
+def _claim(db: Session, operator_id: str, key: str, digest: str) -> Optional[dict]:
+    """占用幂等键；该键已有保存的结果时返回该结果"""
+    now = datetime.now()
+    values = {"request_hash": digest, "status_code": None, "response_body": None,
+              "created_at": now, "expires_at": now + timedelta(seconds=config.IDEMPOTENCY_PENDING_TTL)}
+    stmt = (insert(_table).values(operator_id=operator_id, key=key, **values)
+            .on_conflict_do_update(index_elements=[_table.c.operator_id, _table.c.key],
+                                   set_=values, where=_table.c.expires_at <= now))
+    claimed = db.execute(stmt).rowcount == 1
+    row = None if claimed else db.execute(
+        select(_table.c.request_hash, _table.c.status_code, _table.c.response_body)
+        .where(_table.c.operator_id == operator_id, _table.c.key == key)).first()
+    db.commit()
+    if row is None:
+        return None
+    if row.request_hash != digest:
+        raise HTTPException(status_code=422, detail="该幂等键已用于其他请求")
+    if row.status_code is None:
+        raise HTTPException(status_code=409, detail="相同幂等键的请求正在处理，请稍后重试")
+    return json.loads(row.response_body)
+
+
+def _complete(db: Session, operator_id: str, key: str, body: dict) -> None:
+    db.execute(_table.update()
+               .where(_table.c.operator_id == operator_id, _table.c.key == key)
+               .values(status_code=200, response_body=json.dumps(body, ensure_ascii=False),
+                       expires_at=datetime.now() + timedelta(seconds=config.IDEMPOTENCY_KEY_TTL)))
+    db.commit()
+
+
+def _release(db: Session, operator_id: str, key: str) -> None:
+    db.execute(_table.delete().where(_table.c.operator_id == operator_id, _table.c.key == key,
+                                     _table.c.status_code.is_(None)))
+    db.commit()
+
+
+def _in_session(fn: Callable, *args):
+    with SessionLocal() as db:
+        return fn(db, *args)
+
+
+def _dump(response_model: Type[BaseModel], result: Any) -> dict:
+    return response_model.model_validate(result, from_attributes=True).model_dump(mode="json")
+
+
+def execute(db: Session, response: Response, key: Optional[str], operator_id: str, endpoint: str,
+            payload: Any, response_model: Type[BaseModel], handler: Callable[[], Any]) -> Any:
+    """
+    同步接口：带幂等键时最多执行一次handler，返回其结果或保存的结果。
+    幂等键的读写使用接口自己的会话db，handler出错时先回滚db中未提交的修改。
+    """
+    if key is None:
+        return handler()
+    _check_key(key)
+    stored = _claim(db, operator_id, key, request_hash(endpoint, payload))
+    if stored is not None:
+        response.headers[REPLAYED_HEADER] = "true"
+        return stored
+    try:
+        body = _dump(response_model, handler())
+    except Exception:
+        db.rollback()
+        _release(db, operator_id, key)
+        raise
+    try:
+        _complete(db, operator_id, key, body)
+    except Exception:
+        # 请求本身已成功，记录保持“处理中”直到租期结束，期间的重试不会重复执行
+        db.rollback()
+        logger.exception("保存幂等键结果失败")
+    return body
+
+
+async def execute_async(response: Response, key: Optional[str], operator_id: str, endpoint: str,
+                        payload: Any, response_model: Type[BaseModel],
+                        handler: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    异步接口版本，幂等键的读写在线程池中使用单独的会话。
+    handler出错时释放键（出错的请求已回滚），可以用同一个键重试；
+    请求被取消（CancelledError）时订单可能仍会在线程池或结账队列中完成，记录保持“处理中”直到租期结束。
+    """
+    if key is None:
+        return await handler()
+    _check_key(key)
+    stored = await run_in_threadpool(_in_session, _claim, operator_id, key, request_hash(endpoint, payload))
+    if stored is not None:
+        response.headers[REPLAYED_HEADER] = "true"
+        return stored
+    try:
+        body = _dump(response_model, await handler())
+    except Exception:
+        await run_in_threadpool(_in_session, _release, operator_id, key)
+        raise
+    try:
+        await run_in_threadpool(_in_session, _complete, operator_id, key, body)
+    except Exception:
+        logger.exception("保存幂等键结果失败")
+    return body
+
+
+def purge_expired(batch_size: int) -> int:
+    """分批删除过期的幂等键，每批单独提交"""
+    rowid = literal_column("rowid")
+    purged = 0
+    while True:
+        with SessionLocal() as db:
+            expired = (select(rowid).select_from(_table)
+                       .where(_table.c.expires_at <= datetime.now()).limit(batch_size))
+            deleted = db.execute(_table.delete().where(rowid.in_(expired))).rowcount
+            db.commit()
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+
+
+# 后台清理任务，由server/main.py在启动时创建
+async def key_reaper(interval: float = config.IDEMPOTENCY_REAPER_INTERVAL) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            purged = await run_in_threadpool(purge_expired, config.IDEMPOTENCY_REAPER_BATCH_SIZE)
+            if purged:
+                logger.info("已清理%d个过期幂等键", purged)
+        except Exception:
+            logger.exception("清理过期幂等键失败")
@@ -1,23 +1,45 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from server.router import user_router, book_router, purchase_order_router,\
-    sale_order_router,bill_router
+    sale_order_router,bill_router,diagnostics_router
 from server.database import engine
-from server import db_models
+from server import db_models, auth, migrations, book_cache, checkout, suggest_index, idempotency
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 预热ISBN查询缓存，加载输入提示索引
+    await run_in_threadpool(book_cache.warm)
+    await run_in_threadpool(suggest_index.warm)
+    # 启动后台任务：定期清理过期会话、过期幂等键
+    reapers = [asyncio.create_task(auth.session_reaper()),
+               asyncio.create_task(idempotency.key_reaper())]
+    try:
+        yield
+    finally:
+        for reaper in reapers:
+            reaper.cancel()
+        await asyncio.gather(*reapers, return_exceptions=True)
+        # 写完结账队列中剩余的订单
+        await run_in_threadpool(checkout.checkout_queue.stop)
+
+app = FastAPI(lifespan=lifespan)
 @app.get("/")
 def read_root():
     return {"Hello": "World",
             "Introduction":"This is a book management system designed by Kevin(Fudan University)."}
 
-# 数据库表结构初始化
+# 数据库表结构初始化，并执行尚未执行的迁移（补充索引等）
 db_models.Base.metadata.create_all(bind=engine)
+migrations.run_migrations(engine)
 
 app.include_router(user_router.router)
 app.include_router(book_router.router)
 app.include_router(purchase_order_router.router)
 app.include_router(sale_order_router.router)
 app.include_router(bill_router.router)
+app.include_router(diagnostics_router.router)
 
 if __name__ == "__main__":
     
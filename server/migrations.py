@@ -0,0 +1,98 @@
+"""
+数据库版本迁移。
+
+Base.metadata.create_all只会创建缺失的表，不会修改已存在的表（例如补充索引），
+这类结构变更以带版本号的迁移函数登记在这里，启动时按版本号顺序执行尚未执行的迁移，
+已执行的版本记录在schema_migrations表中。
+
+迁移函数应当是幂等的（如CREATE INDEX IF NOT EXISTS），多个进程同时启动时可能重复执行。
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection, Engine
+from server import db_models, facets, fuzzy_index, search_index
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, description: str):
+    """登记一个迁移函数，版本号必须唯一且递增"""
+    def decorator(fn: Callable[[Connection], None]):
+        if any(existing == version for existing, _, _ in MIGRATIONS):
+            raise ValueError(f"重复的迁移版本号: {version}")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return decorator
+
+
+def _create_indexes(conn: Connection, *models) -> None:
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+
+@migration(1, "为热点查询/排序列添加索引")
+def _add_hot_column_indexes(conn: Connection) -> None:
+    _create_indexes(conn,
+                    db_models.Bill,
+                    db_models.SaleOrder,
+                    db_models.SaleItem,
+                    db_models.PurchaseOrder,
+                    db_models.LoginedUser)
+    # 让查询规划器获得新索引的统计信息
+    conn.exec_driver_sql("ANALYZE")
+
+
+@migration(2, "创建图书全文检索索引books_fts")
+def _create_books_fts(conn: Connection) -> None:
+    search_index.create_index(conn)
+    search_index.rebuild_index(conn)
+
+
+@migration(3, "创建图书分面统计表book_facet_counts及维护触发器")
+def _create_book_facet_counts(conn: Connection) -> None:
+    facets.create_index(conn)
+    facets.rebuild_index(conn)
+
+
+@migration(4, "创建图书模糊检索n-gram索引books_ngram")
+def _create_books_ngram(conn: Connection) -> None:
+    fuzzy_index.create_index(conn)
+    fuzzy_index.rebuild_index(conn)
+
+
+def applied_versions(engine: Engine) -> set:
+    db_models.SchemaMigration.__table__.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return set(conn.execute(select(db_models.SchemaMigration.version)).scalars())
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """执行所有尚未执行的迁移，返回本次执行的版本号"""
+    done = applied_versions(engine)
+    executed = []
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            continue
+        logger.info("执行数据库迁移 %d: %s", version, description)
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(insert(db_models.SchemaMigration)
+                         .values(version=version, description=description,
+                                 applied_at=datetime.now())
+                         .on_conflict_do_nothing())
+        executed.append(version)
+    return executed
+
+
+if __name__ == "__main__":
+    # 手动执行迁移：python -m server.migrations
+    from server.database import engine
+    logging.basicConfig(level=logging.INFO)
+    db_models.Base.metadata.create_all(bind=engine)
+    print(f"已执行的迁移: {run_migrations(engine) or '无'}")
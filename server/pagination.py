@@ -0,0 +1,193 @@
+"""
+列表接口的游标（keyset）分页。
+
+游标记录上一页最后一行的排序列值和主键，下一页用 (排序列, 主键) > 游标值 的条件
+直接定位，不需要OFFSET跳过前面的行，翻到多深都只读取一页数据，
+数据在两次请求之间变化时也不会重复或遗漏。游标对客户端是不透明的字符串。
+
+总数（total）按total_mode计算：
+- exact：精确总数。按查询条件缓存，表有新的写入提交后缓存失效；表版本号只记录本进程的提交，
+  多个worker进程部署时缓存的总数最多使用SEARCH_CACHE_TTL秒（与图书查询结果缓存相同，0表示不限）。
+  未命中时用COUNT(*) OVER () 窗口函数和当前页一起查出，不再单独执行一次count；
+- estimated：允许直接使用该条件下稍旧的缓存总数（不超过COUNT_CACHE_TTL秒），没有缓存时同exact；
+- none：不计算总数，total返回None。
+"""
+import base64
+import binascii
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Hashable, List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import and_, func, or_
+from server import change_tracking, config
+from server.cache import LRUCache
+
+CURSOR_DESCRIPTION = "分页游标：传空字符串获取第一页，之后传上一页返回的next_cursor；指定后忽略page"
+TOTAL_MODE_DESCRIPTION = "总数计算方式：exact精确（默认）/estimated允许稍旧的缓存值/none不返回总数"
+TOTAL_MODE_PATTERN = "^(exact|estimated|none)$"
+
+# 查询条件 -> (表版本号, 总数, 计数时间)
+count_cache = LRUCache(config.COUNT_CACHE_SIZE, config.COUNT_CACHE_TTL)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+    return value
+
+
+def encode_cursor(sort_key: str, value: Any, pk: Any) -> str:
+    data = json.dumps([sort_key, _encode_value(value), _encode_value(pk)],
+                      ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_key: str) -> Tuple[Any, Any]:
+    invalid = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort_key, value, pk = json.loads(data)
+        value, pk = _decode_value(value), _decode_value(pk)
+    except (ValueError, TypeError, binascii.Error):
+        raise invalid
+    # 游标只能用于生成它的排序方式
+    if cursor_sort_key != sort_key:
+        raise invalid
+    return value, pk
+
+
+def _after(sort_column, pk_column, value, pk, descending: bool):
+    """排在 (value, pk) 之后的行；SQLite中NULL最小：升序时排在最前，降序时排在最后"""
+    if sort_column is None:
+        return pk_column < pk if descending else pk_column > pk
+    if descending:
+        if value is None:
+            return and_(sort_column.is_(None), pk_column < pk)
+        return or_(sort_column < value,
+                   sort_column.is_(None),
+                   and_(sort_column == value, pk_column < pk))
+    if value is None:
+        return or_(and_(sort_column.is_(None), pk_column > pk), sort_column.isnot(None))
+    return or_(sort_column > value, and_(sort_column == value, pk_column > pk))
+
+
+def keyset_page(query, sort_column, pk_column, descending: bool, cursor: str,
+                page_size: int, sort_key: str) -> Tuple[List[Any], Optional[str]]:
+    """
+    按 (sort_column, pk_column) 取cursor之后的一页，返回 (本页数据, 下一页游标)。
+    sort_column为None或与主键相同时只按主键排序；sort_key用于校验游标与排序方式一致。
+    query的结果必须是ORM对象。
+    """
+    if sort_column is not None and sort_column.key == pk_column.key:
+        sort_column = None
+    sort_key = f"{sort_key}:{'desc' if descending else 'asc'}"
+    order = [pk_column.desc() if descending else pk_column.asc()]
+    if sort_column is not None:
+        order.insert(0, sort_column.desc() if descending else sort_column.asc())
+    query = query.order_by(None).order_by(*order)
+    if cursor:
+        value, pk = decode_cursor(cursor, sort_key)
+        query = query.filter(_after(sort_column, pk_column, value, pk, descending))
+    # 多取一行用来判断是否还有下一页
+    rows = query.limit(page_size + 1).all()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    value = getattr(last, sort_column.key) if sort_column is not None else None
+    return rows, encode_cursor(sort_key, value, getattr(last, pk_column.key))
+
+
+def _count_key(query, table_name: str) -> Optional[Hashable]:
+    """以编译后的SQL和参数作为缓存键；参数不可哈希时不缓存"""
+    compiled = query.order_by(None).statement.compile(dialect=query.session.get_bind().dialect)
+    key = (table_name, str(compiled), tuple(sorted(compiled.params.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _cached_total(key, version: int, total_mode: str) -> Tuple[Optional[int], bool]:
+    """返回 (缓存的总数, 是否为旧版本的值)，没有可用的缓存时总数为None"""
+    if key is None:
+        return None, False
+    entry = count_cache.get(key)
+    if entry is None:
+        return None, False
+    cached_version, total, counted_at = entry
+    ttl = config.SEARCH_CACHE_TTL
+    if cached_version == version and (ttl <= 0 or time.monotonic() - counted_at < ttl):
+        return total, False
+    if total_mode == "estimated":
+        return total, True
+    return None, False
+
+
+def count_total(query, model, total_mode: str) -> Tuple[Optional[int], bool]:
+    """
+    按total_mode计算query的总行数，返回 (总数, 是否为估计值)。
+    model为查询的主表模型，其版本号变化时缓存的精确总数失效。
+    """
+    if total_mode == "none":
+        return None, False
+    # 先取版本号再计数：计数期间有写入提交时，缓存的结果会被视为旧版本
+    version = change_tracking.table_version(model.__tablename__)
+    key = _count_key(query, model.__tablename__)
+    total, estimated = _cached_total(key, version, total_mode)
+    if total is None:
+        total = query.count()
+        if key is not None:
+            count_cache.set(key, (version, total, time.monotonic()))
+    return total, estimated
+
+
+def offset_page(query, model, page: int, page_size: int, total_mode: str,
+                window_count: bool = True) -> Tuple[List[Any], Optional[int], bool]:
+    """
+    按页码取一页，返回 (本页数据, 总数, 总数是否为估计值)。
+    需要重新计数时用窗口函数把总数和本页数据在一条语句中查出；查询中有不能与
+    窗口函数同时使用的函数（如FTS5的bm25）时传window_count=False，改为单独计数。
+    query的结果必须是ORM对象。
+    """
+    page_query = query.offset((page - 1) * page_size).limit(page_size)
+    if total_mode == "none":
+        return page_query.all(), None, False
+    version = change_tracking.table_version(model.__tablename__)
+    key = _count_key(query, model.__tablename__)
+    total, estimated = _cached_total(key, version, total_mode)
+    if total is not None:
+        return page_query.all(), total, estimated
+    if not window_count:
+        total, _ = count_total(query, model, "exact")
+        return page_query.all(), total, False
+
+    rows = query.add_columns(func.count().over()).offset((page - 1) * page_size).limit(page_size).all()
+    if rows:
+        total = rows[0][1]
+    elif page == 1:
+        total = 0
+    else:
+        # 页码超出范围时窗口函数没有返回行，单独计数
+        total = query.count()
+    if key is not None:
+        count_cache.set(key, (version, total, time.monotonic()))
+    return [row[0] for row in rows], total, False
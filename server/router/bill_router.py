@@ -1,18 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status,Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status,Response
 from sqlalchemy.orm import Session
 from typing import Optional
-from server.database import get_db
+from server.database import get_read_db, ReadSession
 from server.schemas.bill_schemas import PaginatedBillResponse,BillDetail
 from server import db_models
 from server import auth
+from server import pagination
+from server import change_tracking
+from server import etag
 from sqlalchemy import desc, asc
 from datetime import datetime,date,time
 router = APIRouter(prefix="/bills", tags=["bills"])
 
 @router.get("/", 
            response_model=PaginatedBillResponse,
-           dependencies=[Depends(auth.Auth.get_current_user)])
-def query_bills(
+           dependencies=[Depends(auth.Auth.get_current_user_async)])
+async def query_bills(
+    request: Request,
+    response: Response,
     # 筛选参数
     bill_type: Optional[str] = Query(
         None, 
@@ -38,69 +43,93 @@ def query_bills(
     # 分页参数
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(10, ge=1, le=100, description="每页数量"),
+    cursor: Optional[str] = Query(None, description=pagination.CURSOR_DESCRIPTION),
+    total_mode: str = Query("exact", regex=pagination.TOTAL_MODE_PATTERN, description=pagination.TOTAL_MODE_DESCRIPTION),
     
-    db: Session = Depends(get_db)
+    read_db: ReadSession = Depends(get_read_db)
 ) -> PaginatedBillResponse:
-    # 基础查询
-    query = db.query(db_models.Bill)
+    not_modified = etag.check(request, response, "bills",
+                              change_tracking.table_version(db_models.Bill.__tablename__),
+                              sorted(request.query_params.multi_items()))
+    if not_modified:
+        return not_modified
 
-    # 处理日期范围转换（将date转为datetime）
-    if start_date:
-        start_datetime = datetime.combine(start_date, time.min)
-        query = query.filter(db_models.Bill.transaction_time >= start_datetime)
-    if end_date:
-        end_datetime = datetime.combine(end_date, time.max)
-        query = query.filter(db_models.Bill.transaction_time <= end_datetime)
+    def run(db: Session) -> PaginatedBillResponse:
+        # 基础查询
+        query = db.query(db_models.Bill)
 
-    # 应用其他筛选条件
-    if bill_type:
-        query = query.filter(db_models.Bill.bill_type == bill_type)
-    if min_amount is not None:
-        query = query.filter(db_models.Bill.amount >= min_amount)
-    if max_amount is not None:
-        query = query.filter(db_models.Bill.amount <= max_amount)
-    if operator_id:
-        if exact_operator_id:
-            query = query.filter(db_models.Bill.operator_id == operator_id)
-        else:
-            query = query.filter(db_models.Bill.operator_id.contains(operator_id))
-    if related_order:
-        query = query.filter(db_models.Bill.related_order == related_order)
+        # 处理日期范围转换（将date转为datetime）
+        if start_date:
+            start_datetime = datetime.combine(start_date, time.min)
+            query = query.filter(db_models.Bill.transaction_time >= start_datetime)
+        if end_date:
+            end_datetime = datetime.combine(end_date, time.max)
+            query = query.filter(db_models.Bill.transaction_time <= end_datetime)
+
+        # 应用其他筛选条件
+        if bill_type:
+            query = query.filter(db_models.Bill.bill_type == bill_type)
+        if min_amount is not None:
+            query = query.filter(db_models.Bill.amount >= min_amount)
+        if max_amount is not None:
+            query = query.filter(db_models.Bill.amount <= max_amount)
+        if operator_id:
+            if exact_operator_id:
+                query = query.filter(db_models.Bill.operator_id == operator_id)
+            else:
+                query = query.filter(db_models.Bill.operator_id.contains(operator_id))
+        if related_order:
+            query = query.filter(db_models.Bill.related_order == related_order)
 
-    # 处理排序
-    sort_mapping = {
-        "transaction_time": db_models.Bill.transaction_time,
-        "amount": db_models.Bill.amount,
-        "bill_type": db_models.Bill.bill_type
-    }
+        # 处理排序
+        sort_mapping = {
+            "transaction_time": db_models.Bill.transaction_time,
+            "amount": db_models.Bill.amount,
+            "bill_type": db_models.Bill.bill_type
+        }
     
-    if sort_by:
-        order_column = sort_mapping[sort_by]
-        order_func = desc if sort_order == "desc" else asc
-        query = query.order_by(order_func(order_column))
-    else:
-        # 默认按交易时间降序
-        query = query.order_by(desc(db_models.Bill.transaction_time))
+        if sort_by:
+            order_column = sort_mapping[sort_by]
+            order_func = desc if sort_order == "desc" else asc
+            query = query.order_by(order_func(order_column))
+        else:
+            # 默认按交易时间降序
+            query = query.order_by(desc(db_models.Bill.transaction_time))
+
+        # 分页处理
+        next_cursor = None
+        if cursor is not None:
+            total, total_estimated = pagination.count_total(query, db_models.Bill, total_mode)
+            if sort_by:
+                sort_column, descending = sort_mapping[sort_by], sort_order == "desc"
+            else:
+                sort_column, descending = db_models.Bill.transaction_time, True
+            bills, next_cursor = pagination.keyset_page(
+                query, sort_column, db_models.Bill.id, descending, cursor, page_size, sort_column.key)
+        else:
+            bills, total, total_estimated = pagination.offset_page(
+                query, db_models.Bill, page, page_size, total_mode)
+
+        # 构建响应数据
+        items = [
+            BillDetail(
+                id=bill.id,
+                bill_type=bill.bill_type,
+                amount=float(bill.amount),
+                transaction_time=bill.transaction_time,
+                related_order=bill.related_order,
+                operator_id=bill.operator_id
+            ) for bill in bills
+        ]
 
-    # 分页处理
-    total = query.count()
-    bills = query.offset((page - 1) * page_size).limit(page_size).all()
+        return PaginatedBillResponse(
+            total=total,
+            page=page,
+            page_size=page_size,
+            next_cursor=next_cursor,
+            total_estimated=total_estimated,
+            items=items
+        )
 
-    # 构建响应数据
-    items = [
-        BillDetail(
-            id=bill.id,
-            bill_type=bill.bill_type,
-            amount=float(bill.amount),
-            transaction_time=bill.transaction_time,
-            related_order=bill.related_order,
-            operator_id=bill.operator_id
-        ) for bill in bills
-    ]
+    return await read_db.run_sync(run)
 
-    return PaginatedBillResponse(
-        total=total,
-        page=page,
-        page_size=page_size,
-        items=items
-    )
\ No newline at end of file
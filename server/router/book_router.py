@@ -1,50 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status,Response
+from pydantic import ValidationError
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status,Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import Optional
-from server.database import get_db
-from server.schemas.book_schemas import BookResponse, BookUpdateRequest, PaginatedBookResponse
+from typing import Dict, Iterator, List, Optional
+import csv
+import io
+import json
+from server.database import SessionLocal, get_db, get_read_db, ReadSession
+from server.schemas.book_schemas import (BookBatchDeleteRequest, BookBatchDeleteResult,
+                                         BookBatchUpdateRequest, BookBatchUpdateResult, BookFilter, BookImportResult,
+                                         BookPatch, BookResponse, BookRowError, BookSuggestion, BookUpdateRequest,
+                                         PaginatedBookResponse)
 from server import db_models
 from server import auth
-from sqlalchemy import desc, asc
+from server import search_index
+from server import pagination
+from server import book_import
+from server import book_cache
+from server import etag
+from server import facets
+from server import fuzzy_index
+from server import suggest_index
+from server import change_tracking
+from server import config
+from server.cache import LRUCache
+from sqlalchemy import bindparam, case, desc, asc, exists, func, literal, or_, select, union_all
 router = APIRouter(prefix="/books", tags=["books"])
 
-# get方法查询所有图书已完成
-@router.get("/", response_model=PaginatedBookResponse,dependencies=[Depends(auth.Auth.get_current_user)])
-def search_books(
-    isbn: Optional[str] = Query(None, 
-                               
-                            
-                               pattern="^[0-9]*$"),
-    title: Optional[str] = Query(None,description="图书标题"),
-    author: Optional[str] = Query(None,description="图书作者"),
-    publisher: Optional[str] = Query(None,description="图书出版社"),
-    exact_isbn: Optional[bool] = Query(False, description="ISBN精确匹配"),
-    exact_title: Optional[bool] = Query(False, description="书名精确匹配"),
-    exact_author: Optional[bool] = Query(False, description="作者精确匹配"),
-    exact_publisher: Optional[bool] = Query(False, description="出版社精确匹配"),
-    min_retail_price: Optional[float] = Query(None,ge=0.0,description="图书零售价"),
-    max_retail_price: Optional[float] = Query(None,ge=0.0,description="图书零售价"),
-    min_stock: Optional[int] = Query(None, 
-                                    ge=0,
-                                    description="最小库存量"),
-    max_stock: Optional[int] = Query(None,
-                                    ge=0,
-                                    description="最大库存量"),
-    sort_by: Optional[str] = Query(None, description="排序字段（isbn/title/author/publisher/retail_price/stock）"),
-    sort_order: Optional[str] = Query("asc", description="排序方向（asc/desc）"),
-    page: int = Query(1, ge=1, description="页码"),
-    page_size: int = Query(10, ge=1, le=100, description="每页数量"),
-    db: Session = Depends(get_db)
-    # user=Depends(auth.Auth.get_current_user)
-):
-    """多条件图书查询"""
-    query = db.query(db_models.Book)
-    
-    # 动态构建查询条件
+# GET /books/的整页结果缓存，其他进程的写入在SEARCH_CACHE_TTL秒后可见
+search_cache = LRUCache(config.SEARCH_CACHE_SIZE, ttl=config.SEARCH_CACHE_TTL or None)
+
+
+def book_filters(isbn=None, exact_isbn=False, title=None, exact_title=False,
+                 author=None, exact_author=False, publisher=None, exact_publisher=False,
+                 min_retail_price=None, max_retail_price=None, min_stock=None, max_stock=None) -> list:
+    """图书查询条件，参数含义与GET /books/相同"""
     filters = []
     if isbn and isbn!="":
         if exact_isbn:
-            
             filters.append(db_models.Book.isbn == isbn)
         else:
             filters.append(db_models.Book.isbn.contains(isbn))
@@ -71,47 +64,165 @@ def search_books(
         filters.append(db_models.Book.stock >= min_stock)
     if max_stock is not None:
         filters.append(db_models.Book.stock <= max_stock)
-    query = query.filter(*filters)
+    return filters
 
-    if sort_by:
-        if sort_by=="isbn":
-            column=db_models.Book.isbn
-        elif sort_by=="title":
-            column=db_models.Book.title
-        elif sort_by=="author":
-            column=db_models.Book.author
-        elif sort_by=="publisher":
-            column=db_models.Book.publisher
-        elif sort_by=="retail_price":
-            column=db_models.Book.retail_price
-        elif sort_by=="stock":
-            column=db_models.Book.stock
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="无效的排序字段"
-            )
-    
-        query=query.order_by(desc(column) if sort_order == "desc" else column)
+
+Q_DESCRIPTION = "全文检索关键词（书名/作者/出版社），未指定排序时按相关度排序"
+
+
+# 图书筛选参数，GET /books/及导出等接口共用
+def book_filter_params(
+    isbn: Optional[str] = Query(None, pattern="^[0-9]*$"),
+    title: Optional[str] = Query(None,description="图书标题"),
+    author: Optional[str] = Query(None,description="图书作者"),
+    publisher: Optional[str] = Query(None,description="图书出版社"),
+    exact_isbn: Optional[bool] = Query(False, description="ISBN精确匹配"),
+    exact_title: Optional[bool] = Query(False, description="书名精确匹配"),
+    exact_author: Optional[bool] = Query(False, description="作者精确匹配"),
+    exact_publisher: Optional[bool] = Query(False, description="出版社精确匹配"),
+    min_retail_price: Optional[float] = Query(None,ge=0.0,description="图书零售价"),
+    max_retail_price: Optional[float] = Query(None,ge=0.0,description="图书零售价"),
+    min_stock: Optional[int] = Query(None, 
+                                    ge=0,
+                                    description="最小库存量"),
+    max_stock: Optional[int] = Query(None,
+                                    ge=0,
+                                    description="最大库存量"),
+) -> BookFilter:
+    return BookFilter(
+        isbn=isbn, exact_isbn=bool(exact_isbn), title=title, exact_title=bool(exact_title),
+        author=author, exact_author=bool(exact_author), publisher=publisher, exact_publisher=bool(exact_publisher),
+        min_retail_price=min_retail_price, max_retail_price=max_retail_price,
+        min_stock=min_stock, max_stock=max_stock)
+
+
+def _sort_column(sort_by: str):
+    if sort_by=="isbn":
+        return db_models.Book.isbn
+    elif sort_by=="title":
+        return db_models.Book.title
+    elif sort_by=="author":
+        return db_models.Book.author
+    elif sort_by=="publisher":
+        return db_models.Book.publisher
+    elif sort_by=="retail_price":
+        return db_models.Book.retail_price
+    elif sort_by=="stock":
+        return db_models.Book.stock
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="无效的排序字段"
+    )
+
+
+# get方法查询所有图书已完成
+@router.get("/", response_model=PaginatedBookResponse,dependencies=[Depends(auth.Auth.get_current_user_async)])
+async def search_books(
+    request: Request,
+    response: Response,
+    criteria: BookFilter = Depends(book_filter_params),
+    q: Optional[str] = Query(None, max_length=100, description=Q_DESCRIPTION),
+    fuzzy: bool = Query(False, description="模糊检索：q按书名/作者/ISBN片段近似匹配，容忍错别字，未指定排序时按相似度排序"),
+    sort_by: Optional[str] = Query(None, description="排序字段（isbn/title/author/publisher/retail_price/stock）"),
+    sort_order: Optional[str] = Query("asc", description="排序方向（asc/desc）"),
+    page: int = Query(1, ge=1, description="页码"),
+    page_size: int = Query(10, ge=1, le=100, description="每页数量"),
+    cursor: Optional[str] = Query(None, description=pagination.CURSOR_DESCRIPTION),
+    total_mode: str = Query("exact", regex=pagination.TOTAL_MODE_PATTERN, description=pagination.TOTAL_MODE_DESCRIPTION),
+    with_facets: bool = Query(False, alias="facets",
+                              description="同时返回当前条件下出版社/作者/价格区间/库存区间的分面统计"),
+    facet_limit: int = Query(20, ge=1, le=100, description="出版社、作者分面最多返回的取值数"),
+    read_db: ReadSession = Depends(get_read_db)
+    # user=Depends(auth.Auth.get_current_user)
+):
+    """多条件图书查询"""
+    # 全文检索（关键词中没有可检索的字符时忽略）
+    fuzzy_query = q.strip().lower() if fuzzy and q and q.strip() else None
+    match_query = search_index.build_match_query(q) if q and not fuzzy else None
+    ranked = bool(match_query or fuzzy_query) and not sort_by
+
+    # 查询结果缓存：键包含books表版本号，图书有变更提交后旧结果不再命中，由LRU淘汰
+    cache_key = (
+        change_tracking.table_version(db_models.Book.__tablename__),
+        criteria.isbn or None, bool(criteria.isbn and criteria.exact_isbn),
+        criteria.title or None, bool(criteria.title and criteria.exact_title),
+        criteria.author or None, bool(criteria.author and criteria.exact_author),
+        criteria.publisher or None, bool(criteria.publisher and criteria.exact_publisher),
+        criteria.min_retail_price, criteria.max_retail_price, criteria.min_stock, criteria.max_stock, match_query, fuzzy_query,
+        sort_by or None, sort_order if sort_by else None,
+        page if cursor is None else None, page_size, cursor, total_mode,
+        facet_limit if with_facets else None,
+    )
+    not_modified = etag.check(request, response, "books", cache_key)
+    if not_modified:
+        return not_modified
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    def run(db: Session) -> PaginatedBookResponse:
+        query = db.query(db_models.Book)
+        filters = book_filters(**criteria.dict())
+        query = query.filter(*filters)
+
+        if match_query:
+            query = search_index.apply_search(query, match_query, order_by_rank=not sort_by)
+        if fuzzy_query:
+            isbns = fuzzy_index.search(db.connection(), fuzzy_query)
+            query = query.filter(db_models.Book.isbn.in_(isbns))
+            if not sort_by and isbns:
+                query = query.order_by(case({isbn: i for i, isbn in enumerate(isbns)}, value=db_models.Book.isbn))
+
+        # 分面统计：没有筛选条件时读取预先维护的统计表
+        facet_counts = None
+        if with_facets:
+            facet_counts = facets.compute(
+                db, query if filters or match_query or fuzzy_query else None, facet_limit)
+
+        if sort_by:
+            column = _sort_column(sort_by)
+            query=query.order_by(desc(column) if sort_order == "desc" else column)
         
     
-    # 执行分页查询
-    total = query.count()
-    books = query.offset((page-1)*page_size).limit(page_size).all()
-    # with open(r"D:\Projects\DataBase\debug.txt","a") as f:
-    #     f.write(f"{[BookResponse.from_orm(book) for book in books]}\n")
-    #     f.flush()
-    return PaginatedBookResponse(
-        total=total,
-        page=page,
-        page_size=page_size,
-        data=[BookResponse.from_orm(book) for book in books]
-    )
+        # 执行分页查询
+        next_cursor = None
+        if cursor is not None:
+            if ranked:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="按相关度排序时不支持游标分页，请指定排序字段"
+                )
+            total, total_estimated = pagination.count_total(query, db_models.Book, total_mode)
+            books, next_cursor = pagination.keyset_page(
+                query, column if sort_by else None, db_models.Book.isbn,
+                bool(sort_by) and sort_order == "desc", cursor, page_size, sort_by or "isbn")
+        else:
+            books, total, total_estimated = pagination.offset_page(
+                query, db_models.Book, page, page_size, total_mode,
+                window_count=not (match_query and not sort_by))
+        # with open(r"D:\Projects\DataBase\debug.txt","a") as f:
+        #     f.write(f"{[BookResponse.from_orm(book) for book in books]}\n")
+        #     f.flush()
+        return PaginatedBookResponse(
+            total=total,
+            page=page,
+            page_size=page_size,
+            next_cursor=next_cursor,
+            total_estimated=total_estimated,
+            data=[BookResponse.from_orm(book) for book in books],
+            facets=facet_counts
+        )
+
+    result = await read_db.run_sync(run)
+    # 估计的总数可能已过期，不放入缓存，避免在当前版本下一直返回旧值
+    if not result.total_estimated:
+        search_cache.set(cache_key, result)
+    return result
 
 #post方法创建图书已完成
 @router.post("/", 
            response_model=BookResponse,
-           dependencies=[Depends(auth.Auth.get_current_user)],
+           dependencies=[Depends(auth.Auth.get_current_user_async)],
            status_code=status.HTTP_201_CREATED)
 def create_book(
     book_data: BookResponse,  
@@ -150,7 +261,154 @@ def create_book(
         )
     
     return new_book
-   
+
+
+@router.post("/import",
+           response_model=BookImportResult,
+           dependencies=[Depends(auth.Auth.get_current_user_async)])
+async def import_books(
+    request: Request,
+    format: Optional[str] = Query(None, regex="^(csv|ndjson)$",
+                                  description="导入格式csv/ndjson，不指定时按Content-Type判断"),
+    on_conflict: str = Query("error", regex="^(error|skip|update)$",
+                             description="ISBN已存在时：error记为错误行/skip跳过/update覆盖"),
+):
+    """
+    批量导入图书，请求体为CSV（首行为列名isbn,title,author,publisher,retail_price,stock）
+    或NDJSON（每行一个图书JSON对象）。
+    按批提交，单行校验失败或ISBN冲突只记入errors，不影响其他行。
+    """
+    fmt = format or book_import.detect_format(request.headers.get("content-type"))
+    return await book_import.import_books(request.stream(), fmt, on_conflict)
+
+# SQLite单条语句的参数个数有限制，IN查询分批进行
+_IN_BATCH_SIZE = 500
+# 引用检查每个ISBN一个UNION ALL分支、3个参数（SQLite最多500个分支）
+_PROBE_BATCH_SIZE = 200
+
+# 导出时每批从数据库读取、写出的行数
+_EXPORT_BATCH_SIZE = 1000
+_EXPORT_COLUMNS = ("isbn", "title", "author", "publisher", "retail_price", "stock")
+
+
+def _export_rows(criteria: BookFilter, match_query: Optional[str],
+                 sort_by: Optional[str], sort_order: str, fmt: str) -> Iterator[bytes]:
+    """按批读取并编码，内存占用与图书总数无关；整个导出在同一个读事务中，数据一致"""
+    table = db_models.Book.__table__
+    stmt = select(*[table.c[name] for name in _EXPORT_COLUMNS]).where(*book_filters(**criteria.dict()))
+    if match_query:
+        stmt = search_index.apply_search(stmt, match_query, order_by_rank=not sort_by)
+    if sort_by:
+        column = _sort_column(sort_by)
+        stmt = stmt.order_by(desc(column) if sort_order == "desc" else column, table.c.isbn)
+    elif not match_query:
+        stmt = stmt.order_by(table.c.isbn)
+
+    if fmt == "csv":
+        # 带BOM，Excel可以直接打开中文
+        yield ("\ufeff" + ",".join(_EXPORT_COLUMNS) + "\r\n").encode("utf-8")
+    with SessionLocal() as db:
+        result = db.execute(stmt.execution_options(yield_per=_EXPORT_BATCH_SIZE))
+        for rows in result.partitions():
+            buffer = io.StringIO()
+            if fmt == "csv":
+                csv.writer(buffer).writerows(rows)
+            else:
+                for row in rows:
+                    book = row._asdict()
+                    if book["retail_price"] is not None:
+                        book["retail_price"] = float(book["retail_price"])
+                    buffer.write(json.dumps(book, ensure_ascii=False))
+                    buffer.write("\n")
+            yield buffer.getvalue().encode("utf-8")
+
+
+@router.get("/export", dependencies=[Depends(auth.Auth.get_current_user_async)])
+def export_books(
+    criteria: BookFilter = Depends(book_filter_params),
+    q: Optional[str] = Query(None, max_length=100, description=Q_DESCRIPTION),
+    sort_by: Optional[str] = Query(None, description="排序字段（isbn/title/author/publisher/retail_price/stock），默认按ISBN"),
+    sort_order: Optional[str] = Query("asc", description="排序方向（asc/desc）"),
+    format: str = Query("csv", regex="^(csv|ndjson)$", description="导出格式csv/ndjson"),
+):
+    """
+    流式导出符合条件的全部图书（筛选条件同GET /books/），不分页。
+    CSV的列与批量导入相同，导出的文件可以直接用于POST /books/import。
+    """
+    if sort_by:
+        _sort_column(sort_by)  # 在开始输出前校验排序字段
+    match_query = search_index.build_match_query(q) if q else None
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_rows(criteria, match_query, sort_by, sort_order, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="books.{format}"'},
+    )
+
+
+@router.get("/suggest", response_model=List[BookSuggestion],
+            dependencies=[Depends(auth.Auth.get_current_user_async)])
+async def suggest_books(
+    q: str = Query(..., min_length=1, max_length=100, description="已输入的前缀"),
+    field: Optional[str] = Query(None, regex="^(title|author|publisher)$", description="只提示某一字段（title/author/publisher）"),
+    limit: int = Query(10, ge=1, le=50, description="最多返回的提示数"),
+):
+    """搜索框输入提示：按前缀补全书名、作者、出版社，读取内存中的索引，不查询数据库"""
+    return suggest_index.prefix_index.suggest(q, limit, field)
+
+
+@router.get("/{isbn}",
+            response_model=BookResponse,
+            dependencies=[Depends(auth.Auth.get_current_user_async)],
+            responses={
+                404: {"description": "图书不存在"},
+                400: {"description": "无效的ISBN格式"}
+            })
+async def get_book(
+    isbn: str,
+    request: Request,
+    response: Response,
+    read_db: ReadSession = Depends(get_read_db)
+):
+    """按ISBN查询单本图书（扫码），优先读取内存缓存"""
+    if len(isbn) != 13 or not isbn.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的ISBN格式"
+        )
+    not_modified = etag.check(request, response, "book", isbn,
+                              change_tracking.row_version(db_models.Book.__tablename__, isbn))
+    if not_modified:
+        return not_modified
+    book = book_cache.get(isbn)
+    if book is book_cache.MISS:
+        book = await read_db.run_sync(book_cache.load, isbn)
+    if book is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="图书不存在"
+        )
+    return book
+
+
+def referenced_isbns(db: Session, isbns: List[str]) -> set:
+    """
+    isbns中被进货单或销售明细引用的ISBN。
+    每个ISBN在两张表的book_isbn索引上各做一次EXISTS探测，找到第一条即停止，
+    耗时与该书的历史订单数量无关（DISTINCT/IN会读完该ISBN的全部索引项）。
+    """
+    referenced = set()
+    for start in range(0, len(isbns), _PROBE_BATCH_SIZE):
+        probes = [
+            select(literal(isbn)).where(or_(
+                exists().where(db_models.PurchaseOrder.book_isbn == isbn),
+                exists().where(db_models.SaleItem.book_isbn == isbn)))
+            for isbn in isbns[start:start + _PROBE_BATCH_SIZE]
+        ]
+        referenced.update(db.scalars(union_all(*probes)))
+    return referenced
+
+
 @router.delete(
     "/{isbn}",
     status_code=status.HTTP_200_OK,
@@ -163,7 +421,7 @@ def create_book(
 def delete_book(
     isbn: str,
     db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
 ):
     """
     删除图书（需要管理员权限）
@@ -183,14 +441,7 @@ def delete_book(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="图书不存在"
         )
-    purchase_order=db.query(db_models.PurchaseOrder).filter(db_models.PurchaseOrder.book_isbn==isbn).first()
-    if purchase_order:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="存在关联记录，无法删除"
-        )
-    sale_order=db.query(db_models.SaleOrder).filter(db_models.SaleItem.book_isbn==isbn).first()
-    if sale_order:
+    if referenced_isbns(db, [isbn]):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="存在关联记录，无法删除"
@@ -219,7 +470,7 @@ def update_book_info(
     isbn: str,
     update_data: BookUpdateRequest,
     db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
 ):
     """更新图书信息"""
     # 参数验证
@@ -266,4 +517,161 @@ def update_book_info(
             detail=f"数据库更新失败: {str(e)}"
         )
     
-    return book
\ No newline at end of file
+    return book
+
+
+class _RowErrors:
+    """批量操作的错误行，按行号排列，只返回前BOOK_IMPORT_MAX_ERRORS条明细"""
+
+    def __init__(self):
+        self._errors: List[BookRowError] = []
+
+    def add(self, row: Optional[int], isbn: Optional[str], message: str) -> None:
+        self._errors.append(BookRowError(row=row, isbn=isbn, error=message))
+
+    @property
+    def count(self) -> int:
+        return len(self._errors)
+
+    @property
+    def items(self) -> List[BookRowError]:
+        # 逐行校验的错误和“图书不存在”等后续检查的错误分别产生，返回前按行号排序
+        errors = sorted(self._errors, key=lambda error: (error.row is None, error.row or 0, error.isbn or ""))
+        return errors[:config.BOOK_IMPORT_MAX_ERRORS]
+
+
+def _apply_book_patches(db: Session, items: List[dict], errors: _RowErrors) -> int:
+    """逐行校验后，修改字段相同的行合并为一条UPDATE用executemany执行，返回修改的图书数"""
+    patches: Dict[str, dict] = {}
+    rows: Dict[str, int] = {}
+    for row, item in enumerate(items, 1):
+        isbn = item.get("isbn") if isinstance(item.get("isbn"), str) else None
+        try:
+            patch = BookPatch(**item).dict(exclude_unset=True)
+        except ValidationError as e:
+            errors.add(row, isbn, book_import.describe_error(e))
+            continue
+        patch.pop("isbn")
+        if "title" in patch and patch["title"] is None:
+            errors.add(row, isbn, "书名不能为空")
+            continue
+        if "stock" in patch and patch["stock"] is None:
+            errors.add(row, isbn, "库存不能为空")
+            continue
+        # 同一ISBN出现多次时按顺序合并
+        patches.setdefault(isbn, {}).update(patch)
+        rows[isbn] = row
+
+    existing = book_import.existing_isbns(db, list(patches))
+    groups: Dict[tuple, list] = {}
+    for isbn, patch in patches.items():
+        if isbn not in existing:
+            errors.add(rows[isbn], isbn, "图书不存在")
+        elif patch:
+            groups.setdefault(tuple(sorted(patch)), []).append({"b_isbn": isbn, **patch})
+
+    table = db_models.Book.__table__
+    for fields, params in groups.items():
+        stmt = (table.update()
+                .where(table.c.isbn == bindparam("b_isbn"))
+                .values({field: bindparam(field) for field in fields}))
+        db.execute(stmt, params)
+        change_tracking.mark_books_changed(db, [param["b_isbn"] for param in params], columns=fields)
+    return sum(len(params) for params in groups.values())
+
+
+def _apply_price_change(db: Session, criteria: Optional[BookFilter], percent: float,
+                        errors: _RowErrors) -> int:
+    """
+    按筛选条件用一条UPDATE调整零售价，返回修改的图书数。
+    调整后零售价不大于0的图书不修改，记入errors（没有行号）。
+    """
+    table = db_models.Book.__table__
+    new_price = func.round(table.c.retail_price * (1 + percent / 100), 2)
+    filters = book_filters(**criteria.dict()) if criteria else []
+    rejected = select(table.c.isbn, table.c.retail_price).where(
+        *filters, table.c.retail_price.isnot(None), new_price <= 0).order_by(table.c.isbn)
+    for isbn, price in db.execute(rejected):
+        errors.add(None, isbn, f"零售价{price}调整{percent}%后不大于0，未修改")
+    stmt = (table.update()
+            .where(*filters, table.c.retail_price.isnot(None), new_price > 0)
+            .values(retail_price=new_price)
+            .returning(*table.c))
+    changes = {row.isbn: change_tracking.book_snapshot(row) for row in db.execute(stmt)}
+    change_tracking.record_books_changed(db, changes, columns=("retail_price",))
+    return len(changes)
+
+
+@router.post("/batch_update", response_model=BookBatchUpdateResult)
+def batch_update_books(
+    update_data: BookBatchUpdateRequest,
+    db: Session = Depends(get_db),
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
+):
+    """
+    批量修改图书，全部修改在同一个事务中提交
+    - items：逐本修改，校验规则同PUT /books/{isbn}，不合法或不存在的行记入errors并跳过
+    - filter + price_change_percent：按条件调整零售价（保留两位小数），没有零售价的图书不变，
+      调整后不大于0的图书不修改并记入errors（row为空）
+    - errors按行号排列
+    """
+    errors = _RowErrors()
+    try:
+        if update_data.items is not None:
+            updated = _apply_book_patches(db, update_data.items, errors)
+        else:
+            updated = _apply_price_change(db, update_data.filter, update_data.price_change_percent, errors)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"数据库更新失败: {str(e)}"
+        )
+
+    return BookBatchUpdateResult(updated=updated, error_count=errors.count, errors=errors.items)
+
+
+@router.post("/batch_delete", response_model=BookBatchDeleteResult)
+def batch_delete_books(
+    delete_data: BookBatchDeleteRequest,
+    db: Session = Depends(get_db),
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
+):
+    """
+    批量删除图书，在同一个事务中完成
+    - ISBN格式错误、图书不存在、存在关联进货/销售记录的行记入errors并跳过
+    """
+    errors = _RowErrors()
+    isbns: Dict[str, int] = {}
+    for row, isbn in enumerate(delete_data.isbns, 1):
+        if len(isbn) != 13 or not isbn.isdigit():
+            errors.add(row, isbn, "无效的ISBN格式")
+        else:
+            isbns.setdefault(isbn, row)
+
+    existing = book_import.existing_isbns(db, list(isbns))
+    referenced = referenced_isbns(db, list(existing))
+    deletable = []
+    for isbn, row in isbns.items():
+        if isbn not in existing:
+            errors.add(row, isbn, "图书不存在")
+        elif isbn in referenced:
+            errors.add(row, isbn, "存在关联记录，无法删除")
+        else:
+            deletable.append(isbn)
+
+    table = db_models.Book.__table__
+    try:
+        for start in range(0, len(deletable), _IN_BATCH_SIZE):
+            db.execute(table.delete().where(table.c.isbn.in_(deletable[start:start + _IN_BATCH_SIZE])))
+        change_tracking.record_books_changed(db, dict.fromkeys(deletable))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"删除失败: {str(e)}"
+        )
+
+    return BookBatchDeleteResult(deleted=len(deletable), error_count=errors.count, errors=errors.items)
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from server import auth, book_cache, checkout, config, pagination
+from server.router import book_router
+from server.database import get_engine_diagnostics
+
+router = APIRouter(prefix="/diagnostics", tags=["diagnostics"],
+                   dependencies=[Depends(auth.Auth.admin_required)])
+
+## 当前生效的数据库参数（SQLite PRAGMA）与连接池状态
+@router.get("/db")
+async def get_db_diagnostics() -> dict:
+    return await run_in_threadpool(get_engine_diagnostics)
+
+
+## 进程内缓存的大小与命中率
+@router.get("/caches")
+async def get_cache_diagnostics() -> dict:
+    return {
+        "token_cache": auth.token_cache.stats(),
+        "count_cache": pagination.count_cache.stats(),
+        "book_cache": book_cache.book_cache.stats(),
+        "search_cache": book_router.search_cache.stats(),
+    }
+
+
+## 结账队列的批次统计
+@router.get("/checkout_queue")
+async def get_checkout_queue_diagnostics() -> dict:
+    return {"enabled": config.CHECKOUT_QUEUE_ENABLED, **checkout.checkout_queue.stats()}
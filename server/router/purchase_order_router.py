@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status,Response
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status,Response
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import datetime
@@ -8,17 +8,34 @@ from server.schemas.purchase_order_schemas import PurchaseOrderResponse,\
         PurchaseOrderDetail
 from server import db_models
 from server import auth
-from datetime import date
+from server import pagination
+from server import idempotency
+from datetime import date, time
 from sqlalchemy import desc, asc
 from sqlalchemy.exc import IntegrityError
 
 router = APIRouter(tags=["Purchase Management"],prefix="/purchase")
 
+_IDEMPOTENCY_KEY_DESCRIPTION = "幂等键，超时重试时使用相同的值"
+
 @router.post("/create_order/", response_model=PurchaseOrderResponse)
 def create_purchase_order(
     purchase_data: PurchaseCreateRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.HEADER, description=_IDEMPOTENCY_KEY_DESCRIPTION),
     db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
+)->PurchaseOrderResponse:
+    # 带幂等键重试时返回第一次的结果，不会重复创建订单
+    return idempotency.execute(
+        db, response, idempotency_key, current_user.employee_id, "POST /purchase/create_order/",
+        purchase_data, PurchaseOrderResponse,
+        lambda: _create_purchase_order(purchase_data, db, current_user))
+
+def _create_purchase_order(
+    purchase_data: PurchaseCreateRequest,
+    db: Session,
+    current_user: db_models.User
 )->PurchaseOrderResponse:
     # 验证ISBN格式
     if len(purchase_data.isbn) != 13 or not purchase_data.isbn.isdigit():
@@ -84,7 +101,7 @@ def create_purchase_order(
 
 @router.get("/orders", 
            response_model=PaginatedPurchaseResponse,
-           dependencies=[Depends(auth.Auth.get_current_user)])
+           dependencies=[Depends(auth.Auth.get_current_user_async)])
 def query_purchase_orders(
     # 筛选参数
     order_id: Optional[int] = Query(None, description="按订单ID精确查询"),
@@ -113,6 +130,8 @@ def query_purchase_orders(
     # 分页参数
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(10, ge=1, le=100, description="每页数量"),
+    cursor: Optional[str] = Query(None, description=pagination.CURSOR_DESCRIPTION),
+    total_mode: str = Query("exact", regex=pagination.TOTAL_MODE_PATTERN, description=pagination.TOTAL_MODE_DESCRIPTION),
     
     db: Session = Depends(get_db)
 ) -> PaginatedPurchaseResponse:
@@ -145,11 +164,10 @@ def query_purchase_orders(
         else:
             query = query.filter(db_models.PurchaseOrder.operator_id3.contains(operator_id3))
     if start_date:
-        # 使用 DATE() 函数提取日期部分进行比较，确保精确到天
-        query = query.filter(db_models.PurchaseOrder.order_date.cast(db.Date) >= start_date)
+        # 转换为当天起止时间的范围比较，精确到天且可以使用order_date索引
+        query = query.filter(db_models.PurchaseOrder.order_date >= datetime.combine(start_date, time.min))
     if end_date:
-        # 使用 DATE() 函数提取日期部分进行比较，确保精确到天
-        query = query.filter(db_models.PurchaseOrder.order_date.cast(db.Date) <= end_date)
+        query = query.filter(db_models.PurchaseOrder.order_date <= datetime.combine(end_date, time.max))
     if min_price is not None:
         query = query.filter(db_models.PurchaseOrder.purchase_price >= min_price)
     if max_price is not None:
@@ -175,8 +193,18 @@ def query_purchase_orders(
         query = query.order_by(asc(db_models.PurchaseOrder.order_date))
 
     # 分页处理
-    total = query.count()
-    orders = query.offset((page - 1) * page_size).limit(page_size).all()
+    next_cursor = None
+    if cursor is not None:
+        total, total_estimated = pagination.count_total(query, db_models.PurchaseOrder, total_mode)
+        if sort_by:
+            sort_column, descending = sort_mapping[sort_by], sort_order == "desc"
+        else:
+            sort_column, descending = db_models.PurchaseOrder.order_date, False
+        orders, next_cursor = pagination.keyset_page(
+            query, sort_column, db_models.PurchaseOrder.id, descending, cursor, page_size, sort_column.key)
+    else:
+        orders, total, total_estimated = pagination.offset_page(
+            query, db_models.PurchaseOrder, page, page_size, total_mode)
 
     # 构建响应数据
     items = [
@@ -198,6 +226,8 @@ def query_purchase_orders(
         total=total,
         page=page,
         page_size=page_size,
+        next_cursor=next_cursor,
+        total_estimated=total_estimated,
         items=items
     )
 
@@ -205,8 +235,19 @@ def query_purchase_orders(
 @router.put("/pay/{order_id}", response_model=PaymentResponse)
 def pay_purchase_order(
     order_id: int,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.HEADER, description=_IDEMPOTENCY_KEY_DESCRIPTION),
     db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
+)-> PaymentResponse:
+    return idempotency.execute(
+        db, response, idempotency_key, current_user.employee_id, f"PUT /purchase/pay/{order_id}",
+        None, PaymentResponse, lambda: _pay_purchase_order(order_id, db, current_user))
+
+def _pay_purchase_order(
+    order_id: int,
+    db: Session,
+    current_user: db_models.User
 )-> PaymentResponse:
     # 获取订单
     order = db.query(db_models.PurchaseOrder).filter(order_id==db_models.PurchaseOrder.id).first()
@@ -255,8 +296,19 @@ def pay_purchase_order(
 @router.put("/return/{order_id}", response_model=ReturnResponse)
 def return_purchase_order(
     order_id: int,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.HEADER, description=_IDEMPOTENCY_KEY_DESCRIPTION),
     db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
+)-> ReturnResponse:
+    return idempotency.execute(
+        db, response, idempotency_key, current_user.employee_id, f"PUT /purchase/return/{order_id}",
+        None, ReturnResponse, lambda: _return_purchase_order(order_id, db, current_user))
+
+def _return_purchase_order(
+    order_id: int,
+    db: Session,
+    current_user: db_models.User
 )-> ReturnResponse:
     # 获取订单
     order = db.query(db_models.PurchaseOrder).get(order_id)
@@ -287,9 +339,22 @@ def return_purchase_order(
 @router.put("/arrive/{order_id}", response_model=PaymentResponse)
 def arrive_purchase_order(
     order_id: int,
+    response: Response,
     retail_price:Optional[float]=Query(None, description="零售价"),
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.HEADER, description=_IDEMPOTENCY_KEY_DESCRIPTION),
     db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
+)-> PaymentResponse:
+    return idempotency.execute(
+        db, response, idempotency_key, current_user.employee_id, f"PUT /purchase/arrive/{order_id}",
+        {"retail_price": retail_price}, PaymentResponse,
+        lambda: _arrive_purchase_order(order_id, retail_price, db, current_user))
+
+def _arrive_purchase_order(
+    order_id: int,
+    retail_price: Optional[float],
+    db: Session,
+    current_user: db_models.User
 )-> PaymentResponse:
     # 获取订单
     order = db.query(db_models.PurchaseOrder).get(order_id)
@@ -1,110 +1,53 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import Optional, List
 from datetime import datetime
-import random
-import string
 from server.schemas.sale_order_schemas import (
     SaleItemCreate, PaymentResponse, SaleOrderDetail, 
     SaleOrderListItem, PaginatedSaleOrderResponse, SaleOrderUpdate
 )
 from server import db_models
-from server.database import get_db
+from server.database import get_db, get_read_db, ReadSession
 from server import auth
+from server import pagination
+from server import change_tracking
+from server import config
+from server import etag
+from server import checkout
+from server import sequence
+from server import idempotency
+from server.cache import LRUCache
 from sqlalchemy import desc, asc, and_
 
 router = APIRouter(tags=["sale"],prefix="/sale")
 
+# 订单ID -> 订单中图书的ISBN，用于计算订单详情的ETag（订单项只随订单一起创建和删除，删除订单时移除）
+_order_isbns = LRUCache(config.ROW_VERSION_TRACK_SIZE)
+
 @router.post("/", response_model=PaymentResponse)
-def create_sale_order(
+async def create_sale_order(
     items: List[SaleItemCreate],  
+    response: Response,
     payment_method: Optional[str] = Query(None, description="支付方式"),
-    db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.HEADER, description="幂等键，超时重试时使用相同的值"),
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
 ):
     """
     创建销售订单并减少库存
     """
-    # 生成交易流水号
-    transaction_no = generate_transaction_no()
-    
-    # 计算总金额并验证库存
-    total_amount = 0
-    sale_items = []
-    
-    for item in items:
-        # 查询书籍信息
-        book = db.query(db_models.Book).filter_by(isbn=item.book_isbn).first()
-        if not book:
-            raise HTTPException(status_code=404, detail=f"ISBN为{item.book_isbn}的书籍不存在")
-        
-        # 检查库存
-        if book.stock < item.quantity:
-            raise HTTPException(
-                status_code=400,
-                detail=f"书籍《{book.title}》库存不足，当前库存: {book.stock}"
-            )
-        
-        # 检查零售价
-        if not book.retail_price:
-            raise HTTPException(
-                status_code=400,
-                detail=f"书籍《{book.title}》未设置零售价"
-            )
-        
-        # 计算单项金额
-        item_amount = book.retail_price * item.quantity
-        total_amount += item_amount
-        
-        # 减少库存
-        book.stock -= item.quantity
-        
-        # 创建销售项
-        sale_item = db_models.SaleItem(
-            book_isbn=item.book_isbn,
-            quantity=item.quantity,
-            sold_price=book.retail_price,## 没有命名为零售价，可能会有折扣（暂未实现）
-            total_amount=item_amount, 
-            
-        )
-        sale_items.append(sale_item)
-    
-    # 创建销售订单
-    sale_order = db_models.SaleOrder(
-        transaction_no=transaction_no,
-        total_amount=total_amount,
-        payment_method=payment_method,
-        operator_id=current_user.employee_id,
-        sold_items=sale_items
-    )
-    
-    
-    try:
-        db.add(sale_order)
-        db.flush()
-        # 创建账单（添加当前时间）
-        bill = db_models.Bill(
-            bill_type="零售",
-            amount=sale_order.total_amount,
-            related_order=sale_order.id,
-            operator_id=current_user.employee_id,
-            transaction_time=datetime.now()
-        )
-        db.add(bill)
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=500,
-            detail=f"销售失败: {str(e)}"
-        )
-    
-    return {
-        "message": "销售成功",
-        "order_id": sale_order.id,
-        "transaction_no": sale_order.transaction_no,
-        "total_amount": sale_order.total_amount
-    }
+    async def place():
+        # 生成交易流水号（号段用完时需要写数据库，放到线程池中）
+        transaction_no = await run_in_threadpool(generate_transaction_no)
+        # 开启结账队列时与同时到达的其他订单合并提交
+        if config.CHECKOUT_QUEUE_ENABLED:
+            return await checkout.checkout_queue.submit(items, payment_method, current_user.employee_id, transaction_no)
+        return await run_in_threadpool(checkout.checkout_now, items, payment_method, current_user.employee_id, transaction_no)
+
+    # 带幂等键重试时返回第一次的结果，不会重复下单
+    return await idempotency.execute_async(
+        response, idempotency_key, current_user.employee_id, "POST /sale/",
+        {"items": items, "payment_method": payment_method}, PaymentResponse, place)
 
 def parse_date_from_transaction_no(transaction_no):
     """从交易流水号解析日期"""
@@ -112,7 +55,7 @@ def parse_date_from_transaction_no(transaction_no):
         return None
     
     try:
-        # 交易流水号格式: SO + 年月日时分秒 + 随机数
+        # 交易流水号格式: SO + 年月日时分秒 + 序号（旧数据为6位随机数）
         date_part = transaction_no[2:10]  # 提取年月日部分
         year = int(date_part[:4])
         month = int(date_part[4:6])
@@ -122,7 +65,9 @@ def parse_date_from_transaction_no(transaction_no):
         return None
 
 @router.get("/", response_model=PaginatedSaleOrderResponse)
-def get_all_sale_orders(
+async def get_all_sale_orders(
+    request: Request,
+    response: Response,
     # 筛选参数
     transaction_no: Optional[str] = Query(None, description="按交易流水号搜索"),
     exact_transaction_no: Optional[bool] = Query(False, description="交易流水号精确匹配"),
@@ -141,119 +86,165 @@ def get_all_sale_orders(
     # 分页参数
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(10, ge=1, le=100, description="每页数量"),
+    cursor: Optional[str] = Query(None, description=pagination.CURSOR_DESCRIPTION),
+    total_mode: str = Query("exact", regex=pagination.TOTAL_MODE_PATTERN, description=pagination.TOTAL_MODE_DESCRIPTION),
     
-    db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    read_db: ReadSession = Depends(get_read_db),
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
 ):
     """
     获取所有销售订单
     """
-    # 基础查询
-    query = db.query(db_models.SaleOrder)
-    
-    # 应用筛选条件
-    if transaction_no and transaction_no!='':
-        if exact_transaction_no:
-            query = query.filter(db_models.SaleOrder.transaction_no == transaction_no)
+    not_modified = etag.check(request, response, "sale_orders",
+                              change_tracking.table_version(db_models.SaleOrder.__tablename__),
+                              change_tracking.table_version(db_models.User.__tablename__),
+                              sorted(request.query_params.multi_items()))
+    if not_modified:
+        return not_modified
+
+    def run(db: Session) -> PaginatedSaleOrderResponse:
+        # 基础查询，本页订单的操作员用一条IN查询一起取出
+        query = db.query(db_models.SaleOrder).options(selectinload(db_models.SaleOrder.operator))
+    
+        # 应用筛选条件
+        if transaction_no and transaction_no!='':
+            if exact_transaction_no:
+                query = query.filter(db_models.SaleOrder.transaction_no == transaction_no)
+            else:
+                query = query.filter(db_models.SaleOrder.transaction_no.contains(transaction_no))
+    
+        if payment_method:
+            query = query.filter(db_models.SaleOrder.payment_method == payment_method)
+    
+        if operator_id and operator_id!="":
+            if exact_operator_id:
+                query = query.filter(db_models.SaleOrder.operator_id == operator_id)
+            else:
+                query = query.filter(db_models.SaleOrder.operator_id.contains(operator_id))
+    
+        if min_amount is not None:
+            query = query.filter(db_models.SaleOrder.total_amount >= min_amount)
+    
+        if max_amount is not None:
+            query = query.filter(db_models.SaleOrder.total_amount <= max_amount)
+    
+        if start_date:
+            query = query.filter(db_models.SaleOrder.created_at >= start_date)
+    
+        if end_date:
+            query = query.filter(db_models.SaleOrder.created_at <= end_date)
+    
+        # 应用排序
+        sort_column = None
+        if sort_by == "created_at":
+            sort_column = db_models.SaleOrder.created_at
+        elif sort_by == "transaction_no":
+            sort_column = db_models.SaleOrder.transaction_no
+        elif sort_by == "total_amount":
+            sort_column = db_models.SaleOrder.total_amount
         else:
-            query = query.filter(db_models.SaleOrder.transaction_no.contains(transaction_no))
+            sort_column = db_models.SaleOrder.created_at
     
-    if payment_method:
-        query = query.filter(db_models.SaleOrder.payment_method == payment_method)
-    
-    if operator_id and operator_id!="":
-        if exact_operator_id:
-            query = query.filter(db_models.SaleOrder.operator_id == operator_id)
+        if sort_order == "desc":
+            query = query.order_by(desc(sort_column))
         else:
-            query = query.filter(db_models.SaleOrder.operator_id.contains(operator_id))
-    
-    if min_amount is not None:
-        query = query.filter(db_models.SaleOrder.total_amount >= min_amount)
-    
-    if max_amount is not None:
-        query = query.filter(db_models.SaleOrder.total_amount <= max_amount)
-    
-    if start_date:
-        query = query.filter(db_models.SaleOrder.created_at >= start_date)
-    
-    if end_date:
-        query = query.filter(db_models.SaleOrder.created_at <= end_date)
-    
-    # 应用排序
-    sort_column = None
-    if sort_by == "created_at":
-        sort_column = db_models.SaleOrder.created_at
-    elif sort_by == "transaction_no":
-        sort_column = db_models.SaleOrder.transaction_no
-    elif sort_by == "total_amount":
-        sort_column = db_models.SaleOrder.total_amount
-    else:
-        sort_column = db_models.SaleOrder.created_at
-    
-    if sort_order == "desc":
-        query = query.order_by(desc(sort_column))
-    else:
-        query = query.order_by(asc(sort_column))
-    
-    # 计算总数
-    total = query.count()
-    
-    # 分页
-    orders = query.offset((page - 1) * page_size).limit(page_size).all()
+            query = query.order_by(asc(sort_column))
+    
+        # 分页
+        next_cursor = None
+        if cursor is not None:
+            total, total_estimated = pagination.count_total(query, db_models.SaleOrder, total_mode)
+            orders, next_cursor = pagination.keyset_page(
+                query, sort_column, db_models.SaleOrder.id, sort_order == "desc",
+                cursor, page_size, sort_column.key)
+        else:
+            orders, total, total_estimated = pagination.offset_page(
+                query, db_models.SaleOrder, page, page_size, total_mode)
     
-    # 构建响应
-    items = []
-    for order in orders:
-        # 获取操作员信息
-        operator = db.query(db_models.User).filter_by(employee_id=order.operator_id).first()
-        operator_name = operator.true_name if operator else None
+        # 构建响应
+        items = []
+        for order in orders:
+            operator_name = order.operator.true_name if order.operator else None
         
-        items.append(
-            SaleOrderListItem(
-                id=order.id,
-                transaction_no=order.transaction_no,
-                created_at=order.created_at,
-                total_amount=float(order.total_amount),
-                payment_method=order.payment_method,
-                operator_id=order.operator_id,
-                operator_name=operator_name
+            items.append(
+                SaleOrderListItem(
+                    id=order.id,
+                    transaction_no=order.transaction_no,
+                    created_at=order.created_at,
+                    total_amount=float(order.total_amount),
+                    payment_method=order.payment_method,
+                    operator_id=order.operator_id,
+                    operator_name=operator_name
+                )
             )
+        # with open(r"D:\Projects\DataBase\debug.txt","w") as f:
+        #     f.write(f"\n123{[SaleOrderListItem.from_orm(order) for order in orders]}\n")
+        #     f.flush()
+    
+        return PaginatedSaleOrderResponse(
+            total=total,
+            page=page,
+            page_size=page_size,
+            next_cursor=next_cursor,
+            total_estimated=total_estimated,
+            data=items
         )
-    # with open(r"D:\Projects\DataBase\debug.txt","w") as f:
-    #     f.write(f"\n123{[SaleOrderListItem.from_orm(order) for order in orders]}\n")
-    #     f.flush()
-    
-    return PaginatedSaleOrderResponse(
-        total=total,
-        page=page,
-        page_size=page_size,
-        data=items
-    )
+
+    return await read_db.run_sync(run)
 
 @router.get("/{order_id}", response_model=SaleOrderDetail)
-def get_sale_order_detail(
+async def get_sale_order_detail(
     order_id: int,
-    db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    request: Request,
+    response: Response,
+    read_db: ReadSession = Depends(get_read_db),
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
 ):
     """
     获取销售订单详情
     """
-    # 查询订单
-    order = db.query(db_models.SaleOrder).filter_by(id=order_id).first()
+    isbns = _order_isbns.get(order_id)
+    if isbns is not None:
+        not_modified = etag.check(request, response, *_detail_etag_parts(order_id, isbns))
+        if not_modified:
+            return not_modified
+        return await read_db.run_sync(_get_sale_order_detail, order_id)
+
+    # 第一次查询该订单：查出订单项后才能确定ETag，期间有写入提交时不返回ETag
+    sequence = change_tracking.commit_sequence()
+    result = await read_db.run_sync(_get_sale_order_detail, order_id)
+    isbns = tuple(sorted({item["book_isbn"] for item in result["items"]}))
+    if change_tracking.commit_sequence() == sequence:
+        _order_isbns.set(order_id, isbns)
+        not_modified = etag.check(request, response, *_detail_etag_parts(order_id, isbns))
+        if not_modified:
+            return not_modified
+    return result
+
+
+def _detail_etag_parts(order_id: int, isbns: tuple) -> tuple:
+    """订单行、图书行（书名）与用户表（操作员姓名）的版本号"""
+    return ("sale_order", order_id,
+            change_tracking.row_version(db_models.SaleOrder.__tablename__, order_id),
+            change_tracking.table_version(db_models.User.__tablename__),
+            [change_tracking.row_version(db_models.Book.__tablename__, isbn) for isbn in isbns])
+
+def _get_sale_order_detail(db: Session, order_id: int) -> dict:
+    # 查询订单，操作员、订单项及其书籍在同一条语句中连接取出
+    order = (db.query(db_models.SaleOrder)
+             .options(joinedload(db_models.SaleOrder.operator),
+                      joinedload(db_models.SaleOrder.sold_items).joinedload(db_models.SaleItem.book))
+             .filter_by(id=order_id)
+             .first())
     if not order:
         raise HTTPException(status_code=404, detail=f"订单ID {order_id} 不存在")
     
-    # 查询操作员姓名
-    operator = db.query(db_models.User).filter_by(employee_id=order.operator_id).first()
-    operator_name = operator.true_name if operator else None
+    operator_name = order.operator.true_name if order.operator else None
     
     # 查询订单项
     items = []
     for item in order.sold_items:
-        # 查询书籍信息
-        book = db.query(db_models.Book).filter_by(isbn=item.book_isbn).first()
-        book_title = book.title if book else None
+        book_title = item.book.title if item.book else None
         
         item_data = {
             "id": item.id,
@@ -284,7 +275,7 @@ def update_sale_order(
     order_id: int,
     order_update: SaleOrderUpdate,
     db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
 ):
     """
     更新销售订单信息（仅支持更新支付方式和备注）
@@ -308,13 +299,13 @@ def update_sale_order(
         raise HTTPException(status_code=500, detail=f"更新订单失败: {str(e)}")
     
     # 返回更新后的订单详情
-    return get_sale_order_detail(order_id, db, current_user)
+    return _get_sale_order_detail(db, order_id)
 
 @router.delete("/{order_id}")
 def delete_sale_order(
     order_id: int,
     db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth.Auth.get_current_user)
+    current_user: db_models.User = Depends(auth.Auth.get_current_user_async)
 ):
     """
     删除销售订单（软删除，标记为已删除）
@@ -346,6 +337,8 @@ def delete_sale_order(
         # 删除订单
         db.delete(order)
         db.commit()
+        # SQLite可能把该ID分配给新订单，不能沿用旧订单的ISBN计算ETag
+        _order_isbns.pop(order_id)
         
         return {"message": f"订单ID {order_id} 已成功删除"}
     except Exception as e:
@@ -353,8 +346,10 @@ def delete_sale_order(
         raise HTTPException(status_code=500, detail=f"删除订单失败: {str(e)}")
 
 def generate_transaction_no():
-    """生成交易流水号"""
+    """
+    生成交易流水号：SO + 年月日时分秒 + 10位全局序号。
+    序号由数据库按号段分配，多线程、多进程同一秒内下单也不会重复（见server/sequence.py）
+    """
     now = datetime.now()
     date_str = now.strftime("%Y%m%d%H%M%S")
-    rand_str = ''.join(random.choices(string.digits, k=6))
-    return f"SO{date_str}{rand_str}"
\ No newline at end of file
+    return f"SO{date_str}{sequence.transaction_no_sequence.next():010d}"
\ No newline at end of file
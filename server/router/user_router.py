@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException,Query,status
 from sqlalchemy.orm import Session
 from server import db_models, auth
-from server.database import get_db
+from server.database import get_db, get_read_db, ReadSession
 from typing import Optional
 from server.schemas.user_schemas import LoginRequest, LoginResponse, LogoutResponse,UserCreate, UserResponse, PaginatedUserResponse,UserUpdateRequest, AdminUserUpdateRequest
 from datetime import datetime, timedelta, timezone
 from sqlalchemy import desc, asc
 import json
+from server import pagination
 router = APIRouter(tags=["users"])
 
 # 后续必须要禁用，这是默认管理员注册
@@ -15,6 +16,10 @@ async def create_default_admin(
     db: Session = Depends(get_db)
 )->UserResponse:
     """创建默认的超级管理员账户"""
+    return await auth.run_in_auth_executor(_create_default_admin, db)
+
+# 密码哈希和数据库操作都是阻塞的，以下_开头的函数均在认证线程池中执行
+def _create_default_admin(db: Session)->UserResponse:
     with open(r'./server/dat/user_default.json', 'r', encoding='utf-8') as file:
         info = json.load(file)
     if not info["accessible"]:
@@ -72,6 +77,9 @@ async def create_user(
     request: UserCreate,
     db: Session = Depends(get_db)
 )->UserResponse:
+    return await auth.run_in_auth_executor(_create_user, request, db)
+
+def _create_user(request: UserCreate, db: Session)->UserResponse:
     user = db.query(db_models.User).filter(db_models.User.username == request.username).first()
     if user:
         raise HTTPException(status_code=400, detail="用户名已存在")
@@ -112,11 +120,9 @@ async def delete_user(
             raise HTTPException(status_code=404, detail="用户不存在")
         if user.isSuperAdmin:
             raise HTTPException(status_code=403, detail="无法删除超级管理员")
-        loginedUser=db.query(db_models.LoginedUser).filter(db_models.LoginedUser.username == username).first()
         db.delete(user)
-        if (loginedUser):
-            db.delete(loginedUser)
         db.commit()
+        auth.Auth.end_user_sessions(username)
         return UserResponse(
             username=user.username,
             employee_id=user.employee_id,
@@ -135,6 +141,9 @@ async def delete_user(
 @router.post("/login",response_model=LoginResponse)
 async def login(request: LoginRequest, 
                 db: Session = Depends(get_db))->LoginResponse:
+    return await auth.run_in_auth_executor(_login, request, db)
+
+def _login(request: LoginRequest, db: Session)->LoginResponse:
     try:
         user = db.query(db_models.User).filter(db_models.User.username == request.username).first()
     except Exception as e:
@@ -150,13 +159,21 @@ async def login(request: LoginRequest,
             request.password, user.password_hash):
         
         raise HTTPException(status_code=401, detail="无效的用户名或密码")
+    # 旧的MD5哈希或迭代次数已调整的哈希，登录成功时透明地重新哈希
+    if auth.Auth.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = auth.Auth.get_password_hash(request.password)
+            db.commit()
+            db.refresh(user)
+        except Exception:
+            db.rollback()
     # with open(r"D:\Projects\DataBase\debug.txt","a") as f:
     #         f.write(f"Here!\n")
     #         f.flush()
     try:
     # 账号密码验证通过后，生成token并返回
         expire =datetime.now(timezone.utc) + timedelta(hours=8)
-        access_token= auth.Auth.create_access_token(db,user)
+        access_token= auth.Auth.create_access_token(user)
     except Exception as e:
         # with open(r"D:\Projects\DataBase\debug.txt","a") as f:
         #         f.write(f"{str(e)}")
@@ -176,14 +193,12 @@ async def login(request: LoginRequest,
             ))
 ## 已完成注销接口
 @router.post("/logout",response_model=LogoutResponse)
-async def logout(logined_user: db_models.LoginedUser=Depends(auth.Auth.get_current_user),
-                 db: Session = Depends(get_db))->LogoutResponse:
+async def logout(logined_user: db_models.LoginedUser=Depends(auth.Auth.get_current_user_async))->LogoutResponse:
     # with open(r"D:\Projects\DataBase\debug.txt","a") as f:
     #     f.write(f"12345\n")
     #     f.flush()
     try:
-        db.delete(logined_user)
-        db.commit()
+        auth.Auth.end_session(logined_user.token)
         return LogoutResponse(message= "注销成功")
     except Exception as e:
         # with open(r"D:\Projects\DataBase\debug.txt","a") as f:
@@ -193,18 +208,26 @@ async def logout(logined_user: db_models.LoginedUser=Depends(auth.Auth.get_curre
 ## 已完成获取当前用户信息接口
 @router.get("/me",response_model=UserResponse)
 async def get_current_user_info(
-    logined_user: db_models.LoginedUser=Depends(auth.Auth.get_current_user),
-    db: Session = Depends(get_db)
+    logined_user: db_models.LoginedUser=Depends(auth.Auth.get_current_user_async),
+    read_db: ReadSession = Depends(get_read_db)
 )->UserResponse:
-    myself=db.query(db_models.User).filter(db_models.User.username == logined_user.username).first()
-    return UserResponse(
-        username= myself.username,
-        employee_id= myself.employee_id,
-        true_name=myself.true_name, 
-        gender=myself.gender, 
-        age=myself.age,
-        isSuperAdmin=myself.isSuperAdmin
-    )
+    def run(db: Session) -> UserResponse:
+        myself=db.query(db_models.User).filter(db_models.User.username == logined_user.username).first()
+        return UserResponse(
+            username= myself.username,
+            employee_id= myself.employee_id,
+            true_name=myself.true_name, 
+            gender=myself.gender, 
+            age=myself.age,
+            isSuperAdmin=myself.isSuperAdmin
+        )
+
+    return await read_db.run_sync(run)
+
+## 登录令牌缓存命中统计
+@router.get("/users/token_cache/stats", dependencies=[Depends(auth.Auth.admin_required)])
+async def get_token_cache_stats() -> dict:
+    return auth.token_cache.stats()
 
 ## 已完成获取所有用户信息接口
 @router.get("/users/all", response_model=PaginatedUserResponse,dependencies=[Depends(auth.Auth.admin_required)])
@@ -227,71 +250,88 @@ async def get_all_users(
     # 分页参数
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(10, ge=1, le=100, description="每页数量"),
+    cursor: Optional[str] = Query(None, description=pagination.CURSOR_DESCRIPTION),
     
-    db: Session = Depends(get_db)
+    read_db: ReadSession = Depends(get_read_db)
 )->PaginatedUserResponse:
-    # 基础查询
-    query = db.query(db_models.User)
+    def run(db: Session) -> PaginatedUserResponse:
+        # 基础查询
+        query = db.query(db_models.User)
     
-    # 应用筛选条件
-    if username:
-        if exact_username:
-            query = query.filter(db_models.User.username == username)
-        else:
-            query = query.filter(db_models.User.username.contains(username))
-    if employee_id:
-        if exact_employee_id:
-            query = query.filter(db_models.User.employee_id == employee_id)
-        else:
-            query = query.filter(db_models.User.employee_id.contains(employee_id))
-    if true_name:
-        if exact_true_name:
-            query = query.filter(db_models.User.true_name == true_name)
-        else:
-            query = query.filter(db_models.User.true_name.contains(true_name))
-    if gender:
-        query = query.filter(db_models.User.gender == gender)
-    if min_age is not None:
-        query = query.filter(db_models.User.age >= min_age)
-    if max_age is not None:
-        query = query.filter(db_models.User.age <= max_age)
+        # 应用筛选条件
+        if username:
+            if exact_username:
+                query = query.filter(db_models.User.username == username)
+            else:
+                query = query.filter(db_models.User.username.contains(username))
+        if employee_id:
+            if exact_employee_id:
+                query = query.filter(db_models.User.employee_id == employee_id)
+            else:
+                query = query.filter(db_models.User.employee_id.contains(employee_id))
+        if true_name:
+            if exact_true_name:
+                query = query.filter(db_models.User.true_name == true_name)
+            else:
+                query = query.filter(db_models.User.true_name.contains(true_name))
+        if gender:
+            query = query.filter(db_models.User.gender == gender)
+        if min_age is not None:
+            query = query.filter(db_models.User.age >= min_age)
+        if max_age is not None:
+            query = query.filter(db_models.User.age <= max_age)
     
-    # 应用排序
-    if sort_by:
-        if sort_by=="username":
-            column=db_models.User.username
-        elif sort_by=="age":
-            column=db_models.User.age
-        else :
-            column=db_models.User.employee_id
-        query = query.order_by(desc(column)if sort_order=='desc' else asc(column))
+        # 应用排序
+        if sort_by:
+            if sort_by=="username":
+                column=db_models.User.username
+            elif sort_by=="age":
+                column=db_models.User.age
+            else :
+                column=db_models.User.employee_id
+            query = query.order_by(desc(column)if sort_order=='desc' else asc(column))
     
-    # 分页处理
-    total = query.count()
-    users = query.offset((page - 1) * page_size).limit(page_size).all()
+        # 分页处理
+        total = query.count()
+        next_cursor = None
+        if cursor is not None:
+            users, next_cursor = pagination.keyset_page(
+                query, column if sort_by else None, db_models.User.username,
+                bool(sort_by) and sort_order == "desc", cursor, page_size,
+                column.key if sort_by else "username")
+        else:
+            users = query.offset((page - 1) * page_size).limit(page_size).all()
     
-    # 构建响应
-    return PaginatedUserResponse(
-        total=total,
-        page=page,
-        page_size=page_size,
-        items=[
-        UserResponse(
-            username=user.username,
-            employee_id=user.employee_id,
-            true_name=user.true_name,
-            gender=user.gender,
-            age=user.age,
-            isSuperAdmin=user.isSuperAdmin
-        ) for user in users]
-    )
+        # 构建响应
+        return PaginatedUserResponse(
+            total=total,
+            page=page,
+            page_size=page_size,
+            next_cursor=next_cursor,
+            items=[
+            UserResponse(
+                username=user.username,
+                employee_id=user.employee_id,
+                true_name=user.true_name,
+                gender=user.gender,
+                age=user.age,
+                isSuperAdmin=user.isSuperAdmin
+            ) for user in users]
+        )
+
+    return await read_db.run_sync(run)
 
 @router.patch("/me", response_model=UserResponse)
 async def update_current_user(
     update_data: UserUpdateRequest,
-    current_user: db_models.LoginedUser = Depends(auth.Auth.get_current_user),
+    current_user: db_models.LoginedUser = Depends(auth.Auth.get_current_user_async),
     db: Session = Depends(get_db)
 ) -> UserResponse:
+    return await auth.run_in_auth_executor(_update_current_user, update_data, current_user, db)
+
+def _update_current_user(update_data: UserUpdateRequest,
+                         current_user: db_models.LoginedUser,
+                         db: Session)->UserResponse:
     # 获取数据库用户对象
     db_user = db.query(db_models.User).filter(
         db_models.User.username == current_user.username
@@ -351,16 +391,11 @@ async def update_current_user(
             detail=f"无效的性别选项，可选值：{', '.join(valid_genders)}"
         )
 
-    if update_dict:
-        db.query(db_models.LoginedUser).filter(
-            db_models.LoginedUser.username == current_user.username
-        ).update({
-            db_models.LoginedUser.username: db_user.username,
-            db_models.LoginedUser.employee_id: db_user.employee_id,
-            db_models.LoginedUser.isSuperAdmin: db_user.isSuperAdmin
-        })
     try:
         db.commit()
+        # 同步会话存储中的用户信息
+        if update_dict:
+            auth.Auth.refresh_user_sessions(current_user.username, db_user)
         db.refresh(db_user)
         return UserResponse(
             username=db_user.username,
@@ -383,6 +418,9 @@ async def update_user(
     update_data: AdminUserUpdateRequest,
     db: Session = Depends(get_db)
 ) -> UserResponse:
+    return await auth.run_in_auth_executor(_update_user, username, update_data, db)
+
+def _update_user(username: str, update_data: AdminUserUpdateRequest, db: Session)->UserResponse:
     # 获取数据库用户对象
     db_user = db.query(db_models.User).filter(
         db_models.User.username == username
@@ -419,22 +457,11 @@ async def update_user(
             detail=f"无效的性别选项，可选值：{', '.join(valid_genders)}"
         )
     
-    # 更新登录用户表中的相关信息
-    logined_user = db.query(db_models.LoginedUser).filter(
-        db_models.LoginedUser.username == username
-    ).first()
-    
-    if logined_user and update_dict:
-        db.query(db_models.LoginedUser).filter(
-            db_models.LoginedUser.username == username
-        ).update({
-            db_models.LoginedUser.username: db_user.username,
-            db_models.LoginedUser.employee_id: db_user.employee_id,
-            db_models.LoginedUser.isSuperAdmin: db_user.isSuperAdmin
-        })
-    
     try:
         db.commit()
+        # 同步会话存储中的用户信息
+        if update_dict:
+            auth.Auth.refresh_user_sessions(username, db_user)
         db.refresh(db_user)
         return UserResponse(
             username=db_user.username,
@@ -11,7 +11,9 @@ class BillDetail(BaseModel):
     operator_id: Optional[str]
 
 class PaginatedBillResponse(BaseModel):
-    total: int
+    total: Optional[int]  # total_mode=none时为None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None  # 游标分页时下一页的游标，没有下一页为None
+    total_estimated: bool = False  # total是否为稍旧的缓存值（total_mode=estimated）
     items: List[BillDetail]
\ No newline at end of file
@@ -1,5 +1,5 @@
-from typing import List, Optional
-from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field, model_validator
 
 class BookBase(BaseModel):
     isbn: str = Field(..., 
@@ -34,8 +34,79 @@ class BookUpdateRequest(BaseModel):
     retail_price: Optional[float] = Field(None, gt=0)
     stock: Optional[int] = Field(None, ge=0)
 
+class FacetCount(BaseModel):
+    value: Optional[str]  # 出版社/作者为空时为None
+    count: int
+
 class PaginatedBookResponse(BaseModel):
-    total: int
+    total: Optional[int]  # total_mode=none时为None
     page: int
     page_size: int
-    data: List[BookResponse]
\ No newline at end of file
+    next_cursor: Optional[str] = None  # 游标分页时下一页的游标，没有下一页为None
+    total_estimated: bool = False  # total是否为稍旧的缓存值（total_mode=estimated）
+    data: List[BookResponse]
+    facets: Optional[Dict[str, List[FacetCount]]] = None  # facets=true时返回
+
+class BookSuggestion(BaseModel):
+    value: str
+    field: str  # title/author/publisher
+    count: int  # 使用该取值的图书数
+
+class BookRowError(BaseModel):
+    row: Optional[int] = None  # 数据行序号，从1开始，CSV不含表头；按条件批量调价时为空
+    isbn: Optional[str] = None
+    error: str
+
+class BookImportResult(BaseModel):
+    total_rows: int
+    imported: int  # 新增的图书数
+    updated: int  # on_conflict=update时覆盖的已有图书数
+    skipped: int
+    error_count: int
+    errors: List[BookRowError]  # 最多列出BOOK_IMPORT_MAX_ERRORS条
+
+class BookPatch(BookUpdateRequest):
+    isbn: str = Field(..., min_length=13, max_length=13, pattern="^[0-9]*$")
+
+class BookFilter(BaseModel):
+    """筛选条件，含义与GET /books/的同名参数相同"""
+    isbn: Optional[str] = Field(None, pattern="^[0-9]*$")
+    exact_isbn: bool = False
+    title: Optional[str] = None
+    exact_title: bool = False
+    author: Optional[str] = None
+    exact_author: bool = False
+    publisher: Optional[str] = None
+    exact_publisher: bool = False
+    min_retail_price: Optional[float] = Field(None, ge=0)
+    max_retail_price: Optional[float] = Field(None, ge=0)
+    min_stock: Optional[int] = Field(None, ge=0)
+    max_stock: Optional[int] = Field(None, ge=0)
+
+class BookBatchUpdateRequest(BaseModel):
+    # 方式一：逐本修改，每项格式同BookPatch（isbn加上BookUpdateRequest的字段），按行单独校验
+    items: Optional[List[Dict[str, Any]]] = None
+    # 方式二：按筛选条件调整零售价，例如10表示涨价10%，-20表示降价20%
+    filter: Optional[BookFilter] = None
+    price_change_percent: Optional[float] = Field(None, gt=-100)
+
+    @model_validator(mode="after")
+    def check_mode(self):
+        if (self.items is None) == (self.price_change_percent is None):
+            raise ValueError("items和price_change_percent必须且只能指定一个")
+        if self.filter is not None and self.items is not None:
+            raise ValueError("filter只能与price_change_percent一起使用")
+        return self
+
+class BookBatchUpdateResult(BaseModel):
+    updated: int
+    error_count: int
+    errors: List[BookRowError]  # row为items中的序号（从1开始），按条件调价时为空
+
+class BookBatchDeleteRequest(BaseModel):
+    isbns: List[str] = Field(..., min_length=1)
+
+class BookBatchDeleteResult(BaseModel):
+    deleted: int
+    error_count: int
+    errors: List[BookRowError]  # row为isbns中的序号（从1开始）
@@ -36,9 +36,11 @@ class PurchaseOrderDetail(BaseModel):
     operator_id3: Optional[str]=None
 
 class PaginatedPurchaseResponse(BaseModel):
-    total: int
+    total: Optional[int]  # total_mode=none时为None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None  # 游标分页时下一页的游标，没有下一页为None
+    total_estimated: bool = False  # total是否为稍旧的缓存值（total_mode=estimated）
     items: List[PurchaseOrderDetail]
 
 class PaymentResponse(BaseModel):
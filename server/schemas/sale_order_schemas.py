@@ -54,9 +54,11 @@ class SaleOrderListItem(BaseModel):
 # 分页响应
 class PaginatedSaleOrderResponse(BaseModel):
     data: List[SaleOrderListItem]
-    total: int
+    total: Optional[int]  # total_mode=none时为None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None  # 游标分页时下一页的游标，没有下一页为None
+    total_estimated: bool = False  # total是否为稍旧的缓存值（total_mode=estimated）
 
 # 销售订单查询参数
 class SaleOrderQueryParams(BaseModel):
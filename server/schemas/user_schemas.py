@@ -23,6 +23,7 @@ class PaginatedUserResponse(BaseModel):
     total: int
     page: int
     page_size: int
+    next_cursor: Optional[str] = None  # 游标分页时下一页的游标，没有下一页为None
     items: List[UserResponse]
 
 class LoginRequest(BaseModel):
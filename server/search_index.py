@@ -0,0 +1,103 @@
+"""
+图书全文检索（SQLite FTS5）。
+
+books_fts以ISBN的整数值作为rowid，保存书名、作者、出版社。unicode61分词器会把
+连续的汉字当成一个词，因此写入和查询前都把中日文字符逐字用空格隔开，
+查询时连续的汉字组成短语（要求相邻且有序），相当于按子串匹配中文。
+只修改库存、价格等其他列时不需要更新索引。
+"""
+import re
+from typing import Optional
+from sqlalchemy import Column, Integer, MetaData, Table, Text, bindparam, func, literal_column, text
+from sqlalchemy.engine import Connection
+from server import change_tracking
+from server.db_models import Book
+
+FTS_TABLE = "books_fts"
+
+books_fts = Table(
+    FTS_TABLE, MetaData(),
+    Column("rowid", Integer, primary_key=True),
+    Column("title", Text),
+    Column("author", Text),
+    Column("publisher", Text),
+)
+
+# 写入索引的列，只有这些列变化时才同步
+INDEXED_COLUMNS = ("isbn", "title", "author", "publisher")
+
+# bm25权重：书名 > 作者 > 出版社
+_BM25_WEIGHTS = (10.0, 5.0, 2.0)
+
+# 汉字（含扩展A、兼容汉字）、日文假名
+CJK_CHARS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_CJK_RE = re.compile(f"([{CJK_CHARS}])")
+# 查询词：连续的中日文字符，或连续的其他字母数字
+_QUERY_TOKEN_RE = re.compile(f"[{CJK_CHARS}]+|[^\\W_{CJK_CHARS}]+")
+
+
+def segment(value: Optional[str]) -> str:
+    """把中日文字符逐字隔开，使unicode61分词器按字切分"""
+    if not value:
+        return ""
+    return _CJK_RE.sub(r" \1 ", value)
+
+
+def build_match_query(keywords: str) -> Optional[str]:
+    """
+    用户输入 -> FTS5查询语句：连续汉字组成短语，其他词按前缀匹配，各部分之间为AND。
+    输入中没有可检索的字符时返回None。
+    """
+    terms = []
+    for token in _QUERY_TOKEN_RE.findall(keywords):
+        if _CJK_RE.match(token):
+            terms.append('"' + " ".join(token) + '"')
+        else:
+            terms.append('"' + token.replace('"', '""') + '"*')
+    return " ".join(terms) or None
+
+
+def create_index(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+        "USING fts5(title, author, publisher, tokenize='unicode61')"
+    )
+
+
+def _row(book: dict) -> dict:
+    return {
+        "rowid": int(book["isbn"]),
+        "title": segment(book["title"]),
+        "author": segment(book["author"]),
+        "publisher": segment(book["publisher"]),
+    }
+
+
+def rebuild_index(conn: Connection, batch_size: int = 5000) -> None:
+    """按books表全量重建全文索引"""
+    conn.execute(books_fts.delete())
+    table = Book.__table__
+    result = conn.execution_options(yield_per=batch_size).execute(
+        table.select().with_only_columns(table.c.isbn, table.c.title, table.c.author, table.c.publisher))
+    for rows in result.partitions():
+        conn.execute(books_fts.insert(), [_row(row._mapping) for row in rows])
+
+
+@change_tracking.on_books_flushed(columns=INDEXED_COLUMNS)
+def sync_index(conn: Connection, changes: change_tracking.BookChanges) -> None:
+    """在同一事务内同步books_fts"""
+    conn.execute(books_fts.delete().where(books_fts.c.rowid == bindparam("id")),
+                 [{"id": int(isbn)} for isbn in changes])
+    rows = [_row(book) for book in changes.values() if book is not None]
+    if rows:
+        conn.execute(books_fts.insert(), rows)
+
+
+def apply_search(query, match_query: str, order_by_rank: bool):
+    """给图书查询加上全文检索条件，可选按相关度排序"""
+    fts = literal_column(FTS_TABLE)
+    query = query.join(books_fts, Book.isbn == func.printf("%013d", books_fts.c.rowid))
+    query = query.filter(text(f"{FTS_TABLE} MATCH :fts_query").bindparams(fts_query=match_query))
+    if order_by_rank:
+        query = query.order_by(func.bm25(fts, *_BM25_WEIGHTS))
+    return query
@@ -0,0 +1,44 @@
+"""
+数据库号段分配的全局递增序号，用于交易流水号等需要唯一的编号。
+
+每个进程一次从sequences表领取一段连续的序号（一条UPSERT ... RETURNING，单独提交），
+之后在进程内用锁逐个发放，用完再领下一段。不同进程、线程拿到的序号不会重复；
+同一进程内序号严格递增，多个进程之间只按号段大致递增。
+"""
+import threading
+from sqlalchemy.dialects.sqlite import insert
+from server import config
+from server.database import engine
+from server.db_models import Sequence
+
+
+class BlockSequence:
+    def __init__(self, name: str, block_size: int):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0  # 当前号段的上界（不含）
+
+    def _allocate(self) -> int:
+        """领取下一段序号，返回该段的上界"""
+        table = Sequence.__table__
+        stmt = (insert(table).values(name=self.name, next_value=self.block_size + 1)
+                .on_conflict_do_update(index_elements=[table.c.name],
+                                       set_={"next_value": table.c.next_value + self.block_size})
+                .returning(table.c.next_value))
+        with engine.begin() as conn:
+            return conn.execute(stmt).scalar_one()
+
+    def next(self) -> int:
+        """下一个序号（从1开始）；号段用完时会写数据库，不要在持有业务数据库写事务的线程中调用"""
+        with self._lock:
+            if self._next >= self._end:
+                self._end = self._allocate()
+                self._next = self._end - self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+
+transaction_no_sequence = BlockSequence("transaction_no", config.TRANSACTION_NO_BLOCK_SIZE)
@@ -0,0 +1,161 @@
+"""
+搜索框输入提示：按前缀补全书名、作者、出版社。
+
+启动时从books表加载到内存，各取值按小写排序，分块保存（每块不超过2*_BLOCK_SIZE个），
+用二分查找定位前缀范围；之后由change_tracking在图书变更提交后增量更新，不查询数据库。
+分块使插入只需移动所在块的元素，批量导入时也不必复制整个数组。
+每个取值记录使用它的图书数，提示按图书数从多到少排列。
+"""
+import bisect
+import heapq
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import select
+from server import change_tracking
+from server.cache import LRUCache
+from server.database import SessionLocal
+from server.db_models import Book
+
+FIELDS = ("title", "author", "publisher")
+_LOAD_BATCH_SIZE = 5000
+_BLOCK_SIZE = 1000
+# 一次新增的取值超过该数量时（启动加载、大批量导入）整体重新排序分块
+_REBUILD_THRESHOLD = 50000
+
+Key = Tuple[str, str, str]  # (小写值, 字段, 原值)
+
+
+class PrefixIndex:
+    """书名/作者/出版社的分块有序数组，按前缀查找"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blocks: List[List[Key]] = []  # 各块内有序，块之间也有序
+        self._maxes: List[Key] = []  # 各块的最后一个元素
+        self._size = 0
+        self._counts: Dict[Tuple[str, str], int] = {}  # (字段, 原值) -> 图书数
+        self._books: Dict[str, Tuple[Optional[str], ...]] = {}  # ISBN -> 各字段的值，用于减去旧值
+        self._stale = 0  # _keys中图书数已减为0、等待清理的条目数
+        # 同一前缀的查询结果，索引有变化时清空
+        self._results = LRUCache(1024)
+
+    def _add(self, values: Tuple[Optional[str], ...], new_keys: set) -> None:
+        for field, value in zip(FIELDS, values):
+            if not value:
+                continue
+            key = (field, value)
+            count = self._counts.get(key)
+            if count is None:
+                new_keys.add((value.lower(), field, value))
+            elif count == 0:
+                self._stale -= 1
+            self._counts[key] = (count or 0) + 1
+
+    def _remove(self, values: Tuple[Optional[str], ...]) -> None:
+        for field, value in zip(FIELDS, values):
+            if not value:
+                continue
+            key = (field, value)
+            self._counts[key] -= 1
+            if self._counts[key] == 0:
+                self._stale += 1
+
+    def _rebuild(self, keys: List[Key]) -> None:
+        keys.sort()
+        self._blocks = [keys[i:i + _BLOCK_SIZE] for i in range(0, len(keys), _BLOCK_SIZE)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._size = len(keys)
+
+    def _insert(self, key: Key) -> None:
+        if not self._blocks:
+            self._blocks, self._maxes = [[key]], [key]
+            self._size = 1
+            return
+        i = min(bisect.bisect_left(self._maxes, key), len(self._blocks) - 1)
+        block = self._blocks[i]
+        bisect.insort(block, key)
+        self._maxes[i] = block[-1]
+        if len(block) > 2 * _BLOCK_SIZE:
+            self._blocks[i:i + 1] = [block[:_BLOCK_SIZE], block[_BLOCK_SIZE:]]
+            self._maxes[i:i + 1] = [block[_BLOCK_SIZE - 1], block[-1]]
+        self._size += 1
+
+    def _insert_keys(self, new_keys: set) -> None:
+        if len(new_keys) > _REBUILD_THRESHOLD:
+            self._rebuild([key for block in self._blocks for key in block] + list(new_keys))
+        else:
+            for key in new_keys:
+                self._insert(key)
+        # 已无图书使用的取值超过四分之一时重建
+        if self._stale > self._size // 4:
+            self._counts = {key: count for key, count in self._counts.items() if count}
+            self._rebuild([key for block in self._blocks for key in block if key[1:] in self._counts])
+            self._stale = 0
+
+    def _range(self, prefix: str) -> Iterator[Key]:
+        """小写值以prefix开头的所有条目"""
+        start = (prefix,)
+        i = bisect.bisect_left(self._maxes, start)
+        if i == len(self._blocks):
+            return
+        position = bisect.bisect_left(self._blocks[i], start)
+        for block in self._blocks[i:]:
+            for key in block[position:]:
+                if not key[0].startswith(prefix):
+                    return
+                yield key
+            position = 0
+
+    def update(self, books: Iterable[Tuple[str, Optional[dict]]]) -> None:
+        """books为(ISBN, 图书当前各列的值)，已删除的图书为None"""
+        new_keys: set = set()
+        with self._lock:
+            for isbn, book in books:
+                old = self._books.pop(isbn, None)
+                if old is not None:
+                    self._remove(old)
+                if book is not None:
+                    values = tuple(book[field] for field in FIELDS)
+                    self._books[isbn] = values
+                    self._add(values, new_keys)
+            self._insert_keys(new_keys)
+            self._results.clear()
+
+    def suggest(self, prefix: str, limit: int, field: Optional[str] = None) -> List[dict]:
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        cache_key = (prefix, limit, field)
+        with self._lock:
+            cached = self._results.get(cache_key)
+            if cached is not None:
+                return cached
+            matches = ((self._counts[key[1:]], key) for key in self._range(prefix)
+                       if field is None or key[1] == field)
+            top = heapq.nsmallest(limit, ((-count, key) for count, key in matches if count))
+            result = [{"value": value, "field": key_field, "count": -count}
+                      for count, (_, key_field, value) in top]
+            self._results.set(cache_key, result)
+        return result
+
+    def __len__(self) -> int:
+        return self._size - self._stale
+
+
+prefix_index = PrefixIndex()
+
+
+def warm() -> int:
+    """启动时从books表加载，返回不同取值的数量"""
+    table = Book.__table__
+    with SessionLocal() as db:
+        result = db.execute(select(table.c.isbn, table.c.title, table.c.author, table.c.publisher)
+                            .execution_options(yield_per=_LOAD_BATCH_SIZE))
+        # 一次性加入，只排序一次
+        prefix_index.update((row.isbn, row._asdict()) for rows in result.partitions() for row in rows)
+    return len(prefix_index)
+
+
+@change_tracking.on_books_committed
+def _on_books_committed(changes: change_tracking.BookChanges) -> None:
+    prefix_index.update(changes.items())
@@ -0,0 +1,122 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+# 避免导入server.auth时在当前目录创建默认的sessions.db
+os.environ.setdefault("BOOKSTORE_SESSION_BACKEND", "memory")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from server import auth, book_cache, database, db_models, migrations, pagination
+from server.router import book_router, sale_order_router
+
+# 进程内缓存，每个测试的数据库不同，开始前清空
+_CACHES = (book_cache.book_cache, book_router.search_cache, pagination.count_cache,
+           sale_order_router._order_isbns)
+
+# 直接引用SessionLocal/engine的模块，测试时一起替换为临时数据库
+_SESSION_MODULES = ("server.database", "server.checkout", "server.idempotency", "server.book_import",
+                    "server.book_cache", "server.suggest_index", "server.router.book_router")
+_ENGINE_MODULES = ("server.database", "server.sequence")
+
+
+@pytest.fixture
+def database_engine(tmp_path, monkeypatch):
+    """
+    临时数据库文件：建表并执行全部迁移（与server/main.py启动时相同），
+    并替换各模块中的engine/SessionLocal。
+    SQLite内存数据库的连接不能跨线程共享，而结账队列、线程池中的查询都在其他线程中执行，所以使用文件。
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", database._apply_sqlite_pragmas)
+    db_models.Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    for name in _SESSION_MODULES:
+        monkeypatch.setattr(f"{name}.SessionLocal", session_local)
+    for name in _ENGINE_MODULES:
+        monkeypatch.setattr(f"{name}.engine", engine)
+    for cache in _CACHES:
+        cache.clear()
+    async_engine = None
+    if database.AsyncSessionLocal is not None:
+        # BOOKSTORE_ASYNC_DB=1时只读查询走异步引擎，同样指向临时数据库
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        event.listen(async_engine.sync_engine, "connect", database._apply_sqlite_pragmas)
+        monkeypatch.setattr(database, "AsyncSessionLocal",
+                            async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False))
+    yield engine
+    engine.dispose()
+    if async_engine is not None:
+        async_engine.sync_engine.dispose()
+
+
+@pytest.fixture
+def operator(database_engine):
+    """测试用操作员，作为get_current_user的返回值"""
+    with database.SessionLocal() as db:
+        db.add(db_models.User(username="tester", employee_id="T001", true_name="测试员",
+                              gender="male", isSuperAdmin=True, password_hash="-"))
+        db.commit()
+    return SimpleNamespace(username="tester", employee_id="T001", isSuperAdmin=True)
+
+
+@pytest.fixture
+def add_books(database_engine):
+    """添加count本测试图书（ISBN从9780000000000起），返回ISBN列表"""
+    def add(count: int, stock: int, price: float = 10) -> list:
+        isbns = [f"978{i:010d}" for i in range(count)]
+        with database.SessionLocal() as db:
+            db.add_all(db_models.Book(isbn=isbn, title=f"书{i}", retail_price=price, stock=stock)
+                       for i, isbn in enumerate(isbns))
+            db.commit()
+        return isbns
+    return add
+
+
+@pytest.fixture
+def book_stock(database_engine):
+    def stock(isbn: str):
+        with database.SessionLocal() as db:
+            return db.get(db_models.Book, isbn).stock
+    return stock
+
+
+@pytest.fixture
+def client_factory(database_engine, operator):
+    """
+    用给定的路由创建测试客户端，当前用户固定为operator（或user）。
+    raise_server_exceptions=False时服务端异常以500返回；
+    sync_reads=True时只读查询也用同步会话，便于用statements统计语句。
+    """
+    def make(*routers, user=operator, raise_server_exceptions: bool = True, sync_reads: bool = False):
+        app = FastAPI()
+        for router in routers:
+            app.include_router(router)
+        app.dependency_overrides[auth.Auth.get_current_user] = lambda: user
+        app.dependency_overrides[auth.Auth.get_current_user_async] = lambda: user
+        if sync_reads:
+            async def read_db():
+                with database.SessionLocal() as db:
+                    yield database.ReadSession(db)
+            app.dependency_overrides[database.get_read_db] = read_db
+        return TestClient(app, raise_server_exceptions=raise_server_exceptions)
+    return make
+
+
+@pytest.fixture
+def statements(database_engine):
+    """记录执行的SQL语句"""
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(database_engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(database_engine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,49 @@
+import pytest
+
+from server import database, db_models
+from server.router import book_router
+
+
+@pytest.fixture
+def client(client_factory):
+    return client_factory(book_router.router)
+
+
+def _books() -> dict:
+    with database.SessionLocal() as db:
+        return {book.isbn: (book.title, book.retail_price, book.stock) for book in db.query(db_models.Book)}
+
+
+def test_patch_errors_in_row_order(client, add_books):
+    a, b = add_books(2, stock=1)
+    missing = "9789999999999"
+    response = client.post("/books/batch_update", json={"items": [
+        {"isbn": missing, "stock": 1},
+        {"isbn": a, "stock": 5},
+        {"isbn": "bad", "stock": 1},
+        {"isbn": b, "title": None},
+        {"isbn": b, "title": "新书名"},
+    ]})
+    result = response.json()
+    assert result["updated"] == 2
+    # “图书不存在”在逐行校验之后才检查，仍按行号排列
+    assert [(error["row"], error["isbn"]) for error in result["errors"]] == [
+        (1, missing), (3, "bad"), (4, b)]
+    assert _books()[a][2] == 5 and _books()[b][0] == "新书名"
+
+
+def test_price_change_reports_rejected_books(client, add_books):
+    cheap, normal = add_books(2, stock=1)
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, cheap).retail_price = 0.01
+        db.add(db_models.Book(isbn="9780000000009", title="无定价", stock=1))
+        db.commit()
+    response = client.post("/books/batch_update", json={"price_change_percent": -90})
+    result = response.json()
+    # 0.01降价90%后为0，不修改并记入errors；没有零售价的图书不变也不算错误
+    assert result["updated"] == 1
+    assert result["error_count"] == 1
+    assert result["errors"][0]["isbn"] == cheap and result["errors"][0]["row"] is None
+    books = _books()
+    assert float(books[cheap][1]) == 0.01 and float(books[normal][1]) == 1.0
+    assert books["9780000000009"][1] is None
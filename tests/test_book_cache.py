@@ -0,0 +1,58 @@
+import pytest
+
+from server import book_cache, cache, config, database, db_models
+from server.cache import LRUCache
+from server.router import book_router
+
+
+@pytest.fixture
+def client(client_factory):
+    return client_factory(book_router.router, sync_reads=True)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_warmed_entries_do_not_expire(client, add_books, statements, clock):
+    assert config.BOOK_CACHE_TTL == 0
+    isbns = add_books(3, stock=2)
+    assert book_cache.warm() == 3
+    clock[0] += 3600
+    statements.clear()
+    for isbn in isbns:
+        assert client.get(f"/books/{isbn}").json()["stock"] == 2
+    # 扫码全部命中缓存，不读库
+    assert statements == []
+
+
+def test_commit_updates_cached_entry(client, add_books, statements):
+    isbn, = add_books(1, stock=2)
+    book_cache.warm()
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, isbn).stock = 9
+        db.commit()
+    statements.clear()
+    assert client.get(f"/books/{isbn}").json()["stock"] == 9
+    assert statements == []
+    assert client.get("/books/9789999999999").status_code == 404
+    # 不存在的ISBN同样缓存
+    statements.clear()
+    assert client.get("/books/9789999999999").status_code == 404
+    assert statements == []
+
+
+def test_ttl_for_multiple_workers(client, database_engine, add_books, clock, monkeypatch):
+    monkeypatch.setattr(book_cache, "book_cache", LRUCache(config.BOOK_CACHE_SIZE, ttl=5))
+    isbn, = add_books(1, stock=2)
+    book_cache.warm()
+    # 模拟其他进程的修改：本进程的change_tracking看不到
+    with database_engine.begin() as conn:
+        conn.exec_driver_sql(f"UPDATE books SET stock = 7 WHERE isbn = '{isbn}'")
+    assert client.get(f"/books/{isbn}").json()["stock"] == 2
+    clock[0] += 6
+    assert client.get(f"/books/{isbn}").json()["stock"] == 7
+
@@ -0,0 +1,54 @@
+import pytest
+
+from server import database, db_models
+from server.router import book_router
+
+
+@pytest.fixture
+def client(client_factory):
+    return client_factory(book_router.router)
+
+
+def _add_history(sold: list, purchased: list) -> None:
+    """为sold中的书添加销售明细，为purchased中的书添加进货单"""
+    with database.SessionLocal() as db:
+        for isbn in sold:
+            db.add(db_models.SaleOrder(total_amount=30, operator_id="T001", sold_items=[
+                db_models.SaleItem(book_isbn=isbn, quantity=1, sold_price=10, total_amount=10)
+                for _ in range(3)]))
+        for isbn in purchased:
+            db.add(db_models.PurchaseOrder(book_isbn=isbn, quantity=1, purchase_price=5,
+                                           total_amount=5, operator_id="T001"))
+        db.commit()
+
+
+def test_referenced_isbns(database_engine, add_books):
+    isbns = add_books(5, stock=1)
+    _add_history(sold=isbns[:2], purchased=isbns[1:3])
+    with database.SessionLocal() as db:
+        assert book_router.referenced_isbns(db, isbns) == set(isbns[:3])
+        assert book_router.referenced_isbns(db, []) == set()
+
+
+def test_delete_book_with_sales_history(client, add_books):
+    sold, unused = add_books(2, stock=1)
+    _add_history(sold=[sold], purchased=[])
+    assert client.delete(f"/books/{sold}").status_code == 409
+    assert client.delete(f"/books/{unused}").status_code == 200
+    with database.SessionLocal() as db:
+        assert db.get(db_models.Book, sold) is not None
+        assert db.get(db_models.Book, unused) is None
+
+
+def test_batch_delete_reports_referenced(client, add_books):
+    # 超过一批引用检查的数量
+    isbns = add_books(book_router._PROBE_BATCH_SIZE + 50, stock=1)
+    sold, purchased = isbns[0], isbns[-1]
+    _add_history(sold=[sold], purchased=[purchased])
+    response = client.post("/books/batch_delete", json={"isbns": isbns})
+    assert response.status_code == 200
+    result = response.json()
+    assert result["deleted"] == len(isbns) - 2
+    assert {error["isbn"] for error in result["errors"]} == {sold, purchased}
+    with database.SessionLocal() as db:
+        assert db.query(db_models.Book).count() == 2
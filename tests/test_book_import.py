@@ -0,0 +1,90 @@
+import csv
+
+import pytest
+
+from server import book_import, config, database, db_models
+from server.router import book_router
+
+HEADER = "isbn,title,author,stock\r\n"
+
+
+@pytest.fixture
+def client(client_factory):
+    return client_factory(book_router.router)
+
+
+def _import(client, body: str, fmt: str = "csv", **params):
+    response = client.post("/books/import", params=params, content=body.encode("utf-8"),
+                           headers={"Content-Type": "text/csv" if fmt == "csv" else "application/x-ndjson"})
+    assert response.status_code == 200
+    return response.json()
+
+
+def _titles() -> dict:
+    with database.SessionLocal() as db:
+        return {book.isbn: book.title for book in db.query(db_models.Book)}
+
+
+@pytest.mark.parametrize("feed_lines", [1, 1000])
+def test_quoted_newlines_and_stray_quotes(client, monkeypatch, feed_lines):
+    # 每次只读入一行时，跨行的记录在读入下一行后重新解析
+    monkeypatch.setattr(book_import, "_FEED_LINES", feed_lines)
+    body = ("﻿" + HEADER +
+            '9780000000001,"第一行\r\n第二行",作者,1\r\n'
+            '9780000000002,12" Vinyl,"Doe, John",2\r\n'
+            '\r\n'
+            '9780000000003,"带""引号""的书名",,3')
+    result = _import(client, body)
+    assert result["total_rows"] == 3 and result["imported"] == 3 and result["error_count"] == 0
+    assert _titles() == {
+        "9780000000001": "第一行\r\n第二行",
+        "9780000000002": '12" Vinyl',
+        "9780000000003": '带"引号"的书名',
+    }
+
+
+def test_unterminated_quote_is_a_row_error(client, monkeypatch):
+    # 未闭合的引号吞掉后面的行，直到字段超过长度限制
+    limit = csv.field_size_limit(200)
+    try:
+        monkeypatch.setattr(book_import, "_FEED_LINES", 2)
+        rows = [f"97800000000{i:02d},书{i},,1\r\n" for i in range(20)]
+        body = HEADER + rows[0] + '9780000000099,"未闭合,,1\r\n' + "".join(rows[1:])
+        result = _import(client, body)
+    finally:
+        csv.field_size_limit(limit)
+    assert result["error_count"] >= 1
+    assert result["errors"][0]["row"] == 2 and result["errors"][0]["error"].startswith("CSV格式错误")
+    titles = _titles()
+    assert "9780000000000" in titles and "9780000000099" not in titles
+    # 出错的记录之后的行继续导入
+    assert "9780000000019" in titles
+
+
+def test_batches_commit_and_report_errors(client, add_books, monkeypatch):
+    monkeypatch.setattr(config, "BOOK_IMPORT_BATCH_SIZE", 2)
+    existing, = add_books(1, stock=1)
+    body = HEADER + "".join([
+        "9780000000101,书1,,1\r\n",
+        "978000000010X,书2,,1\r\n",
+        f"{existing},已有,,1\r\n",
+        "9780000000104,书4,,-1\r\n",
+        "9780000000105,书5,,1,多余的列\r\n",
+        "9780000000106,书6,,1\r\n",
+    ])
+    result = _import(client, body)
+    assert result["total_rows"] == 6 and result["imported"] == 2
+    assert [(error["row"], error["isbn"]) for error in result["errors"]] == [
+        (2, "978000000010X"), (3, existing), (4, "9780000000104"), (5, None)]
+    assert set(_titles()) == {existing, "9780000000101", "9780000000106"}
+
+    result = _import(client, HEADER + f"{existing},新书名,,5\r\n", on_conflict="update")
+    assert result["updated"] == 1 and _titles()[existing] == "新书名"
+
+
+def test_ndjson_errors(client):
+    body = '{"isbn": "9780000000201", "title": "书"}\n{bad json\n[1]\n'
+    result = _import(client, body, fmt="ndjson")
+    assert result["imported"] == 1
+    assert [(error["row"], error["error"]) for error in result["errors"]] == [
+        (2, "JSON格式错误"), (3, "每行必须是一个JSON对象")]
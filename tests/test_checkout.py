@@ -0,0 +1,20 @@
+from server import checkout, database, db_models
+from server.schemas.sale_order_schemas import SaleItemCreate
+
+
+def test_sale_items_inserted_in_one_statement(database_engine, operator, add_books, book_stock, statements):
+    isbns = add_books(5, stock=10)
+    items = [SaleItemCreate(book_isbn=isbn, quantity=i + 1) for i, isbn in enumerate(isbns)]
+    # 同一本书出现两行时分别记录，库存按合计数量扣减
+    items.append(SaleItemCreate(book_isbn=isbns[0], quantity=2))
+    statements.clear()
+    result = checkout.checkout_now(items, "现金", "T001", "SO202501010000000000000001")
+    assert result["total_amount"] == 10 * (1 + 2 + 3 + 4 + 5 + 2)
+    assert len([s for s in statements if s.startswith("INSERT INTO sale_items")]) == 1
+
+    with database.SessionLocal() as db:
+        order = db.get(db_models.SaleOrder, result["order_id"])
+        assert [(item.book_isbn, item.quantity, item.total_amount) for item in order.sold_items] == [
+            (item.book_isbn, item.quantity, 10 * item.quantity) for item in items]
+        assert db.query(db_models.Bill).filter_by(related_order=order.id).count() == 1
+    assert [book_stock(isbn) for isbn in isbns] == [7, 8, 7, 6, 5]
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from server import checkout, config, database, db_models
+from server.router import sale_order_router
+from server.schemas.sale_order_schemas import SaleItemCreate
+
+
+@pytest.fixture
+def queue(database_engine):
+    # 等待时间足够长，同时提交的订单一定落在同一批
+    queue = checkout.CheckoutQueue(batch_size=64, batch_wait=0.2)
+    yield queue
+    queue.stop()
+
+
+@pytest.fixture
+def commits(database_engine):
+    """记录数据库提交次数"""
+    count = []
+    listener = lambda conn: count.append(1)
+    event.listen(database_engine, "commit", listener)
+    yield count
+    event.remove(database_engine, "commit", listener)
+
+
+def _order(*lines):
+    return [SaleItemCreate(book_isbn=isbn, quantity=quantity) for isbn, quantity in lines]
+
+
+def _submit_all(queue, orders, transaction_nos=None):
+    """同时提交多个订单，返回各订单的结果或异常"""
+    transaction_nos = transaction_nos or [f"SO20250101000000{i:010d}" for i in range(len(orders))]
+
+    async def run():
+        return await asyncio.gather(
+            *(queue.submit(items, "现金", "T001", no) for items, no in zip(orders, transaction_nos)),
+            return_exceptions=True)
+    return asyncio.run(run())
+
+
+def _sale_count() -> int:
+    with database.SessionLocal() as db:
+        return db.query(db_models.SaleOrder).count()
+
+
+def test_mixed_batch_commits_once(queue, commits, operator, add_books, book_stock):
+    a, b, c = add_books(3, stock=5)
+    commits.clear()
+    results = _submit_all(queue, [
+        _order((a, 2)),
+        # b扣减后c库存不足：整单拒绝，b已扣减的库存加回
+        _order((b, 3), (c, 6)),
+        _order((b, 1), (c, 1)),
+    ])
+    assert results[0]["total_amount"] == 20
+    assert isinstance(results[1], HTTPException) and results[1].status_code == 400
+    assert results[2]["total_amount"] == 20
+    assert queue.stats()["batches"] == 1 and queue.stats()["orders"] == 3
+    assert len(commits) == 1
+    assert [book_stock(isbn) for isbn in (a, b, c)] == [3, 4, 4]
+    assert _sale_count() == 2
+
+
+def test_flush_failure_retries_orders_individually(queue, operator, add_books, book_stock):
+    a, = add_books(1, stock=10)
+    # 第二个订单与第一个流水号重复，写入时违反唯一约束，整批回滚后逐个重新结账
+    results = _submit_all(queue, [_order((a, 1)), _order((a, 2)), _order((a, 3))],
+                          ["SO202501010000000000000001", "SO202501010000000000000001",
+                           "SO202501010000000000000002"])
+    assert results[0]["transaction_no"] == "SO202501010000000000000001"
+    assert isinstance(results[1], HTTPException) and results[1].status_code == 500
+    assert results[2]["transaction_no"] == "SO202501010000000000000002"
+    # 失败订单扣减的库存随回滚恢复
+    assert book_stock(a) == 6
+    assert _sale_count() == 2
+
+
+def test_commit_failure_retries_whole_batch(queue, operator, add_books, book_stock, monkeypatch):
+    a, = add_books(1, stock=10)
+    original_commit = Session.commit
+    calls = []
+
+    def flaky_commit(self):
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError("COMMIT", {}, Exception("disk I/O error"))
+        return original_commit(self)
+
+    monkeypatch.setattr(Session, "commit", flaky_commit)
+    results = _submit_all(queue, [_order((a, 1)), _order((a, 2))])
+    assert all(isinstance(result, dict) for result in results)
+    # 整批提交失败一次，之后两个订单各自提交
+    assert len(calls) == 3
+    assert book_stock(a) == 7
+    assert _sale_count() == 2
+
+
+def test_stop_drains_queue(queue, operator, add_books, book_stock):
+    a, = add_books(1, stock=10)
+    requests = [checkout._Request((_order((a, 1)), None, "T001", f"SO20250101000000{i:010d}"))
+                for i in range(5)]
+    for request in requests:
+        queue._queue.put(request)
+    queue.start()
+    queue.stop()
+    assert all(request.future.done() for request in requests)
+    assert [request.future.result()["order_id"] for request in requests] == [1, 2, 3, 4, 5]
+    assert book_stock(a) == 5
+    assert queue.stats()["pending"] == 0
+
+
+def test_sale_endpoint_through_queue(client_factory, add_books, book_stock, monkeypatch):
+    a, = add_books(1, stock=5)
+    queue = checkout.CheckoutQueue(batch_size=64, batch_wait=0.05)
+    monkeypatch.setattr(config, "CHECKOUT_QUEUE_ENABLED", True)
+    monkeypatch.setattr(checkout, "checkout_queue", queue)
+    client = client_factory(sale_order_router.router)
+
+    statuses = []
+
+    def buy():
+        statuses.append(client.post("/sale/", json=[{"book_isbn": a, "quantity": 1}]).status_code)
+
+    threads = [threading.Thread(target=buy) for _ in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        queue.stop()
+    # 库存5本，8个并发订单中恰好5个成功，不超卖
+    assert sorted(statuses) == [200] * 5 + [400] * 3
+    assert book_stock(a) == 0
+    assert _sale_count() == 5
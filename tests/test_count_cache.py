@@ -0,0 +1,55 @@
+import pytest
+
+from server import config, database, db_models, pagination
+from server.router import sale_order_router
+
+
+@pytest.fixture
+def client(client_factory):
+    return client_factory(sale_order_router.router)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pagination.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _add_orders(count: int, start: int = 0) -> None:
+    with database.SessionLocal() as db:
+        db.add_all(db_models.SaleOrder(transaction_no=f"SO20250101000000{n:010d}", total_amount=10,
+                                       operator_id="T001") for n in range(start, start + count))
+        db.commit()
+
+
+def _total(client, total_mode: str = "exact", **params):
+    body = client.get("/sale/", params={"total_mode": total_mode, **params}).json()
+    return body["total"], body["total_estimated"]
+
+
+@pytest.mark.parametrize("params", [{}, {"cursor": ""}])
+def test_exact_total_after_local_write(client, clock, params):
+    _add_orders(3)
+    assert _total(client, **params) == (3, False)
+    _add_orders(2, start=3)
+    # 本进程的提交使缓存的总数失效
+    assert _total(client, **params) == (5, False)
+    # estimated允许使用旧的总数
+    _add_orders(1, start=5)
+    assert _total(client, "estimated", **params) == (5, True)
+    assert _total(client, **params) == (6, False)
+
+
+def test_exact_total_bounded_by_ttl(client, database_engine, clock, monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_CACHE_TTL", 5)
+    _add_orders(3)
+    assert _total(client) == (3, False)
+    # 其他worker进程的写入：本进程的表版本号不变
+    with database_engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO sale_orders (transaction_no, total_amount, operator_id, created_at) "
+                             "VALUES ('SO202501010000009999999999', 10, 'T001', '2025-01-01 00:00:00')")
+    clock[0] += 4
+    assert _total(client) == (3, False)
+    clock[0] += 2
+    assert _total(client) == (4, False)
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+from server import auth, db_models
+from server.router import (bill_router, book_router, diagnostics_router, purchase_order_router,
+                           sale_order_router, user_router)
+
+ROUTERS = (user_router, book_router, purchase_order_router, sale_order_router, bill_router, diagnostics_router)
+
+
+def _dependencies(dependant):
+    for sub in dependant.dependencies:
+        yield sub.call
+        yield from _dependencies(sub)
+
+
+def _login(token: str, is_admin: bool) -> None:
+    """直接放入令牌缓存，相当于该令牌已验证过"""
+    auth.token_cache.set(token, db_models.LoginedUser(
+        username="tester", employee_id="T001", isSuperAdmin=is_admin, token=token,
+        expiration_time=datetime.utcnow() + timedelta(hours=1)))
+
+
+@pytest.fixture
+def client(database_engine, monkeypatch):
+    def blocking(token):
+        raise AssertionError("令牌缓存命中时不应调用同步的get_current_user")
+
+    monkeypatch.setattr(auth.Auth, "get_current_user", staticmethod(blocking))
+    app = FastAPI()
+    for module in ROUTERS:
+        app.include_router(module.router)
+    yield TestClient(app)
+    auth.token_cache.clear()
+
+
+def test_routes_use_async_dependency():
+    calls = [call for module in ROUTERS for route in module.router.routes if isinstance(route, APIRoute)
+             for call in _dependencies(route.dependant)]
+    assert auth.Auth.get_current_user_async in calls
+    # 同步依赖会让FastAPI把每个请求的鉴权都放进线程池
+    assert auth.Auth.get_current_user not in calls
+
+
+def test_cached_token_skips_threadpool(client, add_books):
+    isbn, = add_books(1, stock=1)
+    _login("token-1", is_admin=False)
+    headers = {"Authorization": "Bearer token-1"}
+    assert client.get(f"/books/{isbn}", headers=headers).status_code == 200
+    assert client.get("/sale/", headers=headers).status_code == 200
+    assert client.get("/bills/", headers=headers).status_code == 200
+    # 非管理员
+    assert client.get("/users/token_cache/stats", headers=headers).status_code == 403
+    _login("token-2", is_admin=True)
+    assert client.get("/users/token_cache/stats", headers={"Authorization": "Bearer token-2"}).status_code == 200
@@ -0,0 +1,71 @@
+import pytest
+
+from server import config, database, db_models, etag
+from server.router import book_router, sale_order_router
+
+
+@pytest.fixture
+def client(client_factory):
+    return client_factory(book_router.router, sale_order_router.router)
+
+
+def _revalidate(client, url: str, tag: str):
+    return client.get(url, headers={"If-None-Match": tag})
+
+
+def _add_order(isbn: str, transaction_no: str) -> int:
+    """添加没有账单的订单（可以删除），返回订单ID"""
+    with database.SessionLocal() as db:
+        order = db_models.SaleOrder(transaction_no=transaction_no, total_amount=10, operator_id="T001", sold_items=[
+            db_models.SaleItem(book_isbn=isbn, quantity=1, sold_price=10, total_amount=10)])
+        db.add(order)
+        db.commit()
+        return order.id
+
+
+def test_not_modified_until_book_changes(client, add_books):
+    isbn, = add_books(1, stock=1)
+    url = f"/books/{isbn}"
+    first = client.get(url)
+    assert first.status_code == 200
+    tag = first.headers["ETag"]
+    not_modified = _revalidate(client, url, tag)
+    assert not_modified.status_code == 304 and not_modified.headers["ETag"] == tag
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, isbn).stock = 7
+        db.commit()
+    changed = _revalidate(client, url, tag)
+    assert changed.status_code == 200 and changed.json()["stock"] == 7
+    assert changed.headers["ETag"] != tag
+
+
+def test_etag_expires_after_ttl(client, add_books, monkeypatch):
+    isbn, = add_books(1, stock=1)
+    monkeypatch.setattr(config, "ETAG_TTL", 5)
+    now = [1_000_000.0]
+    monkeypatch.setattr(etag.time, "time", lambda: now[0])
+    url = f"/books/{isbn}"
+    tag = client.get(url).headers["ETag"]
+    now[0] += 4
+    assert _revalidate(client, url, tag).status_code == 304
+    # 其他进程的提交本进程看不到，超过ETAG_TTL后重新返回内容
+    now[0] += 5
+    assert _revalidate(client, url, tag).status_code == 200
+
+
+def test_order_detail_etag_after_id_reuse(client, add_books):
+    a, b = add_books(2, stock=1)
+    order_id = _add_order(a, "SO202501010000000000000001")
+    assert client.get(f"/sale/{order_id}").status_code == 200
+    assert client.delete(f"/sale/{order_id}").status_code == 200
+    # SQLite重新使用了被删除订单的ID
+    assert _add_order(b, "SO202501010000000000000002") == order_id
+    response = client.get(f"/sale/{order_id}")
+    assert [item["book_isbn"] for item in response.json()["items"]] == [b]
+    tag = response.headers["ETag"]
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, b).title = "新书名"
+        db.commit()
+    response = _revalidate(client, f"/sale/{order_id}", tag)
+    assert response.status_code == 200
+    assert response.json()["items"][0]["book_title"] == "新书名"
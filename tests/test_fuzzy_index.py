@@ -0,0 +1,52 @@
+from server import checkout, database, db_models, fuzzy_index
+from server.router import book_router
+from server.schemas.sale_order_schemas import SaleItemCreate
+
+
+def _search(keywords: str) -> list:
+    with database.SessionLocal() as db:
+        return fuzzy_index.search(db.connection(), keywords)
+
+
+def _ngram_writes(statements: list) -> list:
+    return [s for s in statements if fuzzy_index.NGRAM_TABLE in s and not s.lstrip().startswith("SELECT")]
+
+
+def test_insert_update_delete_sync_index(database_engine, add_books):
+    a, b = add_books(2, stock=1)
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, a).title = "Python Programming"
+        db.commit()
+    # 相邻字母颠倒
+    assert _search("pyhton programming")[0] == a
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, a).author = "Guido van Rossum"
+        db.commit()
+    assert _search("rosum") == [a]
+    with database.SessionLocal() as db:
+        db.delete(db.get(db_models.Book, a))
+        db.commit()
+    assert _search("pyhton programming") == []
+
+
+def test_stock_and_price_changes_skip_index(database_engine, operator, add_books, statements):
+    a, b = add_books(2, stock=10)
+    statements.clear()
+    checkout.checkout_now([SaleItemCreate(book_isbn=a, quantity=1), SaleItemCreate(book_isbn=b, quantity=2)],
+                          "现金", "T001", "SO202501010000000000000001")
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, a).stock += 5
+        db.commit()
+        book_router._apply_price_change(db, None, -10, book_router._RowErrors())
+        db.commit()
+    assert statements and _ngram_writes(statements) == []
+    # 出版社不在n-gram索引中
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, b).publisher = "人民邮电出版社"
+        db.commit()
+    assert _ngram_writes(statements) == []
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, b).title = "算法导论"
+        db.commit()
+    assert _ngram_writes(statements)
+    assert _search("算法导轮") == [b]
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from server import checkout, config, database, db_models, idempotency
+from server.router import sale_order_router
+
+
+@pytest.fixture
+def client(client_factory):
+    # 注入的故障以500返回，而不是在测试中抛出
+    return client_factory(sale_order_router.router, raise_server_exceptions=False)
+
+
+def _sale_count() -> int:
+    with database.SessionLocal() as db:
+        return db.query(db_models.SaleOrder).count()
+
+
+def _fail_once(monkeypatch, module, name):
+    """让module.name第一次调用时抛出数据库错误"""
+    original = getattr(module, name)
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(module, name, wrapper)
+    return calls
+
+
+def test_replay_same_key(client, add_books, book_stock):
+    isbn, = add_books(1, stock=10)
+    body = [{"book_isbn": isbn, "quantity": 2}]
+    headers = {"Idempotency-Key": "sale-1"}
+    first = client.post("/sale/", json=body, headers=headers)
+    second = client.post("/sale/", json=body, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert book_stock(isbn) == 8
+    assert _sale_count() == 1
+    # 同一个键用于不同的请求
+    assert client.post("/sale/", json=[{"book_isbn": isbn, "quantity": 1}], headers=headers).status_code == 422
+
+
+@pytest.mark.parametrize("module, name", [
+    (checkout, "checkout_now"),
+    (sale_order_router, "generate_transaction_no"),
+])
+def test_retry_after_non_http_failure(client, add_books, book_stock, monkeypatch, module, name):
+    isbn, = add_books(1, stock=10)
+    calls = _fail_once(monkeypatch, module, name)
+    body = [{"book_isbn": isbn, "quantity": 1}]
+    headers = {"Idempotency-Key": "sale-2"}
+
+    assert client.post("/sale/", json=body, headers=headers).status_code == 500
+    assert _sale_count() == 0
+    # 第一次失败后键已释放，重试会重新执行，而不是一直返回409
+    retry = client.post("/sale/", json=body, headers=headers)
+    assert retry.status_code == 200
+    assert "Idempotent-Replayed" not in retry.headers
+    assert len(calls) == 2
+    assert book_stock(isbn) == 9
+    assert _sale_count() == 1
+
+
+def test_http_failure_releases_key(client, add_books, book_stock):
+    isbn, = add_books(1, stock=1)
+    headers = {"Idempotency-Key": "sale-3"}
+    assert client.post("/sale/", json=[{"book_isbn": isbn, "quantity": 2}], headers=headers).status_code == 400
+    # 库存补足后用同一个键重试
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, isbn).stock = 5
+        db.commit()
+    assert client.post("/sale/", json=[{"book_isbn": isbn, "quantity": 2}], headers=headers).status_code == 200
+    assert book_stock(isbn) == 3
+
+
+def _expires_in(key: str) -> float:
+    with database.SessionLocal() as db:
+        row = db.query(db_models.IdempotencyKey).filter_by(key=key).one()
+        return (row.expires_at - row.created_at).total_seconds()
+
+
+def test_completed_key_kept_for_full_ttl(client, add_books):
+    isbn, = add_books(1, stock=10)
+    headers = {"Idempotency-Key": "sale-4"}
+    assert client.post("/sale/", json=[{"book_isbn": isbn, "quantity": 1}], headers=headers).status_code == 200
+    assert _expires_in("sale-4") >= config.IDEMPOTENCY_KEY_TTL
+
+
+def test_pending_key_lease_expires(client, add_books, book_stock, monkeypatch):
+    isbn, = add_books(1, stock=10)
+    body = [{"book_isbn": isbn, "quantity": 1}]
+    headers = {"Idempotency-Key": "sale-5"}
+    # 订单已提交，但保存结果失败：记录停留在“处理中”
+    _fail_once(monkeypatch, idempotency, "_complete")
+    assert client.post("/sale/", json=body, headers=headers).status_code == 200
+    assert _expires_in("sale-5") == config.IDEMPOTENCY_PENDING_TTL
+    assert client.post("/sale/", json=body, headers=headers).status_code == 409
+
+    # 租期过后可以用同一个键重新执行，而不是等到IDEMPOTENCY_KEY_TTL
+    later = datetime.now() + timedelta(seconds=config.IDEMPOTENCY_PENDING_TTL + 1)
+    monkeypatch.setattr(idempotency, "datetime", type("datetime", (datetime,), {"now": staticmethod(lambda: later)}))
+    retry = client.post("/sale/", json=body, headers=headers)
+    assert retry.status_code == 200 and "Idempotent-Replayed" not in retry.headers
+    assert book_stock(isbn) == 8
+    assert client.post("/sale/", json=body, headers=headers).headers["Idempotent-Replayed"] == "true"
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from server import database, db_models, pagination
+from server.router import sale_order_router
+
+
+@pytest.fixture
+def client(client_factory):
+    return client_factory(sale_order_router.router)
+
+
+def _add_orders(count: int, start: int = 0) -> None:
+    """每3个订单的创建时间相同，金额在5个值之间重复，用来检查排序列相同时按主键衔接"""
+    base = datetime(2025, 1, 1)
+    with database.SessionLocal() as db:
+        db.add_all(db_models.SaleOrder(
+            transaction_no=f"SO20250101000000{n:010d}",
+            total_amount=10 + n % 5,
+            operator_id="T001",
+            created_at=base + timedelta(minutes=n // 3),
+        ) for n in range(start, start + count))
+        db.commit()
+
+
+def _walk(client, **params) -> list:
+    """从第一页开始按next_cursor翻到最后一页，返回全部订单ID"""
+    ids, cursor = [], ""
+    while cursor is not None:
+        response = client.get("/sale/", params={**params, "cursor": cursor, "total_mode": "none"})
+        assert response.status_code == 200
+        body = response.json()
+        assert len(body["data"]) <= params["page_size"]
+        ids.extend(item["id"] for item in body["data"])
+        cursor = body["next_cursor"]
+    return ids
+
+
+@pytest.mark.parametrize("sort_by", ["created_at", "transaction_no", "total_amount"])
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+def test_cursor_pages_match_offset_order(client, sort_by, sort_order):
+    _add_orders(23)
+    params = {"sort_by": sort_by, "sort_order": sort_order}
+    expected = [item["id"] for item in
+                client.get("/sale/", params={**params, "page_size": 100}).json()["data"]]
+    ids = _walk(client, page_size=4, **params)
+    assert len(ids) == len(set(ids)) == 23
+    # 按页码分页时排序列相同的行顺序不确定，只比较排序列的值
+    orders = {item["id"]: item[sort_by] for item in
+              client.get("/sale/", params={"page_size": 100}).json()["data"]}
+    assert [orders[i] for i in ids] == [orders[i] for i in expected]
+
+
+def test_cursor_is_stable_across_inserts(client):
+    _add_orders(10)
+    first = client.get("/sale/", params={"cursor": "", "page_size": 5, "sort_order": "asc"}).json()
+    # 翻页之间有新订单写入，不影响后面的页
+    _add_orders(3, start=100)
+    second = client.get("/sale/", params={"cursor": first["next_cursor"], "page_size": 5,
+                                          "sort_order": "asc"}).json()
+    ids = [item["id"] for item in first["data"] + second["data"]]
+    assert ids == list(range(1, 11))
+
+
+def test_invalid_cursor(client):
+    _add_orders(5)
+    cursor = client.get("/sale/", params={"cursor": "", "page_size": 2}).json()["next_cursor"]
+    # 游标只能用于生成它的排序方式
+    mismatched = client.get("/sale/", params={"cursor": cursor, "page_size": 2, "sort_by": "total_amount"})
+    assert mismatched.status_code == 400
+    assert client.get("/sale/", params={"cursor": "not-a-cursor", "page_size": 2}).status_code == 400
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_keyset_page_with_nulls(database_engine, add_books, descending):
+    # retail_price可以为NULL，SQLite中NULL排在升序的最前、降序的最后
+    isbns = add_books(11, stock=1)
+    with database.SessionLocal() as db:
+        for i, isbn in enumerate(isbns):
+            db.get(db_models.Book, isbn).retail_price = None if i % 4 == 0 else 10 + i % 3
+        db.commit()
+
+        Book = db_models.Book
+        query = db.query(Book)
+        order = (Book.retail_price.desc(), Book.isbn.desc()) if descending else (Book.retail_price, Book.isbn)
+        expected = [book.isbn for book in query.order_by(*order)]
+
+        seen, cursor = [], ""
+        while cursor is not None:
+            rows, cursor = pagination.keyset_page(query, Book.retail_price, Book.isbn, descending,
+                                                  cursor, 3, "retail_price")
+            seen.extend(book.isbn for book in rows)
+    assert seen == expected
@@ -0,0 +1,62 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from server import database, db_models
+from server.router import sale_order_router
+
+ORDERS = 100
+OPERATORS = 10
+ITEMS_PER_ORDER = 20
+
+
+@pytest.fixture
+def client(database_engine, client_factory):
+    """OPERATORS个操作员、ORDERS个订单，每个订单ITEMS_PER_ORDER本不同的书"""
+    with database.SessionLocal() as db:
+        db.add_all(db_models.User(username=f"user{i}", employee_id=f"E{i:03d}", true_name=f"员工{i}",
+                                  gender="male", isSuperAdmin=False, password_hash="-")
+                   for i in range(OPERATORS))
+        db.add_all(db_models.Book(isbn=f"978{i:010d}", title=f"书{i}", retail_price=Decimal("10"), stock=100)
+                   for i in range(ITEMS_PER_ORDER))
+        for n in range(ORDERS):
+            db.add(db_models.SaleOrder(
+                transaction_no=f"SO20250101000000{n:010d}",
+                total_amount=Decimal(10 * ITEMS_PER_ORDER),
+                operator_id=f"E{n % OPERATORS:03d}",
+                created_at=datetime(2025, 1, 1),
+                sold_items=[db_models.SaleItem(book_isbn=f"978{i:010d}", quantity=1,
+                                               sold_price=Decimal("10"), total_amount=Decimal("10"))
+                            for i in range(ITEMS_PER_ORDER)],
+            ))
+        db.commit()
+    return client_factory(sale_order_router.router, sync_reads=True)
+
+
+def test_sale_order_list_query_count(client, statements):
+    response = client.get("/sale/", params={"page_size": ORDERS, "total_mode": "none"})
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert len(data) == ORDERS
+    assert all(item["operator_name"] == f"员工{int(item['operator_id'][1:])}" for item in data)
+    # 订单一条、操作员一条，与本页订单数无关
+    assert len(statements) == 2
+
+
+def test_sale_order_list_cursor_query_count(client, statements):
+    response = client.get("/sale/", params={"page_size": ORDERS, "cursor": "", "total_mode": "none"})
+    assert response.status_code == 200
+    assert len(response.json()["data"]) == ORDERS
+    assert len(statements) == 2
+
+
+def test_sale_order_detail_query_count(client, statements):
+    response = client.get("/sale/1")
+    assert response.status_code == 200
+    detail = response.json()
+    assert detail["operator_name"] == "员工0"
+    assert len(detail["items"]) == ITEMS_PER_ORDER
+    assert [item["book_title"] for item in detail["items"]] == [f"书{i}" for i in range(ITEMS_PER_ORDER)]
+    # 订单、操作员、订单项和书籍在一条语句中取出
+    assert len(statements) == 1
@@ -0,0 +1,52 @@
+import pytest
+
+from server import cache, database, db_models
+from server.router import book_router
+
+
+@pytest.fixture
+def client(client_factory):
+    return client_factory(book_router.router, sync_reads=True)
+
+
+def _titles(client, **params) -> list:
+    response = client.get("/books/", params={"page_size": 100, **params})
+    assert response.status_code == 200
+    return [book["title"] for book in response.json()["data"]]
+
+
+def test_repeated_search_served_from_cache(client, add_books, statements):
+    add_books(3, stock=1)
+    assert _titles(client, title="书") == ["书0", "书1", "书2"]
+    statements.clear()
+    assert _titles(client, title="书") == ["书0", "书1", "书2"]
+    assert statements == []
+    # 查询条件不同的结果分别缓存
+    assert _titles(client, title="书1") == ["书1"]
+    assert statements
+
+
+def test_local_write_invalidates_cached_pages(client, add_books):
+    a, b, c = add_books(3, stock=1)
+    assert _titles(client, q="书") == ["书0", "书1", "书2"]
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, b).title = "编译原理"
+        db.delete(db.get(db_models.Book, c))
+        db.commit()
+    assert _titles(client, q="书") == ["书0"]
+    assert _titles(client, q="编译") == ["编译原理"]
+
+
+def test_other_process_write_visible_after_ttl(client, database_engine, add_books, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    a, = add_books(1, stock=1)
+    assert book_router.search_cache.ttl == 5
+    assert _titles(client) == ["书0"]
+    # 其他worker进程的写入，本进程的表版本号不变
+    with database_engine.begin() as conn:
+        conn.exec_driver_sql(f"UPDATE books SET title = '新书名' WHERE isbn = '{a}'")
+    now[0] += 4
+    assert _titles(client) == ["书0"]
+    now[0] += 2
+    assert _titles(client) == ["新书名"]
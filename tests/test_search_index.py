@@ -0,0 +1,65 @@
+from server import checkout, database, db_models, search_index
+from server.router import book_router
+from server.schemas.sale_order_schemas import SaleItemCreate
+
+
+def _search(keywords: str) -> list:
+    with database.SessionLocal() as db:
+        query = search_index.apply_search(db.query(db_models.Book.isbn),
+                                          search_index.build_match_query(keywords), order_by_rank=False)
+        return sorted(isbn for isbn, in query)
+
+
+def _fts_writes(statements: list) -> list:
+    return [s for s in statements if search_index.FTS_TABLE in s and not s.lstrip().startswith("SELECT")]
+
+
+def test_insert_update_delete_sync_index(database_engine, add_books):
+    a, b = add_books(2, stock=1)
+    assert _search("书1") == [b]
+    with database.SessionLocal() as db:
+        book = db.get(db_models.Book, a)
+        book.title = "数据库系统概念"
+        book.author = "Silberschatz"
+        db.commit()
+    assert _search("数据库") == [a]
+    assert _search("silber") == [a]
+    assert _search("书0") == []
+    with database.SessionLocal() as db:
+        db.delete(db.get(db_models.Book, a))
+        db.commit()
+    assert _search("数据库") == []
+
+
+def test_stock_and_price_changes_skip_index(database_engine, operator, add_books, statements):
+    a, b = add_books(2, stock=10)
+    statements.clear()
+    checkout.checkout_now([SaleItemCreate(book_isbn=a, quantity=1), SaleItemCreate(book_isbn=b, quantity=2)],
+                          "现金", "T001", "SO202501010000000000000001")
+    with database.SessionLocal() as db:
+        db.get(db_models.Book, a).stock += 5
+        db.commit()
+        book_router._apply_price_change(db, None, 10, book_router._RowErrors())
+        db.commit()
+    assert statements and _fts_writes(statements) == []
+    # 同一事务中先改库存再改书名，仍要更新索引
+    with database.SessionLocal() as db:
+        book = db.get(db_models.Book, b)
+        book.stock -= 1
+        db.flush()
+        book.title = "编译原理"
+        db.commit()
+    assert _fts_writes(statements)
+    assert _search("编译") == [b]
+
+
+def test_batch_patch_reindexes_only_text_changes(client_factory, add_books, statements):
+    client = client_factory(book_router.router)
+    a, b = add_books(2, stock=1)
+    statements.clear()
+    response = client.post("/books/batch_update", json={"items": [{"isbn": a, "stock": 3}]})
+    assert response.json()["updated"] == 1
+    assert _fts_writes(statements) == []
+    response = client.post("/books/batch_update", json={"items": [{"isbn": b, "publisher": "机械工业出版社"}]})
+    assert response.json()["updated"] == 1
+    assert _search("机械工业") == [b]
@@ -0,0 +1,60 @@
+import threading
+from datetime import datetime
+
+from server import database, db_models, sequence
+from server.router.sale_order_router import generate_transaction_no, parse_date_from_transaction_no
+
+
+def _next_value(name: str) -> int:
+    with database.SessionLocal() as db:
+        return db.get(db_models.Sequence, name).next_value
+
+
+def test_blocks_are_allocated_in_order(database_engine):
+    seq = sequence.BlockSequence("test", block_size=3)
+    assert [seq.next() for _ in range(7)] == list(range(1, 8))
+    # 已领取3段：1-3、4-6、7-9
+    assert _next_value("test") == 10
+
+
+def test_instances_get_disjoint_blocks(database_engine):
+    # 两个实例相当于两个进程，各自持有不同的号段
+    first = sequence.BlockSequence("test", block_size=5)
+    second = sequence.BlockSequence("test", block_size=5)
+    values = [first.next(), second.next(), first.next(), second.next()]
+    assert values == [1, 6, 2, 7]
+    a = [first.next() for _ in range(10)]
+    b = [second.next() for _ in range(10)]
+    assert not set(a) & set(b)
+    # 同一实例内严格递增
+    assert a == sorted(a) and b == sorted(b)
+
+
+def test_concurrent_threads_and_instances(database_engine):
+    sequences = [sequence.BlockSequence("test", block_size=7) for _ in range(3)]
+    results = []
+    lock = threading.Lock()
+
+    def run(seq):
+        values = [seq.next() for _ in range(200)]
+        with lock:
+            results.extend(values)
+
+    threads = [threading.Thread(target=run, args=(seq,)) for seq in sequences for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == len(set(results)) == 2400
+
+
+def test_transaction_no_format(database_engine, monkeypatch):
+    monkeypatch.setattr(sequence, "transaction_no_sequence", sequence.BlockSequence("transaction_no", 10))
+    numbers = [generate_transaction_no() for _ in range(25)]
+    assert len(set(numbers)) == 25
+    for number in numbers:
+        assert number.startswith("SO") and len(number) == 26
+        assert parse_date_from_transaction_no(number) == datetime.strptime(number[2:10], "%Y%m%d")
+    assert [int(number[16:]) for number in numbers] == list(range(1, 26))
+    # 旧格式（6位随机数）仍能解析
+    assert parse_date_from_transaction_no("SO20250102030405123456") == datetime(2025, 1, 2)
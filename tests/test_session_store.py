@@ -0,0 +1,138 @@
+import os
+import socketserver
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# 避免导入server.auth时在当前目录创建默认的sessions.db
+os.environ.setdefault("BOOKSTORE_SESSION_BACKEND", "memory")
+
+from server.auth import MemorySessionStore, SQLiteSessionStore, RedisSessionStore, RedisError, SessionStore
+from server.db_models import LoginedUser
+
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+    """本地Redis替身，只实现会话存储用到的GET/SET/DEL（不处理过期）"""
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            command = args[0].upper()
+            if command == b"GET":
+                value = data.get(args[1])
+                reply = b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+            elif command == b"SET":
+                data[args[1]] = args[2]
+                reply = b"+OK\r\n"
+            elif command == b"DEL":
+                removed = sum(data.pop(key, None) is not None for key in args[1:])
+                reply = b":%d\r\n" % removed
+            else:
+                reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+@pytest.fixture
+def fake_redis():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _FakeRedisHandler)
+    server.daemon_threads = True
+    server.data = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore()
+    if request.param == "sqlite":
+        return SQLiteSessionStore(f"sqlite:///{tmp_path / 'sessions.db'}")
+    server = request.getfixturevalue("fake_redis")
+    host, port = server.server_address
+    return RedisSessionStore(f"redis://{host}:{port}/0")
+
+
+def _session(username, token, hours=8):
+    expire = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=hours)
+    return LoginedUser(username=username, employee_id=f"E-{username}",
+                       isSuperAdmin=False, token=token, expiration_time=expire)
+
+
+def test_save_and_get(store):
+    store.save(_session("alice", "token-a"))
+    session = store.get("token-a")
+    assert session.username == "alice"
+    assert session.employee_id == "E-alice"
+    assert store.get("missing") is None
+
+
+def test_relogin_replaces_old_session(store):
+    store.save(_session("alice", "token-a"))
+    store.save(_session("alice", "token-b"))
+    assert store.get("token-a") is None
+    assert store.get("token-b").username == "alice"
+
+
+def test_delete_token_and_user(store):
+    store.save(_session("alice", "token-a"))
+    store.save(_session("bob", "token-b"))
+    store.delete_token("token-a")
+    store.delete_user("bob")
+    assert store.get("token-a") is None
+    assert store.get("token-b") is None
+
+
+def test_update_user_renames_session(store):
+    store.save(_session("alice", "token-a"))
+    store.update_user("alice", username="alice2", isSuperAdmin=True)
+    session = store.get("token-a")
+    assert session.username == "alice2"
+    assert session.isSuperAdmin is True
+    store.delete_user("alice2")
+    assert store.get("token-a") is None
+
+
+def test_expired_session_is_rejected(store):
+    if isinstance(store, RedisSessionStore):
+        pytest.skip("Redis会话依赖服务端PX过期")
+    store.save(_session("alice", "token-a", hours=-1))
+    assert store.get("token-a") is None
+    assert store.purge_expired(batch_size=10) == 1
+
+
+def test_incomplete_store_fails_on_instantiation():
+    class IncompleteStore(SessionStore):
+        def save(self, session):
+            pass
+
+    with pytest.raises(TypeError):
+        IncompleteStore()
+
+
+def test_redis_handshake_failure_closes_connection(fake_redis):
+    # 替身服务器不支持AUTH，握手失败
+    host, port = fake_redis.server_address
+    store = RedisSessionStore(f"redis://:secret@{host}:{port}/0")
+    for _ in range(2):
+        with pytest.raises(RedisError):
+            store.get("token-a")
+        # 不保留握手未完成的连接，下次调用重新连接并再次认证
+        assert store.conn._sock is None
+        assert store.conn._file is None